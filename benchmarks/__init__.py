@@ -0,0 +1,6 @@
+"""
+Benchmarks for dynamodb-stream-router. These are not part of the installed
+package; run them from a source checkout, e.g.
+
+    python -m benchmarks.route_plan
+"""
@@ -0,0 +1,102 @@
+"""
+Runs the benchmark suite and writes the results as JSON, or compares two
+saved result files.
+
+    python -m benchmarks run --output head.json
+    python -m benchmarks compare base.json head.json
+"""
+from __future__ import annotations
+
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+
+from .suite import BENCHMARKS
+
+
+def package_version() -> str:
+    try:
+        return version("dynamodb-stream-router")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def run(args) -> None:
+    names = args.benchmark or list(BENCHMARKS)
+    results = []
+    for name in names:
+        for result in BENCHMARKS[name](args.records, args.repeat):
+            print(
+                f"{result['name']:>14} {json.dumps(result['params']):<40} "
+                f"{result['per_op_us']:12.3f} us/op",
+                file=sys.stderr,
+            )
+            results.append(result)
+    report = dict(
+        metadata=dict(
+            version=package_version(),
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            records=args.records,
+            repeat=args.repeat,
+        ),
+        results=results,
+    )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def compare(args) -> None:
+    with open(args.base) as base, open(args.head) as head:
+        base, head = json.load(base), json.load(head)
+    baseline = {
+        (result["name"], json.dumps(result["params"], sort_keys=True)): result
+        for result in base["results"]
+    }
+    print(f"{base['metadata']['version']} -> {head['metadata']['version']}")
+    for result in head["results"]:
+        params = json.dumps(result["params"], sort_keys=True)
+        before = baseline.get((result["name"], params))
+        if not before:
+            continue
+        ratio = result["per_op_us"] / before["per_op_us"]
+        flag = " REGRESSION" if ratio > 1 + args.threshold else ""
+        print(
+            f"{result['name']:>14} {params:<40} {before['per_op_us']:12.3f} -> "
+            f"{result['per_op_us']:12.3f} us/op ({ratio:5.2f}x){flag}"
+        )
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark suite")
+    run_parser.add_argument(
+        "--benchmark", action="append", choices=list(BENCHMARKS), help="may be repeated"
+    )
+    run_parser.add_argument("--records", type=int, default=1000)
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", help="write JSON here instead of stdout")
+    run_parser.set_defaults(function=run)
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="slowdown flagged as a regression"
+    )
+    compare_parser.set_defaults(function=compare)
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
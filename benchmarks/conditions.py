@@ -0,0 +1,48 @@
+"""
+Compares the evaluation cost of the closure and compiled backends on the
+corpus of expressions and records that tests/test_conditions.py checks
+them on.
+
+    python -m benchmarks.conditions
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from timeit import repeat
+
+from dynamodb_stream_router import RouteRecord
+from dynamodb_stream_router.conditions.closures import build_condition
+from dynamodb_stream_router.conditions.compiler import compile_condition
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from tests.corpus import EXPRESSIONS, RECORDS, outcome
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    expression_parser = ExpressionParser()
+    records = [RouteRecord(record) for record in RECORDS]
+    for name, backend in (
+        ("closures", build_condition),
+        ("compiled", compile_condition),
+    ):
+        conditions = [
+            backend(expression_parser.parse_tree(expression))
+            for expression in EXPRESSIONS
+        ]
+
+        def evaluate() -> None:
+            for condition in conditions:
+                for record in records:
+                    outcome(condition, record)
+
+        best = min(repeat(evaluate, number=args.number, repeat=args.repeat))
+        evaluations = args.number * len(conditions) * len(records)
+        print(f"{name:>8}: {best / evaluations * 1e6:8.2f} us/evaluation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares AttributeValueDeserializer with the boto3 based
+StreamTypeDeserializer on a few realistic item shapes, after checking that
+both produce equal values.
+
+    python -m benchmarks.deserializer
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from base64 import b64encode
+from timeit import repeat
+
+from dynamodb_stream_router.record import (
+    AttributeValueDeserializer,
+    StreamTypeDeserializer,
+)
+
+
+def flat_item(width: int) -> dict:
+    item = dict(pk=dict(S="ORDER#1"), sk=dict(S="METADATA"))
+    for index in range(width):
+        item[f"s{index}"] = dict(S=f"value {index}")
+        item[f"n{index}"] = dict(N=str(index * 1.5))
+        item[f"b{index}"] = dict(BOOL=index % 2 == 0)
+    return dict(M=item)
+
+
+def nested_item(depth: int, width: int) -> dict:
+    item = dict(S="leaf")
+    for level in range(depth):
+        item = dict(
+            M=dict(
+                name=dict(S=f"level {level}"),
+                count=dict(N=str(level)),
+                tags=dict(SS=["a", "b", "c"]),
+                children=dict(L=[item] * width),
+            )
+        )
+    return item
+
+
+def binary_item(count: int) -> dict:
+    blob = b64encode(bytes(range(256)) * 16).decode()
+    return dict(
+        M=dict(
+            pk=dict(S="BLOB#1"),
+            blobs=dict(L=[dict(B=blob) for _ in range(count)]),
+            hashes=dict(BS=[b64encode(bytes([i]) * 32).decode() for i in range(count)]),
+            nothing=dict(NULL=True),
+            numbers=dict(NS=[str(i) for i in range(count)]),
+        )
+    )
+
+
+SHAPES = dict(
+    flat_50=flat_item(16),
+    flat_300=flat_item(100),
+    nested=nested_item(4, 3),
+    binary=binary_item(20),
+)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    boto3_deserializer = StreamTypeDeserializer()
+    fast_deserializer = AttributeValueDeserializer()
+    for name, item in SHAPES.items():
+        if boto3_deserializer.deserialize(item) != fast_deserializer.deserialize(item):
+            raise AssertionError(f"Deserializers disagree on {name}")
+        timings = [
+            min(
+                repeat(
+                    lambda: deserializer.deserialize(item),
+                    number=args.number,
+                    repeat=args.repeat,
+                )
+            )
+            / args.number
+            * 1e6
+            for deserializer in (boto3_deserializer, fast_deserializer)
+        ]
+        print(
+            f"{name:>10}: boto3 {timings[0]:9.2f} us, "
+            f"fast {timings[1]:9.2f} us ({timings[0] / timings[1]:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Generates synthetic DynamoDB stream Records.
+
+Items are built from a seeded random generator, so the same arguments
+always produce the same records.
+"""
+from __future__ import annotations
+
+from base64 import b64encode
+from random import Random
+from typing import Any, Iterator, Sequence
+
+from dynamodb_stream_router.record import AttributeValueMap, Record
+
+ALL_TYPES = ("S", "N", "BOOL", "NULL", "B", "SS", "NS", "BS", "M", "L")
+DEFAULT_TYPES = ("S", "N", "BOOL", "M", "L")
+DEFAULT_MIX = dict(INSERT=0.3, MODIFY=0.6, REMOVE=0.1)
+ENTITY_TYPES = ("order", "invoice", "customer", "shipment", "refund")
+
+
+class StreamGenerator:
+    """
+    Builds stream records whose images have item_size top-level
+    attributes. Attribute types are drawn from types (any of ALL_TYPES); M
+    and L values have up to width members and nest up to depth levels. mix
+    maps event names to their relative frequency, and keys is the number of
+    distinct items the records are spread over.
+    """
+
+    def __init__(
+        self,
+        *,
+        item_size: int = 20,
+        depth: int = 2,
+        width: int = 5,
+        types: Sequence[str] = DEFAULT_TYPES,
+        mix: dict[str, float] = None,
+        keys: int = 100,
+        seed: int = 0,
+    ) -> None:
+        self.depth = depth
+        self.item_size = item_size
+        self.keys = keys
+        self.mix = mix or DEFAULT_MIX
+        self.random = Random(seed)
+        self.types = tuple(types)
+        self.width = width
+
+    def __iter__(self) -> Iterator[Record]:
+        sequence_number = 0
+        while True:
+            sequence_number += 1
+            yield self.record(sequence_number)
+
+    def attribute(self, dynamodb_type: str, depth: int) -> dict[str, Any]:
+        random = self.random
+        if dynamodb_type in ("M", "L") and depth <= 0:
+            dynamodb_type = "S"
+        if dynamodb_type == "S":
+            return dict(S=f"value-{random.randrange(10_000)}")
+        if dynamodb_type == "N":
+            return dict(N=str(round(random.uniform(-1e6, 1e6), random.randrange(4))))
+        if dynamodb_type == "BOOL":
+            return dict(BOOL=random.random() < 0.5)
+        if dynamodb_type == "NULL":
+            return dict(NULL=True)
+        if dynamodb_type == "B":
+            return dict(B=b64encode(random.randbytes(32)).decode())
+        if dynamodb_type == "SS":
+            return dict(SS=[f"member-{i}" for i in range(random.randrange(1, 6))])
+        if dynamodb_type == "NS":
+            return dict(NS=[str(i) for i in range(random.randrange(1, 6))])
+        if dynamodb_type == "BS":
+            return dict(BS=[b64encode(bytes([i]) * 16).decode() for i in range(1, 4)])
+        if dynamodb_type == "M":
+            return dict(M=self.image(self.width, depth - 1))
+        if dynamodb_type == "L":
+            return dict(
+                L=[
+                    self.attribute(random.choice(self.types), depth - 1)
+                    for _ in range(random.randrange(1, self.width + 1))
+                ]
+            )
+        raise ValueError(f"Unknown type {dynamodb_type}")
+
+    def image(self, size: int, depth: int) -> AttributeValueMap:
+        return {
+            f"attr{index}": self.attribute(self.random.choice(self.types), depth)
+            for index in range(size)
+        }
+
+    def item(self, key: int) -> AttributeValueMap:
+        item = self.image(self.item_size, self.depth)
+        item.update(
+            pk=dict(S=f"ITEM#{key}"),
+            entity_type=dict(S=ENTITY_TYPES[key % len(ENTITY_TYPES)]),
+            status=dict(S=self.random.choice(("NEW", "PAID", "SHIPPED"))),
+            total=dict(N=str(self.random.randrange(1000))),
+        )
+        return item
+
+    def record(self, sequence_number: int) -> Record:
+        event_name = self.random.choices(
+            list(self.mix), weights=list(self.mix.values())
+        )[0]
+        key = self.random.randrange(self.keys)
+        stream_record = dict(
+            Keys=dict(pk=dict(S=f"ITEM#{key}")),
+            SequenceNumber=str(sequence_number).zfill(21),
+            SizeBytes=0,
+            StreamViewType="NEW_AND_OLD_IMAGES",
+        )
+        if event_name != "REMOVE":
+            stream_record["NewImage"] = self.item(key)
+        if event_name != "INSERT":
+            stream_record["OldImage"] = self.item(key)
+        return dict(
+            awsRegion="us-east-1",
+            dynamodb=stream_record,
+            eventID=f"{sequence_number:032x}",
+            eventName=event_name,
+            eventSource="aws:dynamodb",
+            eventSourceARN="arn:aws:dynamodb:us-east-1:123456789012:table/bench/stream/2020-01-01T00:00:00.000",
+            eventVersion="1.1",
+        )
+
+    def records(self, count: int) -> list[Record]:
+        return [self.record(sequence_number) for sequence_number in range(1, count + 1)]
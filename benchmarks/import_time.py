@@ -0,0 +1,90 @@
+"""
+Measures cold start: the time a fresh interpreter takes to import the
+package, to register a string condition and to route a first record. With
+--modules it also lists the slowest imports reported by `-X importtime`.
+
+    python -m benchmarks.import_time --modules
+"""
+from __future__ import annotations
+
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = dict(
+    package="import dynamodb_stream_router",
+    string_route="""
+from dynamodb_stream_router import on_modify
+
+@on_modify("$NEW.status == 'PAID'", 0)
+def handler(record):
+    pass
+""",
+    first_record="""
+from dynamodb_stream_router import on_modify, route_records
+
+@on_modify("$NEW.status == 'PAID'", 0)
+def handler(record):
+    pass
+
+route_records([
+    dict(
+        eventName="MODIFY",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="1")),
+            NewImage=dict(pk=dict(S="1"), status=dict(S="PAID"), data=dict(B="AAEC")),
+        ),
+    )
+])
+""",
+)
+
+TIMER = """
+from time import perf_counter_ns
+start = perf_counter_ns()
+exec(compile({code!r}, "<scenario>", "exec"), dict(__name__="scenario"))
+print(perf_counter_ns() - start)
+"""
+
+
+def run(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, check=True, cwd=ROOT, text=True
+    )
+
+
+def cold_start(code: str, repeats: int) -> float:
+    """Returns the best time for a fresh interpreter to run code, in ms"""
+    return min(
+        int(run("-c", TIMER.format(code=code)).stdout) / 1e6 for _ in range(repeats)
+    )
+
+
+def slowest_imports(count: int) -> list[tuple[float, str]]:
+    """Returns the slowest imports (cumulative ms and name) of the package"""
+    report = run("-X", "importtime", "-c", SCENARIOS["package"]).stderr
+    imports = []
+    for line in report.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        imports.append((int(cumulative) / 1e3, name.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python -m benchmarks.import_time")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--modules", type=int, nargs="?", const=15, default=0)
+    args = parser.parse_args()
+    for name, code in SCENARIOS.items():
+        print(f"{name:>13}: {cold_start(code, args.repeat):8.2f} ms")
+    if args.modules:
+        print()
+        for cumulative, name in slowest_imports(args.modules):
+            print(f"{cumulative:8.2f} ms {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measures the peak memory of routing a batch: how far the memory allocated
+by Python peaks above what it was before a batch of wide records is routed,
+per 1,000 records, in each of SCENARIOS.
+Decoding the records leaves freed memory that routing reuses, so the peak
+RSS of the process would mostly measure decoding; allocations are traced
+with tracemalloc instead, and each scenario runs in its own interpreter.
+Run it in two checkouts to compare versions.
+
+    python -m benchmarks.memory --records 1000 --item-size 100
+"""
+from __future__ import annotations
+
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# A batch route that reads the images of every record of an event decoded
+# as a whole, and a route that keeps the images of each record of an event
+# streamed from raw JSON, as a handler collecting items to write does
+SCENARIOS = dict(
+    batch="""
+records = json.loads(json.dumps(dict(Records=records)))["Records"]
+
+
+@on_operations_batch(set(Operation), 0)
+def handler(batch):
+    for record in batch:
+        record.keys, record.new_image, record.old_image
+
+
+route = partial(route_records, records, immutable={immutable})
+""",
+    stream="""
+event = json.dumps(dict(Records=records)).encode()
+del records
+kept = []
+
+
+@on_operations(set(Operation), 0)
+def handler(record):
+    kept.append((record.keys, record.new_image, record.old_image))
+
+
+route = partial(route_stream, event, immutable={immutable})
+""",
+)
+
+MEASURE = """
+import gc
+import json
+import tracemalloc
+from functools import partial
+
+from benchmarks.generator import StreamGenerator
+from dynamodb_stream_router import *
+
+records = StreamGenerator(item_size={item_size}, keys={records}).records({records})
+{scenario}
+gc.collect()
+tracemalloc.start()
+route()
+print(tracemalloc.get_traced_memory()[1])
+"""
+
+
+def peak_memory(
+    scenario: str, records: int, item_size: int, immutable: bool, repeats: int
+) -> float:
+    """Returns the least peak memory of routing 1,000 records, in MiB"""
+    code = MEASURE.format(
+        scenario=SCENARIOS[scenario].format(immutable=immutable),
+        item_size=item_size,
+        records=records,
+    )
+    return min(
+        int(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                capture_output=True,
+                check=True,
+                cwd=ROOT,
+                text=True,
+            ).stdout
+        )
+        for _ in range(repeats)
+    ) * (1000 / records / 2**20)
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python -m benchmarks.memory")
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--item-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for scenario in SCENARIOS:
+        for immutable in (False, True):
+            peak = peak_memory(
+                scenario, args.records, args.item_size, immutable, args.repeat
+            )
+            print(
+                f"{scenario:>6} immutable={immutable!s:<5}: "
+                f"{peak:8.2f} MiB per 1,000 records"
+            )
+
+
+if __name__ == "__main__":
+    main()
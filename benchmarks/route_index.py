@@ -0,0 +1,103 @@
+"""
+Measures how routing cost scales with the number of routes when routes
+discriminate on `$NEW.entity_type == '...'`, with and without the hash
+index, after checking that both select the same routes.
+
+    python -m benchmarks.route_index
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from timeit import repeat
+
+from dynamodb_stream_router import (
+    Operation,
+    RouteRecord,
+    get_route_index,
+    get_route_plan,
+    on_modify,
+    remove_route,
+)
+
+
+def make_records(count: int, types: int) -> list[dict]:
+    return [
+        dict(
+            eventName="MODIFY",
+            dynamodb=dict(
+                Keys=dict(pk=dict(S=str(index))),
+                NewImage=dict(
+                    pk=dict(S=str(index)),
+                    entity_type=dict(S=f"type{index % types}"),
+                    total=dict(N=str(index)),
+                ),
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def register_routes(count: int) -> None:
+    for index in range(count):
+
+        def handler(record: RouteRecord) -> None:
+            pass
+
+        handler.__name__ = f"handler_{index}"
+        on_modify(f"$NEW.entity_type == 'type{index}' & $NEW.total > 10", index % 3)(
+            handler
+        )
+
+
+def unindexed_matches(record: RouteRecord) -> list:
+    return [
+        route
+        for tier in get_route_plan(Operation.MODIFY)
+        for route in tier
+        if route.match(record)
+    ]
+
+
+def indexed_matches(record: RouteRecord) -> list:
+    return [
+        route
+        for route in get_route_index(Operation.MODIFY).candidates(record)
+        if route.match(record)
+    ]
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for count in (1, 10, 100, 1000):
+        for tier in get_route_plan(Operation.MODIFY):
+            for route in tier:
+                remove_route(Operation.MODIFY, route)
+        register_routes(count)
+        records = [RouteRecord(record) for record in make_records(args.records, count)]
+        for record in records:
+            if unindexed_matches(record) != indexed_matches(record):
+                raise AssertionError("Indexed and unindexed routing disagree")
+        timings = [
+            min(
+                repeat(
+                    lambda: [matches(record) for record in records],
+                    number=1,
+                    repeat=args.repeat,
+                )
+            )
+            / args.records
+            * 1e6
+            for matches in (unindexed_matches, indexed_matches)
+        ]
+        print(
+            f"{count:>5} routes: unindexed {timings[0]:9.2f} us/record, "
+            f"indexed {timings[1]:7.2f} us/record"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures the per-record cost of selecting and dispatching routes.
+
+"before" reproduces the original dispatch, which filtered, sorted and
+grouped the routes for every record. "after" is the current route_record,
+which walks the cached per-operation route plan.
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from itertools import groupby
+from timeit import repeat
+
+import dynamodb_stream_router
+from dynamodb_stream_router import (
+    Operation,
+    Route,
+    RouteRecord,
+    on_modify,
+    route_record,
+)
+
+ROUTES = getattr(dynamodb_stream_router, "__ROUTES")
+
+
+def legacy_route_record(record, executor=None) -> None:
+    operation = Operation[record["eventName"]]
+    record = RouteRecord(record)
+    for _, routes in groupby(
+        sorted(
+            [route for route in ROUTES[operation] if route.match(record)],
+            key=lambda x: x._priority,
+        ),
+        key=lambda x: x._priority,
+    ):
+        routes = list(routes)
+        routes[0](record) if len(routes) == 1 else list(
+            (executor.map if executor else map)(
+                Route.__call__, routes, [record] * len(routes)
+            )
+        )
+
+
+def register_routes(count: int, tiers: int) -> None:
+    for index in range(count):
+
+        def condition(record: RouteRecord, index=index) -> bool:
+            return index % 4 == 0
+
+        def handler(record: RouteRecord) -> None:
+            pass
+
+        handler.__name__ = f"handler_{index}"
+        on_modify(condition, index % tiers)(handler)
+
+
+def make_records(count: int) -> list[dict]:
+    return [
+        dict(
+            eventName="MODIFY",
+            dynamodb=dict(
+                Keys=dict(id=dict(S=str(index))),
+                NewImage=dict(id=dict(S=str(index))),
+                OldImage=dict(id=dict(S=str(index))),
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=40)
+    parser.add_argument("--tiers", type=int, default=5)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    register_routes(args.routes, args.tiers)
+    records = make_records(args.records)
+    print(
+        f"{args.routes} routes in {args.tiers} priority tiers, "
+        f"{args.records} records per batch"
+    )
+    for name, dispatch in (("before", legacy_route_record), ("after", route_record)):
+        best = min(
+            repeat(
+                lambda: [dispatch(record) for record in records],
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(f"{name:>6}: {best / args.records * 1e6:8.2f} us/record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+"""
+The benchmark suite run by `python -m benchmarks`. Each benchmark returns
+a list of results, one per parameter combination, so that the output can
+be saved as JSON and compared between versions.
+"""
+from __future__ import annotations
+
+import json
+from timeit import repeat
+from typing import Any, Callable
+
+from dynamodb_stream_router import (
+    Operation,
+    RouteRecord,
+    get_routes,
+    on_modify,
+    on_modify_batch,
+    on_operations,
+    remove_route,
+    route_records,
+    route_stream,
+)
+from dynamodb_stream_router.adaptive import adaptive_condition
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.deadline import Deadline
+from dynamodb_stream_router.dedup import DedupStore, MemoryDedupStore, SQLiteDedupStore
+
+from .generator import ENTITY_TYPES, StreamGenerator
+from .import_time import SCENARIOS, cold_start
+
+Result = dict[str, Any]
+
+EXPRESSIONS = [
+    "$NEW.entity_type == 'order'",
+    "$NEW.entity_type == 'order' & $NEW.total > 500",
+    "$NEW.status IN ('NEW', 'PAID') & attribute_exists($NEW.attr0)",
+    "begins_with($NEW.pk, 'ITEM#1') | $NEW.total BETWEEN 100 & 200",
+    "$NEW.attr1.attr0.attr0 == 'value-1' | $OLD.attr2[0] == 'value-2'",
+    "NOT $NEW.status == 'SHIPPED' & size($NEW.attr3) > 2",
+    "has_changed('status', 'total')",
+    "is_type($NEW.attr4, M) & $NEW.total >= $OLD.total",
+]
+
+
+def measure(function: Callable[[], Any], operations: int, repeats: int) -> float:
+    """Returns the best time per operation, in microseconds"""
+    return min(repeat(function, number=1, repeat=repeats)) / operations * 1e6
+
+
+def result(name: str, per_op: float, operations: int, **params: Any) -> Result:
+    return dict(name=name, params=params, per_op_us=round(per_op, 3), ops=operations)
+
+
+def clear_routes() -> None:
+    for operation in Operation:
+        for route in get_routes(operation):
+            remove_route(operation, route)
+
+
+def bench_cold_start(records: int, repeats: int) -> list[Result]:
+    return [
+        result("cold_start", cold_start(code, repeats) * 1e3, 1, scenario=scenario)
+        for scenario, code in SCENARIOS.items()
+    ]
+
+
+def bench_parse(records: int, repeats: int) -> list[Result]:
+    parser = ExpressionParser()
+
+    def parse() -> None:
+        parser._expression_cache.clear()
+        parser._tree_cache.clear()
+        for expression in EXPRESSIONS:
+            parser.parse(expression)
+
+    return [
+        result(
+            "parse",
+            measure(parse, len(EXPRESSIONS), repeats),
+            len(EXPRESSIONS),
+            expressions=len(EXPRESSIONS),
+        )
+    ]
+
+
+def bench_evaluate(records: int, repeats: int) -> list[Result]:
+    parser = ExpressionParser()
+    conditions = [parser.parse(expression) for expression in EXPRESSIONS]
+    stream = StreamGenerator(mix=dict(MODIFY=1)).records(records)
+
+    def evaluate() -> None:
+        for record in stream:
+            record = RouteRecord(record)
+            for condition in conditions:
+                condition(record)
+
+    operations = records * len(conditions)
+    return [
+        result(
+            "evaluate",
+            measure(evaluate, operations, repeats),
+            operations,
+            records=records,
+            conditions=len(conditions),
+        )
+    ]
+
+
+def bench_deserialize(records: int, repeats: int) -> list[Result]:
+    results = []
+    for item_size, depth in ((10, 1), (50, 2), (200, 3)):
+        stream = StreamGenerator(item_size=item_size, depth=depth).records(records)
+
+        def deserialize() -> None:
+            for record in stream:
+                record = RouteRecord(record, immutable=True)
+                record.new_image, record.old_image
+
+        results.append(
+            result(
+                "deserialize",
+                measure(deserialize, records, repeats),
+                records,
+                item_size=item_size,
+                depth=depth,
+            )
+        )
+    return results
+
+
+def bench_route_records(records: int, repeats: int) -> list[Result]:
+    results = []
+    stream = StreamGenerator().records(records)
+    operations = {Operation.INSERT, Operation.MODIFY, Operation.REMOVE}
+    try:
+        for count in (1, 10, 100, 1000):
+            clear_routes()
+            for index in range(count):
+                if index % 2:
+                    entity_type = ENTITY_TYPES[index % len(ENTITY_TYPES)]
+                    condition = (
+                        f"$NEW.entity_type == '{entity_type}' & $NEW.total > {index}"
+                    )
+                else:
+                    expression = EXPRESSIONS[index % len(EXPRESSIONS)]
+                    condition = f"{expression} | $NEW.total == {index}"
+
+                def handler(record: RouteRecord) -> None:
+                    pass
+
+                handler.__name__ = f"handler_{index}"
+                on_operations(
+                    {Operation.MODIFY} if "has_changed" in condition else operations,
+                    condition,
+                    index % 5,
+                )(handler)
+            results.append(
+                result(
+                    "route_records",
+                    measure(lambda: route_records(stream), records, repeats),
+                    records,
+                    records=records,
+                    routes=count,
+                )
+            )
+    finally:
+        clear_routes()
+    return results
+
+
+def bench_columnar(records: int, repeats: int) -> list[Result]:
+    results = []
+    stream = StreamGenerator(mix=dict(MODIFY=1)).records(records)
+    try:
+        for count in (10, 100):
+            clear_routes()
+            for index in range(count):
+                entity_type = ENTITY_TYPES[index % len(ENTITY_TYPES)]
+                condition = (
+                    f"$NEW.total > {index * 10}",
+                    f"$NEW.total BETWEEN {index} & {index + 100}",
+                    f"$NEW.status IN ('NEW', 'PAID') & $NEW.total < {index}",
+                    f"begins_with($NEW.pk, 'ITEM#{index % 10}')",
+                    f"$NEW.entity_type == '{entity_type}' & $NEW.total >= {index}",
+                )[index % 5]
+
+                def handler(record: RouteRecord) -> None:
+                    pass
+
+                handler.__name__ = f"handler_{index}"
+                on_modify(condition, index % 3)(handler)
+            for columnar in (False, True):
+                results.append(
+                    result(
+                        "columnar",
+                        measure(
+                            lambda: route_records(stream, columnar=columnar),
+                            records,
+                            repeats,
+                        ),
+                        records,
+                        records=records,
+                        routes=count,
+                        columnar=columnar,
+                    )
+                )
+    finally:
+        clear_routes()
+    return results
+
+
+def bench_stream(records: int, repeats: int) -> list[Result]:
+    event = json.dumps(dict(Records=StreamGenerator().records(records))).encode()
+    try:
+        clear_routes()
+        for index, expression in enumerate(EXPRESSIONS[:4]):
+
+            def handler(record: RouteRecord) -> None:
+                pass
+
+            handler.__name__ = f"handler_{index}"
+            on_modify(expression, index)(handler)
+        return [
+            result(
+                "stream",
+                measure(route, records, repeats),
+                records,
+                records=records,
+                decoding=decoding,
+            )
+            for decoding, route in (
+                ("json.loads", lambda: route_records(json.loads(event)["Records"])),
+                ("route_stream", lambda: route_stream(event)),
+            )
+        ]
+    finally:
+        clear_routes()
+
+
+def bench_adaptive(records: int, repeats: int) -> list[Result]:
+    # The operands of each cost the same to the optimizer, which keeps the
+    # written order, in which the first operand rarely decides the result
+    expressions = [
+        "$NEW.attr1 != 'x' & $NEW.entity_type == 'order'",
+        "$NEW.attr2 == 'x' | $NEW.entity_type != 'order'",
+    ]
+    parser = ExpressionParser()
+    stream = StreamGenerator(mix=dict(MODIFY=1)).records(records)
+    results = []
+    for adaptive in (False, True):
+        conditions = [parser.parse(expression) for expression in expressions]
+        if adaptive:
+            conditions = [
+                adaptive_condition(condition, period=16) for condition in conditions
+            ]
+
+        def evaluate() -> None:
+            for record in stream:
+                record = RouteRecord(record)
+                for condition in conditions:
+                    condition(record)
+
+        # Give adaptive conditions a window to reorder on
+        evaluate()
+        operations = records * len(conditions)
+        results.append(
+            result(
+                "adaptive",
+                measure(evaluate, operations, repeats),
+                operations,
+                records=records,
+                adaptive=adaptive,
+            )
+        )
+    return results
+
+
+def bench_dedup(records: int, repeats: int) -> list[Result]:
+    stream = StreamGenerator().records(records)
+    stores: dict[str, Callable[[], DedupStore]] = dict(
+        memory=MemoryDedupStore, sqlite=SQLiteDedupStore
+    )
+    try:
+        clear_routes()
+        for index, expression in enumerate(EXPRESSIONS[:4]):
+
+            def handler(record: RouteRecord) -> None:
+                pass
+
+            handler.__name__ = f"handler_{index}"
+            on_modify(expression, index)(handler)
+        results = [
+            result(
+                "dedup",
+                measure(lambda: route_records(stream), records, repeats),
+                records,
+                records=records,
+                store=None,
+                delivery="first",
+            )
+        ]
+        for name, store in stores.items():
+            # A new store sees every record for the first time; a store that
+            # has routed the stream sees every record delivered again
+            delivered = store()
+            route_records(stream, dedup=delivered)
+            for delivery, route in (
+                ("first", lambda: route_records(stream, dedup=store())),
+                ("redelivery", lambda: route_records(stream, dedup=delivered)),
+            ):
+                results.append(
+                    result(
+                        "dedup",
+                        measure(route, records, repeats),
+                        records,
+                        records=records,
+                        store=name,
+                        delivery=delivery,
+                    )
+                )
+        return results
+    finally:
+        clear_routes()
+
+
+def bench_batch_routes(records: int, repeats: int) -> list[Result]:
+    # Handlers that write each record, or each chunk, in one round trip
+    stream = StreamGenerator(mix=dict(MODIFY=1)).records(records)
+    results = []
+    try:
+        for max_size in (None, 1, 25):
+            clear_routes()
+            calls = 0
+
+            def write(record: RouteRecord) -> None:
+                nonlocal calls
+                calls += 1
+
+            def write_batch(batch: list[RouteRecord]) -> None:
+                nonlocal calls
+                calls += 1
+
+            if max_size:
+                on_modify_batch("$NEW.total > 100", 0, max_size=max_size)(write_batch)
+            else:
+                on_modify("$NEW.total > 100", 0)(write)
+            per_op = measure(lambda: route_records(stream), records, repeats)
+            calls = 0
+            route_records(stream)
+            results.append(
+                result(
+                    "batch_routes",
+                    per_op,
+                    records,
+                    records=records,
+                    max_size=max_size,
+                    calls=calls,
+                )
+            )
+    finally:
+        clear_routes()
+    return results
+
+
+def bench_coalesce(records: int, repeats: int) -> list[Result]:
+    results = []
+    try:
+        for keys in (records, records // 8):
+            stream = StreamGenerator(keys=max(keys, 1)).records(records)
+            for coalesce in (False, True):
+                clear_routes()
+                calls = 0
+
+                def handler(record: RouteRecord) -> None:
+                    nonlocal calls
+                    calls += 1
+
+                on_operations(set(Operation), 0, coalesce=coalesce)(handler)
+                per_op = measure(lambda: route_records(stream), records, repeats)
+                calls = 0
+                route_records(stream)
+                results.append(
+                    result(
+                        "coalesce",
+                        per_op,
+                        records,
+                        records=records,
+                        keys=keys,
+                        coalesce=coalesce,
+                        calls=calls,
+                    )
+                )
+    finally:
+        clear_routes()
+    return results
+
+
+def bench_deadline(records: int, repeats: int) -> list[Result]:
+    # The cost of timing records against a deadline that is never reached
+    stream = StreamGenerator().records(records)
+    results = []
+    try:
+        clear_routes()
+        for index, expression in enumerate(EXPRESSIONS[:4]):
+
+            def handler(record: RouteRecord) -> None:
+                pass
+
+            handler.__name__ = f"handler_{index}"
+            on_modify(expression, index)(handler)
+        for deadline in (False, True):
+            results.append(
+                result(
+                    "deadline",
+                    measure(
+                        lambda: route_records(
+                            stream,
+                            deadline=Deadline.after(3600) if deadline else None,
+                        ),
+                        records,
+                        repeats,
+                    ),
+                    records,
+                    records=records,
+                    deadline=deadline,
+                )
+            )
+    finally:
+        clear_routes()
+    return results
+
+
+def bench_shared(records: int, repeats: int) -> list[Result]:
+    # Routes that all decode the same JSON attribute of a few KB
+    stream = StreamGenerator(mix=dict(MODIFY=1)).records(records)
+    payload = json.dumps({f"field{index}": f"value-{index}" for index in range(200)})
+    for record in stream:
+        record["dynamodb"]["NewImage"]["payload"] = dict(S=payload)
+    results = []
+    try:
+        for count in (1, 10, 50):
+            clear_routes()
+            for index in range(count):
+
+                def handler(record: RouteRecord) -> None:
+                    pass
+
+                handler.__name__ = f"handler_{index}"
+                on_modify(f"from_json($NEW.payload) & $NEW.total > {index}", index)(
+                    handler
+                )
+            results.append(
+                result(
+                    "shared",
+                    measure(lambda: route_records(stream), records, repeats),
+                    records,
+                    records=records,
+                    routes=count,
+                )
+            )
+    finally:
+        clear_routes()
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[int, int], list[Result]]] = dict(
+    cold_start=bench_cold_start,
+    parse=bench_parse,
+    evaluate=bench_evaluate,
+    deserialize=bench_deserialize,
+    route_records=bench_route_records,
+    columnar=bench_columnar,
+    stream=bench_stream,
+    adaptive=bench_adaptive,
+    dedup=bench_dedup,
+    batch_routes=bench_batch_routes,
+    coalesce=bench_coalesce,
+    deadline=bench_deadline,
+    shared=bench_shared,
+)
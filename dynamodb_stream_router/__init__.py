@@ -1,19 +1,44 @@
 from __future__ import annotations
 
-from concurrent.futures import Executor
 from enum import Enum, auto
-from functools import partial
+from functools import cache, partial
+from inspect import isawaitable, iscoroutinefunction
 from itertools import groupby
+from operator import attrgetter
+from os import PathLike, environ
 from types import FunctionType
-from typing import Any, Callable
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Optional,
+    TypedDict,
+    Union,
+)
 
 from multipledispatch import dispatch
 
 from .conditions import Condition
-from .conditions.parser import ExpressionParser
-from .exceptions import RouteAlreadyExistsException
+from .exceptions import AsyncRouteException, RouteAlreadyExistsException
+from .index import RouteIndex
 from .record import Record, RouteRecord
 
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+
+    from .columnar import ColumnarPlan
+    from .conditions.cache import ConditionCache
+    from .conditions.parser import ExpressionParser
+    from .deadline import Deadline
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+__version__ = "0.0.9"
+
 
 class Operation(Enum):
     INSERT = auto()
@@ -21,29 +46,76 @@ class Operation(Enum):
     REMOVE = auto()
 
 
+class FailureMode(Enum):
+    """
+    How route_records isolates a record whose routing raised. STOP routes no
+    further records; CONTINUE_OTHER_KEYS goes on with the records of other
+    Keys, skipping the later records of the failed record's Keys.
+    """
+
+    STOP = auto()
+    CONTINUE_OTHER_KEYS = auto()
+
+
+class BatchItemFailure(TypedDict):
+    itemIdentifier: str
+
+
+class BatchResponse(TypedDict):
+    batchItemFailures: list[BatchItemFailure]
+
+
 DYNAMODB_STREAM_ROUTER_NAMESPACE = dict()
 dispatch = partial(dispatch, namespace=DYNAMODB_STREAM_ROUTER_NAMESPACE)
 
-__CONDITION_PARSER = ExpressionParser()
+CONDITION_CACHE_VARIABLE = "DYNAMODB_STREAM_ROUTER_CONDITION_CACHE"
+
+__ADAPTIVE_ORDERING: Callable[[Condition], Condition] = None
+__BATCH_PLANS: dict[Operation, tuple[BatchRoute, ...]] = dict()
+__COLUMNAR_PLANS: dict[tuple[Operation, bool], ColumnarPlan] = dict()
+__CONDITION_CACHE: ConditionCache = None
 __ROUTES: dict[Operation, set[Route]] = {operation: set() for operation in Operation}
+__ROUTE_INDEXES: dict[tuple[Operation, bool], RouteIndex] = dict()
+__ROUTE_PLANS: dict[tuple[Operation, bool], RoutePlan] = dict()
 
-RouteHandler = Callable[[RouteRecord], Any]
+BatchRouteHandler = Callable[[list[RouteRecord]], Any]
+# The priorities of the routes that a phase of routing calls, (low, high]
+Priorities = tuple[float, float]
+RouteHandler = Callable[[RouteRecord], Union[Any, Awaitable[Any]]]
+RoutePlan = tuple[tuple["Route", ...], ...]
 
 
 class Route:
     def __call__(self, record: RouteRecord) -> Any:
+        if self.__async_handler:
+            raise AsyncRouteException(
+                f"{self} is asynchronous and must be routed with route_records_async"
+            )
         return self.__handler(record)
 
     def __hash__(self) -> int:
         return hash(self.__condition)
 
     def __init__(
-        self, *, condition: Condition, handler: RouteHandler, priority: int
+        self,
+        *,
+        condition: Condition,
+        handler: RouteHandler,
+        priority: int,
+        coalesce: bool = False,
+        dedup_key: str = None,
     ) -> None:
         super().__init__()
+        # Synchronous routing only fails on these when it has to call them
+        self.__async_condition = iscoroutinefunction(condition)
+        self.__async_handler = iscoroutinefunction(handler)
+        self.__coalesce = coalesce
         self.__condition = condition
         self.__priority = priority
         self.__handler = handler
+        self.__dedup_key = (
+            dedup_key or f"{self.name}[{priority}] {self.__condition_key(condition)}"
+        )
 
     def __str__(self) -> str:
         return f"{self.__condition}[{self.__priority}] -> {self.__handler.__module__}.{self.__handler.__name__}"
@@ -60,18 +132,209 @@ class Route:
     def _priority(self) -> int:
         return self.__priority
 
+    @property
+    def name(self) -> str:
+        return f"{self.__handler.__module__}.{self.__handler.__qualname__}"
+
+    @property
+    def coalesce(self) -> bool:
+        """True if route_records routes this route net changes (see coalesce)"""
+        return self.__coalesce
+
+    @property
+    def dedup_key(self) -> str:
+        """
+        Identifies the route to a DedupStore. Unless it is given, it is made
+        of the route's name, priority and condition, so that routes sharing
+        a handler are told apart.
+        """
+        return self.__dedup_key
+
+    @property
+    def is_async(self) -> bool:
+        return self.__async_condition or self.__async_handler
+
+    async def call_async(self, record: RouteRecord) -> Any:
+        result = self.__handler(record)
+        return (await result) if isawaitable(result) else result
+
     def match(self, record: RouteRecord) -> bool:
+        if self.__async_condition:
+            raise AsyncRouteException(
+                f"{self} is asynchronous and must be routed with route_records_async"
+            )
         return self.__condition(record)
 
+    async def match_async(self, record: RouteRecord) -> bool:
+        result = self.__condition(record)
+        return (await result) if isawaitable(result) else result
+
+    @staticmethod
+    def __condition_key(condition: Condition) -> str:
+        """The expression of a string condition, otherwise where it is defined"""
+        if expression := getattr(condition, "expression", None):
+            return expression
+        name = f"{condition.__module__}.{getattr(condition, '__qualname__', '')}"
+        code = getattr(condition, "__code__", None)
+        return f"{name}:{code.co_firstlineno}" if code else name
+
+
+class BatchRoute(Route):
+    """
+    A route whose handler is called once for a batch, with the list of the
+    batch's records that match its condition, in order. With max_size the
+    records are passed at most max_size at a time.
+    """
+
+    def __init__(
+        self,
+        *,
+        condition: Condition,
+        handler: BatchRouteHandler,
+        priority: int,
+        max_size: int = None,
+        coalesce: bool = False,
+        dedup_key: str = None,
+    ) -> None:
+        super().__init__(
+            condition=condition,
+            handler=handler,
+            priority=priority,
+            coalesce=coalesce,
+            dedup_key=dedup_key,
+        )
+        if self.is_async:
+            raise AsyncRouteException(
+                f"{self} is asynchronous, which batch routes cannot be"
+            )
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.__max_size = max_size
+
+    @property
+    def max_size(self) -> Optional[int]:
+        return self.__max_size
+
 
 def add_route(operation: Operation, route: Route) -> Route:
     if route:
         if has_route(operation, route):
             raise RouteAlreadyExistsException()
         __ROUTES[operation].add(route)
+        __invalidate_route_plan(operation)
     return route
 
 
+@cache
+def __condition_parser() -> ExpressionParser:
+    # Importing the parser makes sly build its parsing tables, so that is
+    # left until the first string condition
+    from .conditions.parser import ExpressionParser
+
+    return ExpressionParser()
+
+
+def __parse_condition(expression: str) -> Condition:
+    if __CONDITION_CACHE is None and environ.get(CONDITION_CACHE_VARIABLE):
+        load_condition_cache(environ[CONDITION_CACHE_VARIABLE])
+    condition = __CONDITION_CACHE.get(expression) if __CONDITION_CACHE else None
+    condition = condition or __condition_parser().parse(expression)
+    return __ADAPTIVE_ORDERING(condition) if __ADAPTIVE_ORDERING else condition
+
+
+def __invalidate_route_plan(operation: Operation) -> None:
+    __BATCH_PLANS.pop(operation, None)
+    for coalesce in (False, True):
+        __COLUMNAR_PLANS.pop((operation, coalesce), None)
+        __ROUTE_INDEXES.pop((operation, coalesce), None)
+        __ROUTE_PLANS.pop((operation, coalesce), None)
+
+
+def enable_adaptive_ordering(
+    window: int = 1024, sample: int = 64, period: int = 256
+) -> None:
+    """
+    String conditions registered after this call reorder the operands of
+    their ANDs and ORs that cannot raise by how cheaply they decide the
+    result. One in every sample evaluations is measured, over a window of
+    the last samples, and the order is revisited every period samples.
+    """
+    global __ADAPTIVE_ORDERING
+    from .adaptive import adaptive_condition
+
+    __ADAPTIVE_ORDERING = partial(
+        adaptive_condition, window=window, sample=sample, period=period
+    )
+
+
+def get_batch_routes(operation: Operation) -> tuple[BatchRoute, ...]:
+    """Returns the batch routes for operation in ascending priority order"""
+    try:
+        return __BATCH_PLANS[operation]
+    except KeyError:
+        routes = [
+            route for route in __ROUTES[operation] if isinstance(route, BatchRoute)
+        ]
+        plan = __BATCH_PLANS[operation] = tuple(
+            sorted(routes, key=attrgetter("_priority", "name"))
+        )
+        return plan
+
+
+def get_columnar_plan(operation: Operation, coalesce: bool = False) -> ColumnarPlan:
+    """
+    Returns the routes for operation with their string conditions compiled
+    for columnar evaluation
+    """
+    try:
+        return __COLUMNAR_PLANS[(operation, coalesce)]
+    except KeyError:
+        from .columnar import ColumnarPlan
+
+        plan = __COLUMNAR_PLANS[(operation, coalesce)] = ColumnarPlan(
+            get_route_plan(operation, coalesce)
+        )
+        return plan
+
+
+def get_route_index(operation: Operation, coalesce: bool = False) -> RouteIndex:
+    """
+    Returns the hash index over the route plan for operation, which narrows
+    the routes that have to be evaluated for a record
+    """
+    try:
+        return __ROUTE_INDEXES[(operation, coalesce)]
+    except KeyError:
+        index = __ROUTE_INDEXES[(operation, coalesce)] = RouteIndex(
+            get_route_plan(operation, coalesce)
+        )
+        return index
+
+
+def get_route_plan(operation: Operation, coalesce: bool = False) -> RoutePlan:
+    """
+    Returns the routes for operation grouped into priority tiers, in
+    ascending priority order. The plan is compiled on first use and cached
+    until the routes for operation are changed. Batch routes are not part
+    of the plan (see get_batch_routes). With coalesce=True the plan has the
+    routes that are routed net changes instead of the others (see coalesce).
+    """
+    try:
+        return __ROUTE_PLANS[(operation, coalesce)]
+    except KeyError:
+        priority = attrgetter("_priority")
+        routes = [
+            route
+            for route in __ROUTES[operation]
+            if not isinstance(route, BatchRoute) and route.coalesce == coalesce
+        ]
+        plan = __ROUTE_PLANS[(operation, coalesce)] = tuple(
+            tuple(routes)
+            for _, routes in groupby(sorted(routes, key=priority), key=priority)
+        )
+        return plan
+
+
 def get_routes(operation: Operation) -> frozenset[Route]:
     return frozenset(__ROUTES[operation])
 
@@ -80,17 +343,34 @@ def has_route(operation: Operation, route: Route) -> bool:
     return route in __ROUTES[operation]
 
 
+def load_condition_cache(file: Union[str, PathLike]) -> int:
+    """
+    Loads string conditions compiled ahead of time with
+    dynamodb_stream_router.conditions.cache. String conditions found in the
+    file are not parsed; all others still are. Returns the number of
+    conditions in the file, which is 0 if it is missing or stale.
+    """
+    global __CONDITION_CACHE
+    from .conditions.cache import ConditionCache
+
+    __CONDITION_CACHE = ConditionCache.load(file)
+    return len(__CONDITION_CACHE)
+
+
 def remove_route(operation: Operation, route: Route) -> Route:
     try:
         __ROUTES[operation].remove(route)
     except KeyError:
         pass
+    else:
+        __invalidate_route_plan(operation)
     return route
 
 
 def update_route(operation: Operation, route: Route) -> Route:
     if route:
         __ROUTES[operation].add(route)
+        __invalidate_route_plan(operation)
     return route
 
 
@@ -98,70 +378,256 @@ RouteHandlerDecorator = Callable[[RouteHandler], Route]
 
 
 @dispatch(int)
-def on_insert(priority: int, /) -> RouteHandlerDecorator:
-    return on_insert(lambda _: True, priority)
+def on_insert(priority: int, /, *, coalesce: bool = False) -> RouteHandlerDecorator:
+    return on_insert(lambda _: True, priority, coalesce=coalesce)
 
 
 @dispatch(str, int)
-def on_insert(condition: str, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.INSERT}, condition, priority)
+def on_insert(
+    condition: str, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.INSERT}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(FunctionType, int)
-def on_insert(condition: Condition, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.INSERT}, condition, priority)
+def on_insert(
+    condition: Condition, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.INSERT}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(int)
-def on_modify(priority: int, /) -> RouteHandlerDecorator:
-    return on_modify(lambda _: True, priority)
+def on_modify(priority: int, /, *, coalesce: bool = False) -> RouteHandlerDecorator:
+    return on_modify(lambda _: True, priority, coalesce=coalesce)
 
 
 @dispatch(str, int)
-def on_modify(condition: str, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.MODIFY}, condition, priority)
+def on_modify(
+    condition: str, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.MODIFY}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(FunctionType, int)
-def on_modify(condition: Condition, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.MODIFY}, condition, priority)
+def on_modify(
+    condition: Condition, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.MODIFY}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(int)
-def on_remove(priority: int, /) -> RouteHandlerDecorator:
-    return on_remove(lambda _: True, priority)
+def on_remove(priority: int, /, *, coalesce: bool = False) -> RouteHandlerDecorator:
+    return on_remove(lambda _: True, priority, coalesce=coalesce)
 
 
 @dispatch(str, int)
-def on_remove(condition: str, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.REMOVE}, condition, priority)
+def on_remove(
+    condition: str, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.REMOVE}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(FunctionType, int)
-def on_remove(condition: Condition, priority: int, /) -> RouteHandlerDecorator:
-    return on_operations({Operation.REMOVE}, condition, priority)
+def on_remove(
+    condition: Condition, priority: int, /, *, coalesce: bool = False
+) -> RouteHandlerDecorator:
+    return on_operations({Operation.REMOVE}, condition, priority, coalesce=coalesce)
 
 
 @dispatch(set, int)
 def on_operations(
-    operations: set[Operation], priority: int, /
+    operations: set[Operation], priority: int, /, *, coalesce: bool = False
 ) -> RouteHandlerDecorator:
-    return on_operations(operations, lambda _: True, priority)
+    return on_operations(operations, lambda _: True, priority, coalesce=coalesce)
 
 
 @dispatch(set, str, int)
 def on_operations(
-    operations: set[Operation], condition: str, priority: int, /
+    operations: set[Operation],
+    condition: str,
+    priority: int,
+    /,
+    *,
+    coalesce: bool = False,
 ) -> RouteHandlerDecorator:
-    return on_operations(operations, __CONDITION_PARSER.parse(condition), priority)
+    return on_operations(
+        operations, __parse_condition(condition), priority, coalesce=coalesce
+    )
 
 
 @dispatch(set, FunctionType, int)
 def on_operations(
-    operations: set[Operation], condition: Condition, priority: int, /
+    operations: set[Operation],
+    condition: Condition,
+    priority: int,
+    /,
+    *,
+    coalesce: bool = False,
 ) -> RouteHandlerDecorator:
     def register_route(handler: RouteHandler) -> RouteHandler:
-        route = Route(condition=condition, handler=handler, priority=priority or 0)
+        route = Route(
+            condition=condition,
+            handler=handler,
+            priority=priority or 0,
+            coalesce=coalesce,
+        )
+        for operation in operations:
+            add_route(operation, route)
+        return handler
+
+    return register_route
+
+
+BatchRouteHandlerDecorator = Callable[[BatchRouteHandler], BatchRouteHandler]
+
+
+@dispatch(int)
+def on_insert_batch(
+    priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_insert_batch(
+        lambda _: True, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(str, int)
+def on_insert_batch(
+    condition: str, priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.INSERT}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(FunctionType, int)
+def on_insert_batch(
+    condition: Condition,
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.INSERT}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(int)
+def on_modify_batch(
+    priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_modify_batch(
+        lambda _: True, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(str, int)
+def on_modify_batch(
+    condition: str, priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.MODIFY}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(FunctionType, int)
+def on_modify_batch(
+    condition: Condition,
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.MODIFY}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(int)
+def on_remove_batch(
+    priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_remove_batch(
+        lambda _: True, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(str, int)
+def on_remove_batch(
+    condition: str, priority: int, /, *, max_size: int = None, coalesce: bool = False
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.REMOVE}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(FunctionType, int)
+def on_remove_batch(
+    condition: Condition,
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        {Operation.REMOVE}, condition, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(set, int)
+def on_operations_batch(
+    operations: set[Operation],
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        operations, lambda _: True, priority, max_size=max_size, coalesce=coalesce
+    )
+
+
+@dispatch(set, str, int)
+def on_operations_batch(
+    operations: set[Operation],
+    condition: str,
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    return on_operations_batch(
+        operations,
+        __parse_condition(condition),
+        priority,
+        max_size=max_size,
+        coalesce=coalesce,
+    )
+
+
+@dispatch(set, FunctionType, int)
+def on_operations_batch(
+    operations: set[Operation],
+    condition: Condition,
+    priority: int,
+    /,
+    *,
+    max_size: int = None,
+    coalesce: bool = False,
+) -> BatchRouteHandlerDecorator:
+    def register_route(handler: BatchRouteHandler) -> BatchRouteHandler:
+        route = BatchRoute(
+            condition=condition,
+            handler=handler,
+            priority=priority or 0,
+            max_size=max_size,
+            coalesce=coalesce,
+        )
         for operation in operations:
             add_route(operation, route)
         return handler
@@ -172,27 +638,211 @@ def on_operations(
 def route_record(
     record: Record,
     executor: Executor = None,
+    immutable: bool = False,
+    metrics: MetricsSink = None,
+    dedup: Union[bool, DedupStore] = None,
 ) -> None:
-    operation = Operation[record["eventName"]]
-    record: RouteRecord = RouteRecord(record)
-    for _, routes in groupby(
+    from .routing import route_record
+
+    route_record(
+        record,
+        RouteRecord(record, immutable=immutable, timed=bool(metrics)),
+        executor,
+        metrics,
+        __dedup_store(dedup),
+    )
+
+
+def __dedup_store(dedup: Union[bool, DedupStore, None]) -> Optional[DedupStore]:
+    return __default_dedup_store() if dedup is True else dedup or None
+
+
+@cache
+def __default_dedup_store() -> DedupStore:
+    from .dedup import MemoryDedupStore
+
+    return MemoryDedupStore()
+
+
+def __deadline(deadline: Union[Deadline, float, Any]) -> Optional[Deadline]:
+    if deadline is None:
+        return None
+    from .deadline import Deadline
+
+    if isinstance(deadline, Deadline):
+        return deadline
+    if isinstance(deadline, (int, float)):
+        return Deadline(deadline)
+    return Deadline.from_context(deadline)
+
+
+def record_key(record: Record) -> Hashable:
+    """
+    Returns a hashable form of the record's Keys. DynamoDB streams order
+    records per item, so records with equal keys must be handled in order.
+    """
+    keys = record["dynamodb"].get("Keys")
+    if not keys:
+        return id(record)
+    return tuple(
         sorted(
-            [route for route in __ROUTES[operation] if route.match(record)],
-            key=lambda x: x._priority,
-        ),
-        key=lambda x: x._priority,
-    ):
-        routes = list(routes)
-        routes[0](record) if len(routes) == 1 else list(
-            (executor.map if executor else map)(
-                Route.__call__, routes, [record] * len(routes)
-            )
+            (name, dynamodb_type, value)
+            for name, attribute in keys.items()
+            for dynamodb_type, value in attribute.items()
         )
+    )
 
 
 def route_records(
     records: list[Record],
     executor: Executor = None,
+    immutable: bool = False,
+    parallel: bool = False,
+    max_in_flight: int = None,
+    metrics: MetricsSink = None,
+    columnar: bool = False,
+    failure_mode: FailureMode = None,
+    dedup: Union[bool, DedupStore] = None,
+    deadline: Union[Deadline, float, Any] = None,
+) -> Optional[BatchResponse]:
+    """
+    Routes records in order. With parallel=True (which requires executor)
+    the records are partitioned by their Keys; each partition is routed in
+    order, and different partitions are routed concurrently on executor,
+    with at most max_in_flight partitions submitted at a time. In that mode
+    routes of equal priority are called sequentially within a partition, so
+    that partitions never wait on the executor they are running on.
+
+    If metrics is provided it is told about every condition evaluation,
+    handler call, record and the batch as a whole.
+
+    With columnar=True string conditions are evaluated for the whole batch
+    at once, before any handler is called (see columnar). Other conditions
+    are still evaluated record by record. Metrics time every condition, so
+    columnar is ignored when metrics is provided.
+
+    Without failure_mode the first exception raised while routing a record
+    propagates. With it, such exceptions are logged and the record is
+    isolated as failure_mode says, and the records that were not routed,
+    because they failed or were skipped, are returned as a response for
+    ReportBatchItemFailures.
+
+    With dedup, a route's handler is not called for records that the route
+    has completed before, by their eventID; dedup is a DedupStore, or True
+    for a MemoryDedupStore shared by the process (see dedup).
+
+    Batch routes are called with all the records of the batch that match
+    them. Records are then routed in phases: every record is routed to its
+    routes up to the priority of the first batch routes, then those are
+    called, then every record is routed up to the priority of the next
+    batch routes, and so on. Records that failed or were skipped in a phase
+    are left out of the phases after it.
+
+    deadline is a Deadline, a time.monotonic() value or the context of a
+    Lambda invocation. With it, no record is started that is not expected
+    to finish before the deadline, less a safety margin (see deadline), and
+    the records that were not routed are returned as with failure_mode.
+    """
+    from .batch import route_batch
+
+    return route_batch(
+        records,
+        executor,
+        immutable,
+        parallel,
+        max_in_flight,
+        metrics,
+        columnar,
+        failure_mode,
+        __dedup_store(dedup),
+        __deadline(deadline),
+    )
+
+
+def route_stream(
+    source: Union[bytes, str, IO[bytes], IO[str]],
+    executor: Executor = None,
+    immutable: bool = False,
+    metrics: MetricsSink = None,
+    failure_mode: FailureMode = None,
+    dedup: Union[bool, DedupStore] = None,
+    deadline: Union[Deadline, float, Any] = None,
+) -> Optional[BatchResponse]:
+    """
+    Routes the records of an event given as raw JSON, in bytes, a str or a
+    file-like object, in order. Each record is decoded just before it is
+    routed and released after, so memory use does not grow with the size
+    of the event (see stream.iter_records). Parallel and columnar routing
+    need the whole batch up front, so records are routed one at a time.
+    failure_mode, dedup and deadline are as for route_records. Records
+    that are not started for deadline are still decoded, to be reported.
+    """
+    from .stream import route_source
+
+    return route_source(
+        source,
+        executor,
+        immutable,
+        metrics,
+        failure_mode,
+        __dedup_store(dedup),
+        __deadline(deadline),
+    )
+
+
+async def route_record_async(
+    record: Record,
+    immutable: bool = False,
+    semaphore: asyncio.Semaphore = None,
+    metrics: MetricsSink = None,
+    dedup: Union[bool, DedupStore] = None,
 ) -> None:
-    for record in records:
-        route_record(record, executor)
+    """
+    Routes record like route_record, but awaits async conditions and
+    handlers. Routes of equal priority are run together with asyncio.gather;
+    if semaphore is provided every handler call holds it while it runs.
+    Synchronous conditions and handlers are called directly on the loop.
+    """
+    from . import asynchronous
+
+    await asynchronous.route_record(
+        record,
+        RouteRecord(record, immutable=immutable, timed=bool(metrics)),
+        semaphore,
+        metrics,
+        __dedup_store(dedup),
+    )
+
+
+async def route_records_async(
+    records: list[Record],
+    immutable: bool = False,
+    parallel: bool = False,
+    max_concurrency: int = None,
+    metrics: MetricsSink = None,
+    failure_mode: FailureMode = None,
+    dedup: Union[bool, DedupStore] = None,
+    deadline: Union[Deadline, float, Any] = None,
+) -> Optional[BatchResponse]:
+    """
+    Routes records on the running event loop. Records are routed in order
+    unless parallel=True, in which case they are partitioned by their Keys
+    and partitions are routed concurrently, each in order. max_concurrency
+    bounds the number of handlers running at once.
+
+    metrics, failure_mode, dedup and deadline are as for route_records, and
+    so are batch routes and routes for net changes. Batch handlers are
+    synchronous, so they are called directly on the loop.
+    """
+    from . import asynchronous
+
+    return await asynchronous.route_records(
+        records,
+        immutable,
+        parallel,
+        max_concurrency,
+        metrics,
+        failure_mode,
+        __dedup_store(dedup),
+        __deadline(deadline),
+    )
@@ -0,0 +1,164 @@
+"""
+Adaptive ordering of string conditions.
+
+The optimizer orders the operands of AND and OR that are bools and cannot
+raise by a static estimate of their cost. An adaptive condition samples
+one in every `sample` evaluations: it times each of those operands on the
+record and notes whether it was true, keeping the last `window` samples.
+Every `period` samples it recompiles itself so that the operands that
+decide the result soonest for their cost come first; for AND those that
+are cheap and often false, for OR those that are cheap and often true.
+
+Only operands that the optimizer may reorder are moved. They cannot
+raise, so evaluating all of them for a sample and running them in another
+order changes neither the result nor the exceptions of the condition.
+"""
+from __future__ import annotations
+
+from collections import deque
+from functools import wraps
+from itertools import count
+from time import perf_counter_ns
+from typing import Any, Union
+
+from .conditions import Condition
+from .conditions.compiler import compile_condition
+from .conditions.nodes import And, Node, Not, Or
+from .conditions.optimizer import chain, runs
+from .record import RouteRecord
+
+Order = tuple[int, ...]
+Run = tuple[Node, ...]
+
+# Only reorder when the new order is expected to cost this much less
+GAIN = 0.9
+
+
+def expected_cost(order: Order, costs: list[float], rates: list[float]) -> float:
+    """
+    Returns the mean cost of evaluating operands in order, where rates are
+    how often each operand lets evaluation go on to the next one
+    """
+    total, reached = 0.0, 1.0
+    for i in order:
+        total += reached * costs[i]
+        reached *= rates[i]
+    return total
+
+
+class OperandRun:
+    """The operands of a run of an AND or OR chain and their samples"""
+
+    def __init__(self, kind: type[Union[And, Or]], run: Run, window: int) -> None:
+        self.conditions = [compile_condition(operand) for operand in run]
+        self.kind = kind
+        self.order: Order = tuple(range(len(run)))
+        self.samples: deque[tuple[tuple[bool, ...], tuple[int, ...]]] = deque(
+            maxlen=window
+        )
+
+    def observe(self, record: RouteRecord) -> None:
+        results = list()
+        costs = list()
+        for condition in self.conditions:
+            start = perf_counter_ns()
+            results.append(bool(condition(record)))
+            costs.append(perf_counter_ns() - start)
+        self.samples.append((tuple(results), tuple(costs)))
+
+    def reorder(self) -> bool:
+        """Orders the operands for the current window; True if that changed"""
+        samples = list(self.samples)
+        if not samples:
+            return False
+        costs = [sum(column) / len(samples) for column in zip(*(s[1] for s in samples))]
+        rates = [sum(column) / len(samples) for column in zip(*(s[0] for s in samples))]
+        if self.kind is Or:
+            # OR goes on to the next operand when one is false
+            rates = [1.0 - rate for rate in rates]
+
+        def cost_per_decision(i: int) -> float:
+            return costs[i] / (1.0 - rates[i]) if rates[i] < 1.0 else float("inf")
+
+        # Ties keep their current order
+        order = tuple(sorted(self.order, key=cost_per_decision))
+        if expected_cost(order, costs, rates) >= GAIN * expected_cost(
+            self.order, costs, rates
+        ):
+            return False
+        self.order = order
+        return True
+
+
+class AdaptiveOrder:
+    """The sampling state and the current compiled order of a condition"""
+
+    def __init__(self, condition: Condition, window: int, period: int) -> None:
+        self.condition = condition
+        self.period = period
+        self.runs: dict[Run, OperandRun] = dict()
+        self.samples = 0
+        self.tree: Node = condition.tree
+        self.__expression = condition.expression
+        self.__tree = condition.tree
+        self.__collect(condition.tree, window)
+
+    def __arrange(self, node: Node) -> Node:
+        if isinstance(node, (And, Or)):
+            arranged: list[Node] = list()
+            for run in runs(node):
+                if run in self.runs:
+                    run = tuple(run[i] for i in self.runs[run].order)
+                arranged += map(self.__arrange, run)
+            return chain(type(node), arranged)
+        if isinstance(node, Not):
+            return Not(self.__arrange(node.operand))
+        return node
+
+    def __collect(self, node: Node, window: int) -> None:
+        if isinstance(node, (And, Or)):
+            for run in runs(node):
+                if len(run) > 1 and run not in self.runs:
+                    self.runs[run] = OperandRun(type(node), run, window)
+                for operand in run:
+                    self.__collect(operand, window)
+        elif isinstance(node, Not):
+            self.__collect(node.operand, window)
+
+    def observe(self, record: RouteRecord) -> None:
+        for run in self.runs.values():
+            run.observe(record)
+        self.samples += 1
+        if not self.samples % self.period:
+            self.reorder()
+
+    def reorder(self) -> None:
+        if any([run.reorder() for run in self.runs.values()]):
+            self.tree = self.__arrange(self.__tree)
+            self.condition = compile_condition(self.tree, self.__expression)
+
+
+def adaptive_condition(
+    condition: Condition, window: int = 1024, sample: int = 64, period: int = 256
+) -> Condition:
+    """
+    Returns a string condition that reorders its operands by how they
+    perform, or condition itself if it has no operands to reorder. The
+    current order is the tree of the returned condition's order attribute.
+    """
+    if getattr(condition, "tree", None) is None:
+        return condition
+    order = AdaptiveOrder(condition, window, period)
+    if not order.runs:
+        return condition
+
+    calls = count(1)
+
+    @wraps(condition)
+    def adaptive(record: RouteRecord) -> Any:
+        if not next(calls) % sample:
+            order.observe(record)
+        return order.condition(record)
+
+    adaptive.order = order
+    return adaptive
@@ -0,0 +1,343 @@
+"""
+Routing records on an asyncio event loop.
+
+Conditions and handlers may be coroutine functions, which are awaited;
+synchronous ones are called directly on the loop. Routes of equal
+priority are run together with asyncio.gather, and a semaphore, if one
+is given, bounds the number of handlers running at once. Batches are
+routed as route_records routes them, with the same failure isolation,
+deduplication, metrics, deadline, coalescing and phases around batch
+routes, whose handlers are synchronous.
+"""
+from __future__ import annotations
+
+import asyncio
+from functools import partial
+from itertools import groupby
+from operator import attrgetter
+from time import perf_counter_ns
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Optional,
+)
+
+from . import BatchResponse, FailureMode, Operation, Priorities, Route, record_key
+from .batch import batch_routes_for, coalescing
+from .failures import (
+    Unrouted,
+    batch_response,
+    exclude,
+    failure_key,
+    sequence_number,
+    stop_event,
+)
+from .phases import call_batch_route, phases
+from .record import Record, RouteRecord
+from .routing import candidates, event_id
+
+if TYPE_CHECKING:
+    from threading import Event
+
+    from .deadline import Deadline
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+Router = Callable[[], Awaitable[None]]
+
+
+async def route_record(
+    record: Record,
+    prepared: RouteRecord,
+    semaphore: Optional[asyncio.Semaphore],
+    metrics: Optional[MetricsSink],
+    dedup: Optional[DedupStore],
+    priorities: Priorities = None,
+    coalesce: bool = False,
+) -> None:
+    """
+    Routes record, which prepared wraps, awaiting its async conditions and
+    handlers, as routing.route_record routes it
+    """
+    start = perf_counter_ns()
+    operation = Operation[record["eventName"]]
+    event = event_id(record) if dedup else None
+    matches = []
+    for route in candidates(operation, prepared, priorities, coalesce):
+        condition_start = perf_counter_ns()
+        matched = bool(await route.match_async(prepared))
+        if metrics:
+            metrics.condition_evaluated(
+                route.dedup_key, perf_counter_ns() - condition_start, matched
+            )
+        if matched:
+            matches.append(route)
+    if event:
+        uncompleted = [
+            route for route in matches if not dedup.completed(route.dedup_key, event)
+        ]
+    else:
+        uncompleted = matches
+
+    async def call_route(route: Route) -> Any:
+        handler_start = perf_counter_ns()
+        failed = True
+        try:
+            result = await route.call_async(prepared)
+            failed = False
+        finally:
+            if metrics:
+                metrics.handler_completed(
+                    route.dedup_key, perf_counter_ns() - handler_start, failed
+                )
+        if event:
+            dedup.complete(route.dedup_key, event)
+        return result
+
+    async def call(route: Route) -> Any:
+        if not semaphore:
+            return await call_route(route)
+        async with semaphore:
+            return await call_route(route)
+
+    try:
+        for _, routes in groupby(uncompleted, key=attrgetter("_priority")):
+            routes = list(routes)
+            if len(routes) == 1:
+                await call(routes[0])
+            else:
+                await asyncio.gather(*(call(route) for route in routes))
+    finally:
+        if metrics:
+            metrics.record_completed(
+                operation.name,
+                perf_counter_ns() - start,
+                prepared.deserialization_ns,
+                len(matches),
+            )
+
+
+async def __route_wrapped(
+    record: Record,
+    immutable: bool,
+    semaphore: Optional[asyncio.Semaphore],
+    metrics: Optional[MetricsSink],
+    dedup: Optional[DedupStore],
+    names: dict[str, str],
+    coalesce: bool,
+) -> None:
+    # Wraps record only when it is routed, as routing.route_wrapped does
+    await route_record(
+        record,
+        RouteRecord(record, immutable, bool(metrics), names),
+        semaphore,
+        metrics,
+        dedup,
+        coalesce=coalesce,
+    )
+
+
+async def route_records(
+    records: list[Record],
+    immutable: bool,
+    parallel: bool,
+    max_concurrency: Optional[int],
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Optional[BatchResponse]:
+    """
+    Routes records as route_records_async does, and returns the response
+    for the records that were not routed if there is a failure_mode or a
+    deadline
+    """
+    start = perf_counter_ns()
+    try:
+        unrouted = await __route_records(
+            records,
+            immutable,
+            parallel,
+            max_concurrency,
+            metrics,
+            failure_mode,
+            dedup,
+            deadline,
+        )
+        return batch_response(unrouted) if failure_mode or deadline else None
+    finally:
+        if metrics:
+            metrics.batch_completed(len(records), perf_counter_ns() - start)
+
+
+async def __route_records(
+    records: list[Record],
+    immutable: bool,
+    parallel: bool,
+    max_concurrency: Optional[int],
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    # Net changes follow the records they were made from, as in batch
+    coalesced = len(records)
+    if coalescing():
+        from .coalesce import coalesce
+
+        records = records + coalesce(records)
+    batch_routes = batch_routes_for(records)
+    names: dict[str, str] = dict()
+    if not batch_routes:
+        return await __run_batch(
+            [
+                (
+                    row,
+                    record,
+                    partial(
+                        __route_wrapped,
+                        record,
+                        immutable,
+                        semaphore,
+                        metrics,
+                        dedup,
+                        names,
+                        row >= coalesced,
+                    ),
+                )
+                for row, record in enumerate(records)
+            ],
+            parallel,
+            failure_mode,
+            deadline,
+        )
+    prepared = [
+        RouteRecord(record, immutable=immutable, timed=bool(metrics), names=names)
+        for record in records
+    ]
+    unrouted: dict[int, Optional[str]] = dict()
+    for priorities, routes in phases(batch_routes, deadline):
+        if priorities:
+            exclude(
+                unrouted,
+                await __run_batch(
+                    [
+                        (
+                            row,
+                            record,
+                            partial(
+                                route_record,
+                                record,
+                                prepared[row],
+                                semaphore,
+                                metrics,
+                                dedup,
+                                priorities,
+                                row >= coalesced,
+                            ),
+                        )
+                        for row, record in enumerate(records)
+                        if row not in unrouted
+                    ],
+                    parallel,
+                    failure_mode,
+                    deadline,
+                ),
+                records,
+                failure_mode,
+            )
+        # Batch handlers are synchronous, and are called on the loop
+        for route in routes:
+            call_batch_route(
+                route,
+                batch_routes[route],
+                records,
+                prepared,
+                unrouted,
+                coalesced,
+                metrics,
+                failure_mode,
+                dedup,
+                deadline,
+            )
+    return list(unrouted.items())
+
+
+async def __run_batch(
+    routers: list[tuple[int, Record, Router]],
+    parallel: bool,
+    failure_mode: Optional[FailureMode],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    """
+    Awaits routers in order, or with parallel in partitions by their
+    records' Keys that run concurrently. Returns the records that were not
+    routed.
+    """
+    stop = stop_event(failure_mode)
+    if not parallel:
+        return await __run_routers(routers, failure_mode, stop, deadline)
+    partitions: dict[Hashable, list[tuple[int, Record, Router]]] = dict()
+    for row, record, router in routers:
+        partitions.setdefault(record_key(record), list()).append((row, record, router))
+    # Every partition runs to its end before an exception propagates, as
+    # the partitions in flight do when routing on an executor
+    results = await asyncio.gather(
+        *(
+            __run_routers(partition, failure_mode, stop, deadline)
+            for partition in partitions.values()
+        ),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return [unrouted for result in results for unrouted in result]
+
+
+async def __run_routers(
+    routers: Iterable[tuple[int, Record, Router]],
+    failure_mode: Optional[FailureMode],
+    stop: Optional[Event],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    """Awaits routers in order, as failures.run_routers calls them"""
+    if not (failure_mode or deadline):
+        for _, _, router in routers:
+            await router()
+        return list()
+    failed_keys: set[Hashable] = set()
+    unrouted: Unrouted = list()
+    for row, record, router in routers:
+        if (
+            (stop and stop.is_set())
+            or (failed_keys and failure_key(record) in failed_keys)
+            or (deadline and not deadline.start())
+        ):
+            unrouted.append((row, sequence_number(record)))
+            continue
+        start = perf_counter_ns()
+        try:
+            await router()
+        except Exception:
+            if not failure_mode:
+                raise
+            from logging import getLogger
+
+            getLogger(__name__).exception(
+                "Failed to route record %s", sequence_number(record)
+            )
+            unrouted.append((row, sequence_number(record)))
+            if stop:
+                stop.set()
+            else:
+                failed_keys.add(failure_key(record))
+        finally:
+            if deadline:
+                deadline.finished((perf_counter_ns() - start) / 1e9)
+    return unrouted
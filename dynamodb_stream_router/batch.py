@@ -0,0 +1,245 @@
+"""
+Routing the records of a batch.
+
+route_batch makes a router per record: one that evaluates the record's
+conditions when it is called, or, for columnar routing, one that routes
+it on conditions already evaluated for the whole batch (see columnar).
+run_batch calls the routers in order, or, given an executor, partitions
+them by their records' Keys and routes the partitions concurrently, each
+in order. When batch routes apply, the routers are called in phases
+around them instead (see phases).
+"""
+from __future__ import annotations
+
+from functools import partial
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Callable, Hashable, Optional
+
+from . import (
+    BatchResponse,
+    BatchRoute,
+    FailureMode,
+    Operation,
+    get_batch_routes,
+    get_route_plan,
+    record_key,
+)
+from .failures import (
+    Unrouted,
+    batch_response,
+    run_routers,
+    sequence_number,
+    stop_event,
+)
+from .record import Record, RouteRecord
+from .routing import route_record, route_wrapped
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+    from .deadline import Deadline
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+
+def route_batch(
+    records: list[Record],
+    executor: Optional[Executor],
+    immutable: bool,
+    parallel: bool,
+    max_in_flight: Optional[int],
+    metrics: Optional[MetricsSink],
+    columnar: bool,
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Optional[BatchResponse]:
+    """
+    Routes records as route_records does, and returns the response for the
+    records that were not routed if there is a failure_mode or a deadline
+    """
+    start = perf_counter_ns()
+    try:
+        unrouted = __route_batch(
+            records,
+            executor,
+            immutable,
+            parallel,
+            max_in_flight,
+            metrics,
+            columnar,
+            failure_mode,
+            dedup,
+            deadline,
+        )
+        return batch_response(unrouted) if failure_mode or deadline else None
+    finally:
+        if metrics:
+            metrics.batch_completed(len(records), perf_counter_ns() - start)
+
+
+def __route_batch(
+    records: list[Record],
+    executor: Optional[Executor],
+    immutable: bool,
+    parallel: bool,
+    max_in_flight: Optional[int],
+    metrics: Optional[MetricsSink],
+    columnar: bool,
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    if parallel and not executor:
+        raise ValueError("parallel routing requires an executor")
+    record_executor = None if parallel else executor
+    # Records from coalesced on are the net changes of records, which follow
+    # the records they were made from and are routed to the routes for them
+    coalesced = len(records)
+    if coalescing():
+        from .coalesce import coalesce
+
+        records = records + coalesce(records)
+    batch_routes = batch_routes_for(records)
+    # The attribute names of the batch's records, which they share
+    names: dict[str, str] = dict()
+    prepared: list[RouteRecord] = None
+    if columnar and not metrics:
+        from .columnar import columnar_routers
+
+        prepared = [
+            RouteRecord(record, immutable=immutable, names=names) for record in records
+        ]
+        routers = columnar_routers(records, prepared, record_executor, dedup, coalesced)
+    elif batch_routes:
+        prepared = [
+            RouteRecord(record, immutable=immutable, timed=bool(metrics), names=names)
+            for record in records
+        ]
+        routers = [
+            partial(
+                route_record,
+                record,
+                wrapped,
+                record_executor,
+                metrics,
+                dedup,
+                coalesce=row >= coalesced,
+            )
+            for row, (record, wrapped) in enumerate(zip(records, prepared))
+        ]
+    else:
+        routers = [
+            partial(
+                route_wrapped,
+                record,
+                record_executor,
+                immutable,
+                metrics,
+                dedup,
+                names,
+                row >= coalesced,
+            )
+            for row, record in enumerate(records)
+        ]
+    executor = executor if parallel else None
+    if batch_routes:
+        from .phases import route_phases
+
+        return route_phases(
+            records,
+            prepared,
+            routers,
+            batch_routes,
+            coalesced,
+            executor,
+            max_in_flight,
+            metrics,
+            failure_mode,
+            dedup,
+            deadline,
+        )
+    return run_batch(
+        list(zip(range(len(records)), records, routers)),
+        executor,
+        max_in_flight,
+        failure_mode,
+        deadline,
+    )
+
+
+def run_batch(
+    routers: list[tuple[int, Record, Callable[[], None]]],
+    executor: Optional[Executor],
+    max_in_flight: Optional[int],
+    failure_mode: Optional[FailureMode],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    """
+    Calls routers in order, or with executor in partitions by their
+    records' Keys. Returns the records that were not routed.
+    """
+    stop = stop_event(failure_mode)
+    if not executor:
+        return run_routers(routers, failure_mode, stop, deadline)
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    partitions: dict[Hashable, list[tuple[int, Record, Callable[[], None]]]] = dict()
+    for row, record, router in routers:
+        partitions.setdefault(record_key(record), list()).append((row, record, router))
+    pending = list(partitions.values())
+    pending.reverse()
+    in_flight: set[Future] = set()
+    error: BaseException = None
+    unrouted: Unrouted = list()
+    while pending or in_flight:
+        while (
+            pending
+            and not error
+            and not (stop and stop.is_set())
+            and (not max_in_flight or len(in_flight) < max_in_flight)
+            and (not deadline or deadline.start())
+        ):
+            in_flight.add(
+                executor.submit(
+                    run_routers, pending.pop(), failure_mode, stop, deadline
+                )
+            )
+        if not in_flight:
+            break
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            if not error and future.exception():
+                error = future.exception()
+            elif not future.exception():
+                unrouted += future.result()
+    if error:
+        raise error
+    # Partitions that were never submitted because routing stopped
+    unrouted += (
+        (row, sequence_number(record))
+        for partition in pending
+        for row, record, _ in partition
+    )
+    return unrouted
+
+
+def coalescing() -> bool:
+    """True if any route is routed net changes"""
+    return any(
+        get_route_plan(operation, True)
+        or any(route.coalesce for route in get_batch_routes(operation))
+        for operation in Operation
+    )
+
+
+def batch_routes_for(records: list[Record]) -> dict[BatchRoute, set[Operation]]:
+    """Returns the batch routes for the operations of records"""
+    if not any(map(get_batch_routes, Operation)):
+        return dict()
+    batch_routes: dict[BatchRoute, set[Operation]] = dict()
+    for event_name in {record.get("eventName") for record in records}:
+        operation = Operation.__members__.get(event_name)
+        for route in get_batch_routes(operation) if operation else ():
+            batch_routes.setdefault(route, set()).add(operation)
+    return batch_routes
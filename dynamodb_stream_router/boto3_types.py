@@ -0,0 +1,41 @@
+"""
+Types built on boto3.dynamodb.types. Importing boto3 takes longer than
+importing the rest of the package, so this module is only imported once
+one of these types is needed, usually for the first binary value.
+"""
+from __future__ import annotations
+
+from base64 import b64decode
+from typing import Union
+
+from boto3.dynamodb.types import Binary, TypeDeserializer
+
+
+class StreamTypeDeserializer(TypeDeserializer):
+    def _deserialize_b(self, value):
+        if isinstance(value, str):
+            value = b64decode(value)
+        return super()._deserialize_b(value)
+
+
+class LazyBinary(Binary):
+    """
+    A Binary whose base64 encoded value is only decoded when it is first
+    read. Equal to, and hashes the same as, the equivalent Binary.
+    """
+
+    def __init__(self, value: Union[str, bytes, bytearray]) -> None:
+        self.__encoded = value if isinstance(value, str) else None
+        self.__value = None if isinstance(value, str) else value
+
+    @property
+    def value(self) -> bytes:
+        if self.__value is None:
+            self.__value = b64decode(self.__encoded)
+            self.__encoded = None
+        return self.__value
+
+    @value.setter
+    def value(self, value: bytes) -> None:
+        self.__encoded = None
+        self.__value = value
@@ -0,0 +1,85 @@
+"""
+Coalescing the records of a batch into their net changes.
+
+A hot item often has several records in a batch, such as an INSERT and
+then some MODIFYs. Routes registered with coalesce=True are not routed
+the records of a batch but one record per item with the net change of
+its records: the OldImage of its first record, the NewImage of its last
+and the operation that takes the one to the other. Records are grouped by
+their Keys, and stream order only matters within an item, so records of
+other items in between do not split a group.
+
+net(first, last) is INSERT if the item did not exist before the group and
+does after it, MODIFY if it did both, REMOVE if it stopped existing, and
+None, for which there is no net change, if it only existed in between.
+"""
+from __future__ import annotations
+
+from typing import Hashable, Optional
+
+from . import Operation, record_key
+from .record import Record
+
+# The event names after which the item exists, and before which it existed
+EXISTS_AFTER = frozenset({"INSERT", "MODIFY"})
+EXISTED_BEFORE = frozenset({"MODIFY", "REMOVE"})
+
+
+def net(first: str, last: str) -> Optional[str]:
+    """Returns the event name of the net change from first to last"""
+    before, after = first in EXISTED_BEFORE, last in EXISTS_AFTER
+    if after:
+        return "MODIFY" if before else "INSERT"
+    return "REMOVE" if before else None
+
+
+def merge(first: Record, last: Record) -> Optional[Record]:
+    """
+    Returns a record with the net change from first to last, which has the
+    eventID of last and the SequenceNumber of first, or None if there is no
+    net change
+    """
+    event_name = net(first["eventName"], last["eventName"])
+    if event_name is None:
+        return None
+    dynamodb = {
+        key: value
+        for key, value in last["dynamodb"].items()
+        if key not in ("NewImage", "OldImage")
+    }
+    if event_name != "INSERT" and "OldImage" in first["dynamodb"]:
+        dynamodb["OldImage"] = first["dynamodb"]["OldImage"]
+    if event_name != "REMOVE" and "NewImage" in last["dynamodb"]:
+        dynamodb["NewImage"] = last["dynamodb"]["NewImage"]
+    # A failure reports the first record, so that it and the rest of the
+    # group are delivered again
+    if "SequenceNumber" in first["dynamodb"]:
+        dynamodb["SequenceNumber"] = first["dynamodb"]["SequenceNumber"]
+    return {**last, "eventName": event_name, "dynamodb": dynamodb}
+
+
+def coalesce(records: list[Record]) -> list[Record]:
+    """
+    Returns a record with the net change of each item in records, in the
+    order of the item's last record. A record that is the only one for its
+    item is returned as it is. Records that are not INSERT, MODIFY or REMOVE
+    are left out.
+    """
+    groups: dict[Hashable, tuple[Record, Record]] = dict()
+    for record in records:
+        if record.get("eventName") not in Operation.__members__:
+            continue
+        try:
+            key = record_key(record)
+        except Exception:
+            # Routing the record itself raises as well
+            continue
+        # Moving the group to the end keeps groups in order of their last record
+        first = groups.pop(key, (record,))[0]
+        groups[key] = (first, record)
+    coalesced: list[Record] = list()
+    for first, last in groups.values():
+        record = last if first is last else merge(first, last)
+        if record is not None:
+            coalesced.append(record)
+    return coalesced
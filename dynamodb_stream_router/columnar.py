@@ -0,0 +1,580 @@
+"""
+Columnar evaluation of string conditions over a batch of records.
+
+Instead of calling every route's condition once per record, a ColumnarPlan
+reads each path the conditions refer to once per record into a column, and
+evaluates each condition over whole columns. Comparisons, IN, BETWEEN,
+functions and boolean operators run as C level loops (map) over the
+columns, and comparisons of numbers against numeric literals are
+vectorized with NumPy when it is installed.
+
+Results are exactly those of evaluating the conditions record by record:
+AND and OR only evaluate their right operand for the rows that need it,
+and a row whose evaluation raises is not decided. Its condition is
+evaluated again when the record is routed, which raises the exception at
+the point where the record by record router would have raised it.
+
+columnar_routers evaluates a batch this way and returns a router per
+record, which calls its routes on the results when the record is routed.
+"""
+from __future__ import annotations
+
+import operator
+import re
+from decimal import Decimal
+from functools import cache, partial, singledispatch
+from itertools import compress
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
+
+from .conditions.functions import FUNCTIONS, has_changed
+from .conditions.nodes import (
+    And,
+    Attribute,
+    Between,
+    Changed,
+    Compare,
+    Const,
+    Function,
+    In,
+    Index,
+    Match,
+    Node,
+    Not,
+    PATH_NODES,
+    Or,
+    Path,
+    Root,
+    path_of,
+)
+from . import Operation, Priorities, get_columnar_plan, get_route_index
+from .record import Record, RouteRecord
+from .routing import call_routes, event_id, route_record
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from . import Route, RoutePlan
+    from .dedup import DedupStore
+    from .index import RouteIndex
+
+# (plan position, route, whether its condition must still be evaluated)
+Entry = tuple[int, "Route", bool]
+Program = Callable[["Columns", Sequence[int], set[int]], list]
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+# The operator that gives the same result with its operands swapped
+SWAPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+@cache
+def numpy() -> Any:
+    """Returns numpy, or None if it is not installed"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class Columns:
+    """The values at each path of a batch of records, read on first use"""
+
+    def __init__(self, records: Sequence[RouteRecord]) -> None:
+        self.memo: dict[Node, tuple[list, set[int]]] = dict()
+        self.records = records
+        self.__failures: dict[tuple[str, Path], set[int]] = dict()
+        self.__numeric: dict[tuple[str, Path], Any] = dict()
+        self.__values: dict[tuple[str, Path], list] = dict()
+
+    def numeric(self, path: tuple[str, Path]) -> Optional[tuple[Any, Any]]:
+        """
+        Returns the column at path as a NumPy float array and a mask of the
+        rows where it is missing (None), or None if NumPy is not installed
+        or the column holds anything other than numbers that floats
+        represent exactly
+        """
+        if path not in self.__numeric:
+            self.__numeric[path] = self.__to_numeric(path)
+        return self.__numeric[path]
+
+    def values(self, path: tuple[str, Path]) -> tuple[list, set[int]]:
+        """Returns the column at path and the rows where reading it raised"""
+        if path not in self.__values:
+            name, steps = path
+            failures = set()
+            try:
+                values = [record._path(name, steps) for record in self.records]
+            except Exception:
+                values = list()
+                for row, record in enumerate(self.records):
+                    try:
+                        values.append(record._path(name, steps))
+                    except Exception:
+                        failures.add(row)
+                        values.append(None)
+            self.__failures[path] = failures
+            self.__values[path] = values
+        return self.__values[path], self.__failures[path]
+
+    def __to_numeric(self, path: tuple[str, Path]) -> Optional[tuple[Any, Any]]:
+        np = numpy()
+        if not np:
+            return None
+        values, failures = self.values(path)
+        if failures:
+            return None
+        floats = list()
+        for value in values:
+            if value is None:
+                floats.append(0.0)
+                continue
+            if value.__class__ is not Decimal or value.is_nan():
+                return None
+            number = float(value)
+            # Decimal and float compare exactly, so this rejects rounding
+            if number != value:
+                return None
+            floats.append(number)
+        return (
+            np.array(floats, dtype=np.float64),
+            np.array([value is None for value in values], dtype=bool),
+        )
+
+
+def exact_float(value: Any) -> Optional[float]:
+    """Returns value as a float if it is a number that a float equals"""
+    if value.__class__ not in (int, float, bool, Decimal):
+        return None
+    try:
+        number = float(value)
+    except (OverflowError, ValueError):
+        return None
+    return number if number == value else None
+
+
+def map_rows(function: Callable, rows: Sequence[int], failed: set[int], *args) -> list:
+    """
+    Returns function applied to every row of the argument columns. Rows for
+    which function raises are added to failed.
+    """
+    try:
+        return list(map(function, *args))
+    except Exception:
+        pass
+    results = list()
+    for row, values in zip(rows, zip(*args)):
+        try:
+            results.append(function(*values))
+        except Exception:
+            failed.add(row)
+            results.append(None)
+    return results
+
+
+def select(array: Any, rows: Sequence[int]) -> list:
+    return (array if len(rows) == len(array) else array[list(rows)]).tolist()
+
+
+def compile_program(node: Node) -> Optional[Program]:
+    """
+    Returns a program that evaluates node for some rows of a batch, or None
+    if node cannot be evaluated in columns. Programs for whole batches are
+    memoized by node, so that routes share equal subexpressions.
+    """
+    program = _program(node)
+    if not program or isinstance(node, (Const, *PATH_NODES)):
+        return program
+
+    def memoized(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        if len(rows) != len(columns.records):
+            return program(columns, rows, failed)
+        if node not in columns.memo:
+            node_failed: set[int] = set()
+            columns.memo[node] = (program(columns, rows, node_failed), node_failed)
+        values, node_failed = columns.memo[node]
+        failed.update(node_failed)
+        return values
+
+    return memoized
+
+
+@singledispatch
+def _program(node: Node) -> Optional[Program]:
+    return None
+
+
+@_program.register
+def _(node: Const) -> Program:
+    value = node.value
+    return lambda columns, rows, failed: [value] * len(rows)
+
+
+@_program.register(Root)
+@_program.register(Attribute)
+@_program.register(Index)
+def _(node: Node) -> Optional[Program]:
+    path = path_of(node)
+    if not path or not path[1]:
+        return None
+
+    def program(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        values, failures = columns.values(path)
+        if failures:
+            failed.update(failures.intersection(rows))
+        return (
+            values if len(rows) == len(values) else list(map(values.__getitem__, rows))
+        )
+
+    return program
+
+
+def numeric_operand(
+    node: Node, constants: Sequence[Node]
+) -> Optional[tuple[tuple[str, Path], list[float]]]:
+    """
+    Returns the path of node and the constants as floats if node is a path
+    and every constant is a number that a float represents exactly
+    """
+    path = path_of(node)
+    if not path or not path[1] or not all(isinstance(c, Const) for c in constants):
+        return None
+    numbers = [exact_float(constant.value) for constant in constants]
+    return None if None in numbers else (path, numbers)
+
+
+@_program.register
+def _(node: Compare) -> Optional[Program]:
+    left, right = compile_program(node.left), compile_program(node.right)
+    if not (left and right):
+        return None
+    function = OPERATORS[node.op]
+    op, numeric = node.op, numeric_operand(node.left, (node.right,))
+    if not numeric:
+        op, numeric = SWAPPED[node.op], numeric_operand(node.right, (node.left,))
+
+    def program(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        if numeric and (array := columns.numeric(numeric[0])):
+            floats, missing = array
+            result = OPERATORS[op](floats, numeric[1][0])
+            if missing.any():
+                # None equals no number and cannot be ordered against one
+                if op == "==":
+                    result &= ~missing
+                elif op == "!=":
+                    result |= missing
+                else:
+                    failed.update(compress(rows, select(missing, rows)))
+            return select(result, rows)
+        return map_rows(
+            function,
+            rows,
+            failed,
+            left(columns, rows, failed),
+            right(columns, rows, failed),
+        )
+
+    return program
+
+
+@_program.register
+def _(node: Between) -> Optional[Program]:
+    operand = compile_program(node.operand)
+    low, high = compile_program(node.low), compile_program(node.high)
+    if not (operand and low and high):
+        return None
+    numeric = numeric_operand(node.operand, (node.low, node.high))
+
+    def program(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        if numeric and (array := columns.numeric(numeric[0])):
+            floats, missing = array
+            (low_value, high_value) = numeric[1]
+            failed.update(compress(rows, select(missing, rows)))
+            return select((low_value <= floats) & (floats <= high_value), rows)
+        return map_rows(
+            lambda value, low, high: low <= value <= high,
+            rows,
+            failed,
+            operand(columns, rows, failed),
+            low(columns, rows, failed),
+            high(columns, rows, failed),
+        )
+
+    return program
+
+
+@_program.register
+def _(node: In) -> Optional[Program]:
+    operand = compile_program(node.operand)
+    items = [compile_program(item) for item in node.items]
+    if not operand or None in items:
+        return None
+    path = path_of(node.operand)
+    constants = (
+        tuple(item.value for item in node.items)
+        if all(isinstance(item, Const) for item in node.items)
+        else None
+    )
+    numbers = None
+    if constants is not None:
+        # Strings never equal numbers, and None is handled as missing
+        numbers = [
+            exact_float(value)
+            for value in constants
+            if value is not None and value.__class__ is not str
+        ]
+        if None in numbers:
+            numbers = None
+    missing_in = constants is not None and None in constants
+
+    def program(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        if (
+            numbers is not None
+            and path
+            and path[1]
+            and (array := columns.numeric(path))
+        ):
+            floats, missing = array
+            result = numpy().isin(floats, numbers) & ~missing
+            if missing_in:
+                result |= missing
+            return select(result, rows)
+        values = operand(columns, rows, failed)
+        if constants is not None:
+            return map_rows(constants.__contains__, rows, failed, values)
+        return map_rows(
+            lambda value, *items: value in items,
+            rows,
+            failed,
+            values,
+            *(item(columns, rows, failed) for item in items),
+        )
+
+    return program
+
+
+@_program.register
+def _(node: Match) -> Optional[Program]:
+    operand, regex = compile_program(node.operand), compile_program(node.regex)
+    if not (operand and regex):
+        return None
+    return lambda columns, rows, failed: map_rows(
+        lambda regex, value: bool(re.match(regex, value)),
+        rows,
+        failed,
+        regex(columns, rows, failed),
+        operand(columns, rows, failed),
+    )
+
+
+@_program.register
+def _(node: And) -> Optional[Program]:
+    return boolean(node, True)
+
+
+@_program.register
+def _(node: Or) -> Optional[Program]:
+    return boolean(node, False)
+
+
+def boolean(node: And | Or, evaluate_right_when: bool) -> Optional[Program]:
+    left, right = compile_program(node.left), compile_program(node.right)
+    if not (left and right):
+        return None
+
+    def program(columns: Columns, rows: Sequence[int], failed: set[int]) -> list:
+        values = list(left(columns, rows, failed))
+        truth = map_rows(bool, rows, failed, values)
+        if not evaluate_right_when:
+            truth = map_rows(operator.not_, rows, failed, truth)
+        positions = list(compress(range(len(rows)), truth))
+        if failed:
+            positions = [
+                position for position in positions if rows[position] not in failed
+            ]
+        if positions:
+            right_rows = (
+                positions
+                if isinstance(rows, range)
+                else list(map(rows.__getitem__, positions))
+            )
+            for position, value in zip(positions, right(columns, right_rows, failed)):
+                values[position] = value
+        return values
+
+    return program
+
+
+@_program.register
+def _(node: Not) -> Optional[Program]:
+    operand = compile_program(node.operand)
+    if not operand:
+        return None
+    return lambda columns, rows, failed: map_rows(
+        operator.not_, rows, failed, operand(columns, rows, failed)
+    )
+
+
+@_program.register
+def _(node: Function) -> Optional[Program]:
+    args = [compile_program(arg) for arg in node.args]
+    if None in args or node.name not in FUNCTIONS:
+        return None
+    function = FUNCTIONS[node.name]
+    if (
+        node.name == "begins_with"
+        and isinstance(node.args[1], Const)
+        and node.args[1].value.__class__ is str
+    ):
+        value, prefix = args[0], node.args[1].value
+        return lambda columns, rows, failed: [
+            isinstance(item, str) and item.startswith(prefix)
+            for item in value(columns, rows, failed)
+        ]
+    return lambda columns, rows, failed: map_rows(
+        function, rows, failed, *(arg(columns, rows, failed) for arg in args)
+    )
+
+
+@_program.register
+def _(node: Changed) -> Program:
+    keys = node.keys
+    return lambda columns, rows, failed: map_rows(
+        lambda record: has_changed(record, keys),
+        rows,
+        failed,
+        [columns.records[row] for row in rows],
+    )
+
+
+class ColumnarPlan:
+    """The routes of a route plan, with programs for their string conditions"""
+
+    def __init__(self, plan: RoutePlan) -> None:
+        routes = [route for tier in plan for route in tier]
+        self.__positions = {route: position for position, route in enumerate(routes)}
+        self.__programs: list[tuple[int, Route, Program]] = list()
+        unvectorized = list()
+        for position, route in enumerate(routes):
+            tree = getattr(route._condition, "tree", None)
+            program = (
+                compile_program(tree)
+                if tree is not None and not route.is_async
+                else None
+            )
+            if program:
+                self.__programs.append((position, route, program))
+            else:
+                unvectorized.append(route)
+        self.__unvectorized = frozenset(unvectorized)
+
+    @property
+    def vectorized(self) -> tuple[Route, ...]:
+        return tuple(route for _, route, _ in self.__programs)
+
+    def entries(
+        self, records: Sequence[RouteRecord], index: RouteIndex
+    ) -> list[list[Entry]]:
+        """
+        Returns, for every record, the routes that matched it or whose
+        conditions still have to be evaluated for it, in plan order
+        """
+        columns = Columns(records)
+        rows = range(len(records))
+        entries: list[list[Entry]] = [list() for _ in rows]
+        for position, route, program in self.__programs:
+            failed: set[int] = set()
+            values = program(columns, rows, failed)
+            try:
+                matched = list(compress(rows, values))
+            except Exception:
+                matched = list(compress(rows, map_rows(bool, rows, failed, values)))
+            if failed:
+                matched = [row for row in matched if row not in failed]
+                for row in failed:
+                    entries[row].append((position, route, True))
+            entry = (position, route, False)
+            for row in matched:
+                entries[row].append(entry)
+        if self.__unvectorized:
+            positions = self.__positions
+            for row, record in enumerate(records):
+                others = [
+                    (positions[route], route, True)
+                    for route in index.candidates(record)
+                    if route in self.__unvectorized
+                ]
+                if others:
+                    entries[row].extend(others)
+                    entries[row].sort(key=operator.itemgetter(0))
+        return entries
+
+
+def columnar_routers(
+    records: list[Record],
+    prepared: list[RouteRecord],
+    executor: Optional[Executor],
+    dedup: Optional[DedupStore],
+    coalesced: int,
+) -> list[Callable[..., None]]:
+    """
+    Evaluates the string conditions of every route for records in columns,
+    and returns a function per record that routes it on the results. The
+    records from coalesced on are net changes.
+    """
+    routers: list[Callable[..., None]] = [None] * len(records)
+    rows: dict[tuple[Operation, bool], list[int]] = dict()
+    for row, record in enumerate(records):
+        operation = Operation.__members__.get(record.get("eventName"))
+        if operation:
+            rows.setdefault((operation, row >= coalesced), list()).append(row)
+        else:
+            # Raises when the record is routed, as route_record would
+            routers[row] = partial(
+                route_record, record, prepared[row], executor, None, dedup
+            )
+    for (operation, coalesce), operation_rows in rows.items():
+        batch = [prepared[row] for row in operation_rows]
+        entries = get_columnar_plan(operation, coalesce).entries(
+            batch, get_route_index(operation, coalesce)
+        )
+        for row, record, record_entries in zip(operation_rows, batch, entries):
+            routers[row] = partial(
+                __route_entries,
+                record,
+                record_entries,
+                executor,
+                dedup,
+                event_id(records[row]) if dedup else None,
+            )
+    return routers
+
+
+def __route_entries(
+    record: RouteRecord,
+    entries: list[Entry],
+    executor: Optional[Executor],
+    dedup: Optional[DedupStore],
+    event: Optional[str],
+    priorities: Priorities = None,
+) -> None:
+    if priorities:
+        low, high = priorities
+        entries = [entry for entry in entries if low < entry[1]._priority <= high]
+    call_routes(
+        [
+            route
+            for _, route, evaluate in entries
+            if not evaluate or route.match(record)
+        ],
+        record,
+        executor,
+        dedup,
+        event,
+    )
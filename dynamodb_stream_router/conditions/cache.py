@@ -0,0 +1,257 @@
+"""
+Ahead of time compiled string conditions.
+
+dump() parses and compiles string conditions at build time and writes
+them, with their expression trees, to a file. ConditionCache.load() reads
+that file at runtime, so that conditions can be created without lexing or
+parsing, and without loading the parser at all. Conditions are keyed by
+the SHA-256 of their expression and only unmarshalled when first asked
+for, so one file can hold the conditions of many services.
+
+The file is written with marshal: the code of each condition, and its
+tree and constants as plain data (see encode). Nothing in it is unpickled,
+but its code is run, so only load files that you built yourself. A file
+is stale, and ignored, when it was written by a different Python version
+or a different version of this package (see stamp).
+
+Write the conditions registered by your route modules with
+
+    python -m dynamodb_stream_router.conditions.cache -o conditions.cache my.routes
+"""
+from __future__ import annotations
+
+import marshal
+import re
+import sys
+import warnings
+from dataclasses import fields
+from decimal import Decimal
+from hashlib import sha256
+from os import PathLike
+from typing import Any, Iterable, Optional, Union
+
+from .. import __version__
+from . import Condition
+from .compiler import SHARED, Slot, generate_source, load_condition
+from .nodes import Node, referenced_paths
+
+FORMAT = 2
+
+# The source_stamp() of the code that compiled conditions depend on.
+# Regenerate it with
+#   python -m dynamodb_stream_router.conditions.cache --stamp
+# whenever that code changes between releases
+CODE_STAMP = "5856f266cfc6e30fcae7fa83da11fdb9873a5f830e4cd21207a272b39ea223e5"
+
+# The modules that source_stamp() covers, relative to the package
+STAMPED = (
+    "conditions/__init__.py",
+    "conditions/closures.py",
+    "conditions/compiler.py",
+    "conditions/functions.py",
+    "conditions/lexer.py",
+    "conditions/nodes.py",
+    "conditions/optimizer.py",
+    "conditions/parser.py",
+    "record.py",
+)
+
+NODES = {node.__name__: node for node in Node.__subclasses__()}
+
+Entry = tuple[str, bytes, bytes]
+
+
+def digest(expression: str) -> str:
+    return sha256(expression.encode()).hexdigest()
+
+
+def stamp() -> str:
+    """
+    Identifies the Python version and the code that compiled conditions
+    depend on; a cache written under another stamp is stale
+    """
+    return f"{__version__}:{FORMAT}:{CODE_STAMP}:{sys.implementation.cache_tag}"
+
+
+def source_stamp() -> str:
+    """
+    Returns the hash of the syntax trees of the STAMPED modules, which
+    reformatting them does not change. Only used to generate CODE_STAMP.
+    """
+    from ast import dump, parse
+    from pathlib import Path
+
+    package = Path(__file__).resolve().parent.parent
+    result = sha256()
+    with warnings.catch_warnings():
+        # Such as the invalid escape sequences of the lexer's patterns
+        warnings.simplefilter("ignore")
+        for name in STAMPED:
+            result.update(dump(parse((package / name).read_text())).encode())
+    return result.hexdigest()
+
+
+def encode(value: Any) -> Any:
+    """
+    Returns value, a tree, a constant of one or the paths of one, as data
+    that marshal can write. Values that marshal cannot write, and sets,
+    which cannot hold lists, are written as lists that start with a tag.
+    """
+    if isinstance(value, Node):
+        return [
+            value.__class__.__name__,
+            *(encode(getattr(value, field.name)) for field in fields(value)),
+        ]
+    if isinstance(value, Slot):
+        return ["Slot", encode(value.node)]
+    if isinstance(value, Decimal):
+        return ["Decimal", str(value)]
+    if isinstance(value, re.Pattern):
+        return ["Pattern", value.pattern, value.flags]
+    if isinstance(value, frozenset):
+        return ["frozenset", *map(encode, value)]
+    if isinstance(value, tuple):
+        return tuple(map(encode, value))
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    return value
+
+
+def decode(value: Any) -> Any:
+    """Returns the value that encode() returned value for"""
+    if isinstance(value, list):
+        tag, *args = value
+        if tag == "Slot":
+            return Slot(decode(args[0]))
+        if tag == "Decimal":
+            return Decimal(args[0])
+        if tag == "Pattern":
+            return re.compile(*args)
+        if tag == "frozenset":
+            return frozenset(map(decode, args))
+        return NODES[tag](*map(decode, args))
+    if isinstance(value, tuple):
+        return tuple(map(decode, value))
+    if isinstance(value, dict):
+        return {key: decode(item) for key, item in value.items()}
+    return value
+
+
+class ConditionCache:
+    def __init__(self, entries: dict[str, Entry] = None) -> None:
+        self.__conditions: dict[str, Condition] = dict()
+        self.__entries = entries or dict()
+
+    def __contains__(self, expression: str) -> bool:
+        return digest(expression) in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, expression: str) -> Optional[Condition]:
+        """Returns the condition for expression, or None if it is not cached"""
+        if expression in self.__conditions:
+            return self.__conditions[expression]
+        entry = self.__entries.get(digest(expression))
+        if not entry or entry[0] != expression:
+            return None
+        _, code, payload = entry
+        constants, source, tree, paths = decode(marshal.loads(payload))
+        condition = self.__conditions[expression] = load_condition(
+            marshal.loads(code), constants, source, tree, expression, paths
+        )
+        SHARED.register(condition)
+        return condition
+
+    @classmethod
+    def load(cls, file: Union[str, PathLike]) -> ConditionCache:
+        """
+        Returns the conditions written to file by dump(). If file does not
+        exist, or is stale, the cache is empty.
+        """
+        try:
+            with open(file, "rb") as f:
+                cache = marshal.load(f)
+        except FileNotFoundError:
+            return cls()
+        except (EOFError, TypeError, ValueError):
+            # Not written by marshal, such as the pickles of earlier versions
+            cache = None
+        if not isinstance(cache, dict) or cache.get("stamp") != stamp():
+            warnings.warn(
+                f"Ignoring stale condition cache {file}; rebuild it with this version",
+                RuntimeWarning,
+            )
+            return cls()
+        return cls(cache["conditions"])
+
+
+def dump(expressions: Iterable[str], file: Union[str, PathLike]) -> int:
+    """
+    Compiles expressions and writes them to file. Returns the number of
+    conditions written.
+    """
+    from .parser import ExpressionParser
+
+    parser = ExpressionParser()
+    entries: dict[str, Entry] = dict()
+    expressions = list(expressions)
+    # Registering every condition first shares their sub-expressions
+    for expression in expressions:
+        parser.parse(expression)
+    for expression in expressions:
+        tree = parser.parse_tree(expression)
+        source, constants = generate_source(tree)
+        code = compile(source, f"<condition {expression}>", "exec")
+        entries[digest(expression)] = (
+            expression,
+            marshal.dumps(code),
+            marshal.dumps(encode((constants, source, tree, referenced_paths(tree)))),
+        )
+    with open(file, "wb") as f:
+        marshal.dump(dict(format=FORMAT, stamp=stamp(), conditions=entries), f)
+    return len(entries)
+
+
+def registered_expressions() -> list[str]:
+    """Returns the expressions of the string conditions of every route"""
+    from .. import Operation, get_routes
+
+    return sorted(
+        {
+            route._condition.expression
+            for operation in Operation
+            for route in get_routes(operation)
+            if getattr(route._condition, "expression", None)
+        }
+    )
+
+
+def main() -> None:
+    from argparse import ArgumentParser
+    from importlib import import_module
+
+    parser = ArgumentParser(
+        prog="python -m dynamodb_stream_router.conditions.cache",
+        description="Writes the string conditions registered by modules to a file",
+    )
+    parser.add_argument("modules", nargs="*", help="modules that register routes")
+    parser.add_argument("-o", "--output", default="conditions.cache")
+    parser.add_argument(
+        "--stamp", action="store_true", help="print the CODE_STAMP of the sources"
+    )
+    args = parser.parse_args()
+    if args.stamp:
+        print(source_stamp())
+        return
+    if not args.modules:
+        parser.error("the following arguments are required: modules")
+    sys.path.insert(0, "")
+    for module in args.modules:
+        import_module(module)
+    count = dump(registered_expressions(), args.output)
+    print(f"Wrote {count} conditions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+The reference backend, which turns an expression tree into a tree of
+closures. It is simple to follow, which makes it the yardstick the
+compiled backend is checked against.
+"""
+from __future__ import annotations
+
+import operator
+import re
+from functools import singledispatch
+
+from . import Condition
+from .functions import FUNCTIONS, has_changed
+from .nodes import (
+    And,
+    Attribute,
+    Between,
+    Changed,
+    Compare,
+    Const,
+    Function,
+    In,
+    Index,
+    Match,
+    Node,
+    Not,
+    Or,
+    Root,
+)
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+@singledispatch
+def build_condition(node: Node) -> Condition:
+    raise TypeError(f"Unknown expression node {node!r}")
+
+
+@build_condition.register
+def _(node: Const) -> Condition:
+    value = node.value
+    return lambda m: value
+
+
+@build_condition.register
+def _(node: Root) -> Condition:
+    name = node.name
+    return lambda m: m._image(name)
+
+
+@build_condition.register
+def _(node: Attribute) -> Condition:
+    path = build_condition(node.path)
+    name = node.name
+    return lambda m: path(m).get(name) if isinstance(path(m), dict) else None
+
+
+@build_condition.register
+def _(node: Index) -> Condition:
+    path = build_condition(node.path)
+    index = node.index
+    return (
+        lambda m: path(m)[index]
+        if isinstance(path(m), list) and len(path(m)) > index
+        else None
+    )
+
+
+@build_condition.register
+def _(node: Compare) -> Condition:
+    compare = COMPARISONS[node.op]
+    left = build_condition(node.left)
+    right = build_condition(node.right)
+    return lambda m: compare(left(m), right(m))
+
+
+@build_condition.register
+def _(node: Between) -> Condition:
+    operand = build_condition(node.operand)
+    low = build_condition(node.low)
+    high = build_condition(node.high)
+    return lambda m: low(m) <= operand(m) <= high(m)
+
+
+@build_condition.register
+def _(node: In) -> Condition:
+    operand = build_condition(node.operand)
+    items = [build_condition(item) for item in node.items]
+    return lambda m: operand(m) in [item(m) for item in items]
+
+
+@build_condition.register
+def _(node: Match) -> Condition:
+    operand = build_condition(node.operand)
+    regex = build_condition(node.regex)
+    return lambda m: bool(re.match(regex(m), operand(m)))
+
+
+@build_condition.register
+def _(node: And) -> Condition:
+    left = build_condition(node.left)
+    right = build_condition(node.right)
+    return lambda m: left(m) and right(m)
+
+
+@build_condition.register
+def _(node: Or) -> Condition:
+    left = build_condition(node.left)
+    right = build_condition(node.right)
+    return lambda m: left(m) or right(m)
+
+
+@build_condition.register
+def _(node: Not) -> Condition:
+    operand = build_condition(node.operand)
+    return lambda m: not operand(m)
+
+
+@build_condition.register
+def _(node: Function) -> Condition:
+    function = FUNCTIONS[node.name]
+    args = [build_condition(arg) for arg in node.args]
+    return lambda m: function(*[arg(m) for arg in args])
+
+
+@build_condition.register
+def _(node: Changed) -> Condition:
+    keys = node.keys
+    return lambda m: has_changed(m, keys)
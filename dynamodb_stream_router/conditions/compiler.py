@@ -0,0 +1,361 @@
+"""
+Compiles an expression tree into a single Python function.
+
+The generated function binds every path to a local the first time it is
+needed on an execution path, so $NEW.a.b.c is looked up once no matter how
+often the expression refers to it. Paths into $NEW, $OLD and $KEYS are read
+with RouteRecord._path, which deserializes only the value at the path. AND and OR
+are emitted as if-blocks so that short-circuiting, evaluation order and the
+returned values are the same as the closure backend's.
+
+Sub-expressions that occur more than once among the registered
+conditions, such as $NEW.tenant == 'x' or from_json($NEW.payload), are
+shared (see SharedExpressions): each has a slot in the record's memo,
+RouteRecord._memo, so it is evaluated at most once per record whichever
+conditions need it.
+"""
+from __future__ import annotations
+
+import linecache
+import re
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import singledispatchmethod
+from itertools import count
+from types import CodeType
+from typing import Any, Iterator, Optional
+from weakref import WeakSet
+
+from . import Condition
+from .functions import FUNCTIONS, has_changed
+from .nodes import (
+    And,
+    Attribute,
+    Between,
+    Changed,
+    Compare,
+    Const,
+    Function,
+    In,
+    Index,
+    Match,
+    Node,
+    Not,
+    Or,
+    Path,
+    Root,
+    children,
+    path_of,
+    referenced_paths,
+)
+
+LITERAL_TYPES = (str, int, float, bool, type(None))
+
+# What a memo slot holds before its sub-expression is evaluated
+MISSING = object()
+
+NAMESPACE = {
+    "_has_changed": has_changed,
+    "_missing": MISSING,
+    "_re_match": re.match,
+    **{f"_{name}": function for name, function in FUNCTIONS.items()},
+}
+
+# The sub-expressions that may be shared. Paths are already read once per
+# record, and AND, OR and NOT cost little more than their operands
+SHAREABLE = (Between, Compare, Function, In, Match)
+
+
+@dataclass(frozen=True)
+class Slot:
+    """A constant that load_condition replaces with the memo slot of node"""
+
+    node: Node
+
+
+def shareable(tree: Node) -> Iterator[Node]:
+    """Yields each occurrence of a sub-expression of tree that may be shared"""
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, SHAREABLE):
+            yield node
+        nodes.extend(children(node))
+
+
+class SharedExpressions:
+    """
+    The sub-expressions of registered conditions. One that occurs more than
+    once, in one condition or across several, is given a slot in the
+    records' memo. Conditions registered before one of their
+    sub-expressions was shared are compiled again, in place, to use it.
+    """
+
+    def __init__(self) -> None:
+        self.__counts: Counter[Node] = Counter()
+        self.__unshared: dict[Node, WeakSet] = dict()
+        self.slots: dict[Node, int] = dict()
+
+    def register(self, condition: Condition) -> None:
+        nodes = list(shareable(condition.tree))
+        self.__counts.update(nodes)
+        stale = WeakSet()
+        for node in set(nodes):
+            if node in self.slots:
+                continue
+            if self.__counts[node] > 1:
+                self.slot(node)
+                stale.update(self.__unshared.pop(node, ()))
+                stale.add(condition)
+            else:
+                self.__unshared.setdefault(node, WeakSet()).add(condition)
+        for stale_condition in stale:
+            recompile(stale_condition)
+
+    def slot(self, node: Node) -> int:
+        """Returns the slot of node, giving it one if it has none"""
+        return self.slots.setdefault(node, len(self.slots))
+
+
+SHARED = SharedExpressions()
+
+
+def constant_set(items: tuple[Node, ...]) -> Optional[frozenset]:
+    """Returns the values of items if they are all hashable constants"""
+    if not all(isinstance(item, Const) for item in items):
+        return None
+    try:
+        return frozenset(item.value for item in items)  # type: ignore
+    except TypeError:
+        return None
+
+
+class _Generator:
+    def __init__(self) -> None:
+        self.constants: dict[str, Any] = dict()
+        self.indent = 1
+        self.lines: list[str] = list()
+        self.locals = count()
+        self.paths: dict[Node, str] = dict()
+        self.slots: dict[Node, str] = dict()
+
+    @contextmanager
+    def block(self) -> Iterator[None]:
+        # Locals bound inside a conditional block are not bound on every path
+        paths = dict(self.paths)
+        self.indent += 1
+        try:
+            yield
+        finally:
+            self.indent -= 1
+            self.paths = paths
+
+    def assign(self, expression: str) -> str:
+        name = f"v{next(self.locals)}"
+        self.emit(f"{name} = {expression}")
+        return name
+
+    def bind(self, expression: str) -> str:
+        return expression if expression.isidentifier() else self.assign(expression)
+
+    def emit(self, line: str) -> None:
+        self.lines.append("    " * self.indent + line)
+
+    def path(self, node: Node, expression: str) -> str:
+        name = self.paths[node] = self.bind(expression)
+        return name
+
+    def expression(self, node: Node) -> str:
+        if node not in SHARED.slots:
+            return self.evaluate(node)
+        # Shared sub-expressions are bound to a local like paths are
+        if node in self.paths:
+            return self.paths[node]
+        if node not in self.slots:
+            self.slots[node] = f"_s{len(self.slots)}"
+            self.constants[self.slots[node]] = Slot(node)
+        slot = self.slots[node]
+        result = self.assign(f"m._memo.get({slot}, _missing)")
+        self.emit(f"if {result} is _missing:")
+        with self.block():
+            self.emit(f"{result} = m._memo[{slot}] = {self.evaluate(node)}")
+        self.paths[node] = result
+        return result
+
+    @singledispatchmethod
+    def evaluate(self, node: Node) -> str:
+        raise TypeError(f"Unknown expression node {node!r}")
+
+    @evaluate.register
+    def _(self, node: Const) -> str:
+        if type(node.value) in LITERAL_TYPES:
+            return repr(node.value)
+        name = f"_c{len(self.constants)}"
+        self.constants[name] = node.value
+        return name
+
+    @evaluate.register
+    def _(self, node: Root) -> str:
+        if node in self.paths:
+            return self.paths[node]
+        return self.path(node, f"m._image({node.name!r})")
+
+    @evaluate.register
+    def _(self, node: Attribute) -> str:
+        if node in self.paths:
+            return self.paths[node]
+        if path := path_of(node):
+            return self.path(node, f"m._path{path!r}")
+        parent = self.bind(self.expression(node.path))
+        return self.path(
+            node,
+            f"{parent}.get({node.name!r}) if isinstance({parent}, dict) else None",
+        )
+
+    @evaluate.register
+    def _(self, node: Index) -> str:
+        if node in self.paths:
+            return self.paths[node]
+        if path := path_of(node):
+            return self.path(node, f"m._path{path!r}")
+        parent = self.bind(self.expression(node.path))
+        return self.path(
+            node,
+            f"{parent}[{node.index!r}] if isinstance({parent}, list) "
+            f"and len({parent}) > {node.index!r} else None",
+        )
+
+    @evaluate.register
+    def _(self, node: Compare) -> str:
+        left = self.expression(node.left)
+        right = self.expression(node.right)
+        return f"({left} {node.op} {right})"
+
+    @evaluate.register
+    def _(self, node: Between) -> str:
+        operand = self.expression(node.operand)
+        low = self.expression(node.low)
+        high = self.expression(node.high)
+        return f"({low} <= {operand} <= {high})"
+
+    @evaluate.register
+    def _(self, node: In) -> str:
+        operand = self.expression(node.operand)
+        items = f"({', '.join(self.expression(item) for item in node.items)},)"
+        members = constant_set(node.items)
+        if members is None:
+            return f"({operand} in {items})"
+        # Hashing finds a constant faster than comparing with each of them,
+        # but unhashable values, like lists and maps, can only be compared
+        operand = self.bind(operand)
+        result = f"v{next(self.locals)}"
+        self.emit("try:")
+        with self.block():
+            self.emit(f"{result} = {operand} in {self.expression(Const(members))}")
+        self.emit("except TypeError:")
+        with self.block():
+            self.emit(f"{result} = {operand} in {items}")
+        return result
+
+    @evaluate.register
+    def _(self, node: Match) -> str:
+        regex = self.expression(node.regex)
+        operand = self.expression(node.operand)
+        if isinstance(node.regex, Const) and isinstance(node.regex.value, re.Pattern):
+            return f"bool({regex}.match({operand}))"
+        return f"bool(_re_match({regex}, {operand}))"
+
+    @evaluate.register
+    def _(self, node: And) -> str:
+        result = self.assign(self.expression(node.left))
+        self.emit(f"if {result}:")
+        with self.block():
+            self.emit(f"{result} = {self.expression(node.right)}")
+        return result
+
+    @evaluate.register
+    def _(self, node: Or) -> str:
+        result = self.assign(self.expression(node.left))
+        self.emit(f"if not {result}:")
+        with self.block():
+            self.emit(f"{result} = {self.expression(node.right)}")
+        return result
+
+    @evaluate.register
+    def _(self, node: Not) -> str:
+        return f"(not {self.expression(node.operand)})"
+
+    @evaluate.register
+    def _(self, node: Function) -> str:
+        args = [self.expression(arg) for arg in node.args]
+        return f"_{node.name}({', '.join(args)})"
+
+    @evaluate.register
+    def _(self, node: Changed) -> str:
+        return f"_has_changed(m, {self.expression(Const(node.keys))})"
+
+
+def generate_source(tree: Node) -> tuple[str, dict[str, Any]]:
+    """
+    Returns the source of a function named condition that evaluates tree,
+    and the constants that the source refers to
+    """
+    generator = _Generator()
+    result = generator.expression(tree)
+    generator.emit(f"return {result}")
+    return "def condition(m):\n" + "\n".join(generator.lines) + "\n", dict(
+        generator.constants
+    )
+
+
+def compile_condition(tree: Node, expression: str = None) -> Condition:
+    source, constants = generate_source(tree)
+    code = compile(source, f"<condition {expression or tree!r}>", "exec")
+    return load_condition(code, constants, source, tree, expression)
+
+
+def load_condition(
+    code: CodeType,
+    constants: dict[str, Any],
+    source: str,
+    tree: Node,
+    expression: str = None,
+    paths: frozenset[tuple[str, Path]] = None,
+) -> Condition:
+    """
+    Returns the condition defined by code, the compiled result of
+    generate_source(tree). paths, if known, are referenced_paths(tree).
+    """
+    namespace = dict(NAMESPACE, **_resolve(constants))
+    exec(code, namespace)
+    filename = code.co_filename
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    condition = namespace["condition"]
+    condition.expression = expression
+    condition.paths = referenced_paths(tree) if paths is None else paths
+    condition.source = source
+    condition.tree = tree
+    return condition
+
+
+def recompile(condition: Condition) -> None:
+    """
+    Compiles condition's tree again, with the sub-expressions shared now,
+    and replaces condition's code, so that whatever holds condition uses it
+    """
+    source, constants = generate_source(condition.tree)
+    filename = f"<condition {condition.expression or condition.tree!r}>"
+    namespace = condition.__globals__
+    namespace.update(_resolve(constants))
+    exec(compile(source, filename, "exec"), namespace)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    condition.__code__ = namespace.pop("condition").__code__
+    condition.source = source
+
+
+def _resolve(constants: dict[str, Any]) -> dict[str, Any]:
+    return {
+        name: SHARED.slot(value.node) if isinstance(value, Slot) else value
+        for name, value in constants.items()
+    }
@@ -0,0 +1,115 @@
+"""
+Runtime implementations of the expression language functions, shared by
+every condition backend.
+"""
+from __future__ import annotations
+
+import re
+import sys
+from decimal import Decimal
+from functools import cache
+from typing import Any, Callable, Union
+
+from ..record import Path, RouteRecord
+
+PATH_SEPARATORS = re.compile(r"[.\[]")
+
+SIZED_TYPES = (str, set, dict, bytearray, bytes, list)
+
+TYPE_TESTS: dict[str, Callable[[Any], Any]] = {
+    # boto3 is imported lazily; until it is, no value can be a Binary
+    "B": lambda value: "boto3.dynamodb.types" in sys.modules
+    and isinstance(value, sys.modules["boto3.dynamodb.types"].Binary),
+    "BOOL": lambda value: isinstance(value, bool),
+    "BS": lambda value: isinstance(value, set)
+    and [x for x in value if isinstance(x, bytes)],
+    "L": lambda value: isinstance(value, list),
+    "M": lambda value: isinstance(value, dict),
+    "N": lambda value: isinstance(value, Decimal),
+    "NS": lambda value: isinstance(value, set)
+    and [x for x in value if isinstance(x, Decimal)],
+    "NULL": lambda value: value is None,
+    "S": lambda value: isinstance(value, str),
+    "SS": lambda value: isinstance(value, set)
+    and [x for x in value if isinstance(x, str)],
+}
+
+
+def attribute_exists(value: Any) -> bool:
+    return value is not None
+
+
+def attribute_not_exists(value: Any) -> bool:
+    return value is None
+
+
+def attribute_type(value: Any, type_name: str) -> Any:
+    try:
+        return TYPE_TESTS[type_name](value)
+    except (KeyError, TypeError):
+        raise TypeError(f"Unknown type '{type_name}'")
+
+
+def begins_with(value: Any, prefix: Any) -> bool:
+    return value.startswith(prefix) if isinstance(value, str) else False
+
+
+def contains(value: Any, operand: Any) -> bool:
+    return operand in value if isinstance(value, (str, set)) else False
+
+
+def from_json(value: Any) -> Any:
+    import simplejson
+
+    return simplejson.loads(value)
+
+
+@cache
+def changed_key_paths(key: Any) -> tuple[Path, ...]:
+    """
+    Returns the paths that has_changed tests for key: the attribute named
+    key and, if key is a path such as 'address.zip' or 'lines[0].sku', the
+    attribute at that path
+    """
+    paths: list[Path] = [(key,)]
+    if isinstance(key, str) and PATH_SEPARATORS.search(key):
+        path: list[Union[str, int]] = list()
+        try:
+            for name in key.split("."):
+                name, *indexes = name.split("[")
+                path.append(name)
+                path.extend(int(index.rstrip("]")) for index in indexes)
+        except ValueError:
+            # Not a path, so only an attribute name
+            return tuple(paths)
+        paths.append(tuple(path))
+    return tuple(paths)
+
+
+def has_changed(record: RouteRecord, keys: tuple[Any, ...]) -> bool:
+    # A key has changed if it is in one image and not the other, or in both
+    # and the values differ. RouteRecord works out what changed once, from
+    # the raw images
+    if not record.changed_paths:
+        return False
+    return any(record._changed(path) for key in keys for path in changed_key_paths(key))
+
+
+def is_type(value: Any, type_name: str) -> Any:
+    return TYPE_TESTS[type_name](value)
+
+
+def size(value: Any) -> int:
+    return len(value) if isinstance(value, SIZED_TYPES) else -1
+
+
+FUNCTIONS: dict[str, Callable[..., Any]] = {
+    "attribute_exists": attribute_exists,
+    "attribute_not_exists": attribute_not_exists,
+    "attribute_type": attribute_type,
+    "begins_with": begins_with,
+    "contains": contains,
+    "from_json": from_json,
+    "is_type": is_type,
+    "size": size,
+}
@@ -0,0 +1,145 @@
+"""
+The expression tree produced by ExpressionParser. Trees are immutable and
+hashable so that they can be cached, compared and shared between the
+backends that turn them into conditions.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+from typing import Any, Iterator, Optional, Union
+
+
+class Node:
+    __slots__ = ()
+
+
+@dataclass(frozen=True)
+class Const(Node):
+    value: Any
+
+    def __eq__(self, other: object) -> bool:
+        # 1 == True == 1.0 in Python, but they are different literals
+        return (
+            other.__class__ is Const
+            and type(self.value) is type(other.value)
+            and self.value == other.value
+        )
+
+    def __hash__(self) -> int:
+        return hash((Const, type(self.value), self.value))
+
+
+@dataclass(frozen=True)
+class Root(Node):
+    """One of the RouteRecord images, named keys, new_image or old_image"""
+
+    name: str
+
+
+@dataclass(frozen=True)
+class Attribute(Node):
+    path: Node
+    name: str
+
+
+@dataclass(frozen=True)
+class Index(Node):
+    path: Node
+    index: int
+
+
+@dataclass(frozen=True)
+class Compare(Node):
+    op: str
+    left: Node
+    right: Node
+
+
+@dataclass(frozen=True)
+class Between(Node):
+    operand: Node
+    low: Node
+    high: Node
+
+
+@dataclass(frozen=True)
+class In(Node):
+    operand: Node
+    items: tuple[Node, ...]
+
+
+@dataclass(frozen=True)
+class Match(Node):
+    operand: Node
+    regex: Node
+
+
+@dataclass(frozen=True)
+class And(Node):
+    left: Node
+    right: Node
+
+
+@dataclass(frozen=True)
+class Or(Node):
+    left: Node
+    right: Node
+
+
+@dataclass(frozen=True)
+class Not(Node):
+    operand: Node
+
+
+@dataclass(frozen=True)
+class Function(Node):
+    """A call to one of the functions in conditions.functions.FUNCTIONS"""
+
+    name: str
+    args: tuple[Node, ...]
+
+
+@dataclass(frozen=True)
+class Changed(Node):
+    keys: tuple[Any, ...]
+
+
+PATH_NODES = (Root, Attribute, Index)
+
+Path = tuple[Union[str, int], ...]
+
+
+def children(node: Node) -> Iterator[Node]:
+    for field in fields(node):
+        value = getattr(node, field.name)
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, tuple):
+            yield from (item for item in value if isinstance(item, Node))
+
+
+def path_of(node: Node) -> Optional[tuple[str, Path]]:
+    """
+    Returns the image name and the steps into it if node is a path rooted
+    at $NEW, $OLD or $KEYS, otherwise None
+    """
+    steps = list()
+    while isinstance(node, (Attribute, Index)):
+        steps.append(node.name if isinstance(node, Attribute) else node.index)
+        node = node.path
+    if isinstance(node, Root):
+        return node.name, tuple(reversed(steps))
+    return None
+
+
+def referenced_paths(node: Node) -> frozenset[tuple[str, Path]]:
+    """
+    Returns the (image name, path) pairs that evaluating node may read. An
+    empty path means the whole image.
+    """
+    if isinstance(node, Changed):
+        return frozenset({("old_image", ()), ("new_image", ())})
+    path = path_of(node)
+    if path:
+        return frozenset({path})
+    return frozenset().union(*(referenced_paths(child) for child in children(node)))
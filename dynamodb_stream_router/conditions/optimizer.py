@@ -0,0 +1,244 @@
+"""
+Rewrites expression trees into equivalent trees that are cheaper to
+evaluate. ExpressionParser optimizes every tree that it parses, so the
+condition backends, the route index and columnar plans all work on
+optimized trees.
+
+For records of well formed AttributeValues, an optimized tree returns the
+same value as the tree it was made from, and raises where that tree raised:
+
+- operators with only constant operands are folded into a constant,
+  unless evaluating them raises
+- constant regular expressions are compiled once
+- NOT NOT x becomes x if x is a bool, so NOT NOT NOT x becomes NOT x
+- AND and OR drop constant operands that cannot change their result
+- conjuncts (and disjuncts) that are bools and cannot raise are reordered
+  cheapest first. That changes which of them are evaluated, but not the
+  result. An operand that may raise is never moved past another operand.
+"""
+from __future__ import annotations
+
+import re
+from decimal import Decimal
+from functools import singledispatch
+from typing import Any, Callable, Union
+
+from .closures import COMPARISONS
+from .functions import FUNCTIONS, TYPE_TESTS
+from .nodes import (
+    PATH_NODES,
+    And,
+    Between,
+    Changed,
+    Compare,
+    Const,
+    Function,
+    In,
+    Match,
+    Node,
+    Not,
+    Or,
+    children,
+    path_of,
+)
+
+# Results that can be held by a Const and compared like a literal
+FOLDED_TYPES = (bool, int, float, str, type(None), Decimal)
+
+BOOL_FUNCTIONS = frozenset(
+    {"attribute_exists", "attribute_not_exists", "begins_with", "contains"}
+)
+
+# Relative evaluation costs. Path reads are cached per record, so a path
+# costs little more than a constant; calls and regular expressions cost most
+COSTS = {Compare: 1, Between: 1, In: 1, Function: 4, Match: 8, Changed: 16}
+
+
+def optimize(tree: Node) -> Node:
+    """Returns a tree that evaluates to the same result as tree, but faster"""
+    return _optimize(tree)
+
+
+def _fold(node: Node, evaluate: Callable[[], Any]) -> Node:
+    try:
+        value = evaluate()
+    except Exception:
+        # Raise when the condition is evaluated, as the tree always did
+        return node
+    return Const(value) if type(value) in FOLDED_TYPES else node
+
+
+def is_bool(node: Node) -> bool:
+    """True if node evaluates to a bool for every record"""
+    if isinstance(node, (Compare, Between, In, Match, Not, Changed)):
+        return True
+    if isinstance(node, Function):
+        return node.name in BOOL_FUNCTIONS
+    if isinstance(node, (And, Or)):
+        return is_bool(node.left) and is_bool(node.right)
+    return isinstance(node, Const) and type(node.value) is bool
+
+
+def cannot_raise(node: Node) -> bool:
+    """
+    True if evaluating node never raises. Equality of deserialized values
+    never raises; ordering them does, e.g. when one of them is None.
+    """
+    if isinstance(node, (Const, Changed, *PATH_NODES)):
+        return True
+    if isinstance(node, Compare):
+        return node.op in ("==", "!=") and all(map(cannot_raise, children(node)))
+    if isinstance(node, (In, Not, And, Or)):
+        return all(map(cannot_raise, children(node)))
+    if isinstance(node, Function):
+        if node.name in ("attribute_exists", "attribute_not_exists", "size"):
+            return cannot_raise(node.args[0])
+        if not (cannot_raise(node.args[0]) and isinstance(node.args[-1], Const)):
+            return False
+        argument = node.args[-1].value
+        if node.name in ("attribute_type", "is_type"):
+            return type(argument) is str and argument in TYPE_TESTS
+        if node.name in ("begins_with", "contains"):
+            # Safe for any value as long as the argument is a string
+            return type(argument) is str
+    return False
+
+
+def cost(node: Node) -> int:
+    if isinstance(node, Const):
+        return 0
+    if path := path_of(node):
+        return 1 + len(path[1])
+    return COSTS.get(type(node), 0) + sum(map(cost, children(node)))
+
+
+def operands(node: Node, kind: type[Union[And, Or]]) -> list[Node]:
+    """Returns the operands of a chain of ANDs or ORs, in evaluation order"""
+    if not isinstance(node, kind):
+        return [node]
+    return operands(node.left, kind) + operands(node.right, kind)
+
+
+def runs(node: Union[And, Or]) -> list[tuple[Node, ...]]:
+    """
+    Splits the operands of a chain of ANDs or ORs into the runs that may be
+    reordered: operands that are bools and cannot raise are grouped with
+    their neighbours of that kind, every other operand is a run of its own
+    """
+    result: list[tuple[Node, ...]] = list()
+    run: list[Node] = list()
+    for operand in operands(node, type(node)):
+        if is_bool(operand) and cannot_raise(operand):
+            run.append(operand)
+            continue
+        if run:
+            result.append(tuple(run))
+            run = list()
+        result.append((operand,))
+    if run:
+        result.append(tuple(run))
+    return result
+
+
+def chain(kind: type[Union[And, Or]], nodes: list[Node]) -> Node:
+    """Joins nodes into a left associative chain of kind"""
+    tree = nodes[0]
+    for node in nodes[1:]:
+        tree = kind(tree, node)
+    return tree
+
+
+def reorder(node: Union[And, Or]) -> Node:
+    return chain(
+        type(node), [operand for run in runs(node) for operand in sorted(run, key=cost)]
+    )
+
+
+@singledispatch
+def _optimize(node: Node) -> Node:
+    return node
+
+
+@_optimize.register
+def _(node: Compare) -> Node:
+    left, right = _optimize(node.left), _optimize(node.right)
+    node = Compare(node.op, left, right)
+    if isinstance(left, Const) and isinstance(right, Const):
+        return _fold(node, lambda: COMPARISONS[node.op](left.value, right.value))
+    return node
+
+
+@_optimize.register
+def _(node: Between) -> Node:
+    node = Between(*map(_optimize, (node.operand, node.low, node.high)))
+    if all(isinstance(child, Const) for child in children(node)):
+        return _fold(
+            node, lambda: node.low.value <= node.operand.value <= node.high.value
+        )
+    return node
+
+
+@_optimize.register
+def _(node: In) -> Node:
+    node = In(_optimize(node.operand), tuple(map(_optimize, node.items)))
+    if all(isinstance(child, Const) for child in children(node)):
+        return _fold(
+            node, lambda: node.operand.value in [item.value for item in node.items]
+        )
+    return node
+
+
+@_optimize.register
+def _(node: Match) -> Node:
+    operand, regex = _optimize(node.operand), _optimize(node.regex)
+    if isinstance(regex, Const) and type(regex.value) is str:
+        if isinstance(operand, Const):
+            return _fold(
+                Match(operand, regex),
+                lambda: bool(re.match(regex.value, operand.value)),
+            )
+        try:
+            regex = Const(re.compile(regex.value))
+        except re.error:
+            # Invalid regular expressions raise when they are evaluated
+            pass
+    return Match(operand, regex)
+
+
+@_optimize.register
+def _(node: Not) -> Node:
+    operand = _optimize(node.operand)
+    if isinstance(operand, Const):
+        return Const(not operand.value)
+    if isinstance(operand, Not) and is_bool(operand.operand):
+        return operand.operand
+    return Not(operand)
+
+
+@_optimize.register
+def _(node: And) -> Node:
+    left, right = _optimize(node.left), _optimize(node.right)
+    if isinstance(left, Const):
+        return right if left.value else left
+    if right == Const(True) and is_bool(left):
+        return left
+    return reorder(And(left, right))
+
+
+@_optimize.register
+def _(node: Or) -> Node:
+    left, right = _optimize(node.left), _optimize(node.right)
+    if isinstance(left, Const):
+        return left if left.value else right
+    if right == Const(False) and is_bool(left):
+        return left
+    return reorder(Or(left, right))
+
+
+@_optimize.register
+def _(node: Function) -> Node:
+    args = tuple(map(_optimize, node.args))
+    node = Function(node.name, args)
+    if all(isinstance(arg, Const) for arg in args):
+        return _fold(node, lambda: FUNCTIONS[node.name](*(arg.value for arg in args)))
+    return node
@@ -1,20 +1,36 @@
 # pyright: reportUndefinedVariable=false
-import re
-from decimal import Decimal
-
-import simplejson as json
-from boto3.dynamodb.types import Binary
 from sly import Parser
 from sly.yacc import YaccProduction
 
 from ..exceptions import KeywordError, SyntaxError
 from . import Condition
+from .compiler import SHARED, compile_condition
+from .functions import TYPE_TESTS
 from .lexer import ExpressionLexer
+from .nodes import (
+    And,
+    Attribute,
+    Between,
+    Changed,
+    Compare,
+    Const,
+    Function,
+    In,
+    Index,
+    Match,
+    Node,
+    Not,
+    Or,
+    Root,
+    referenced_paths,
+)
+from .optimizer import optimize
 
 
 class ExpressionParser(Parser):
 
     _expression_cache = {}
+    _tree_cache = {}
 
     # Get the token list from the lexer (required)
     tokens = ExpressionLexer.tokens
@@ -32,149 +48,124 @@ class ExpressionParser(Parser):
         return val[1:-1]
 
     def parse(self, expression: str) -> Condition:
+        """
+        Parses expression and compiles it into a Condition. The expression
+        tree is available as the condition's tree attribute. Sub-expressions
+        that it shares with the conditions parsed before it are evaluated
+        once per record (see compiler.SharedExpressions).
+        """
         if expression not in self._expression_cache:
-            self._expression_cache[expression] = super().parse(
-                ExpressionLexer().tokenize(expression)
-            )
+            condition = compile_condition(self.parse_tree(expression), expression)
+            SHARED.register(condition)
+            self._expression_cache[expression] = condition
         return self._expression_cache[expression]
 
+    def referenced_paths(self, expression: str) -> frozenset[tuple[str, tuple]]:
+        """
+        Returns the (image name, path) pairs that expression may read, e.g.
+        ("new_image", ("order", "status")) for $NEW.order.status
+        """
+        return referenced_paths(self.parse_tree(expression))
+
+    def parse_tree(self, expression: str) -> Node:
+        """
+        Parses expression into an optimized expression tree without
+        compiling it
+        """
+        if expression not in self._tree_cache:
+            self._tree_cache[expression] = optimize(
+                super().parse(ExpressionLexer().tokenize(expression))
+            )
+        return self._tree_cache[expression]
+
     # Grammar rules and actions
     @_("operand EQ operand")  # noqa: 821
     def condition(self, p):
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) == operand1(m)
+        return Compare("==", p.operand0, p.operand1)
 
     @_("operand NE operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) != operand1(m)
+        return Compare("!=", p.operand0, p.operand1)
 
     @_("operand GT operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) > operand1(m)
+        return Compare(">", p.operand0, p.operand1)
 
     @_("operand GTE operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) >= operand1(m)
+        return Compare(">=", p.operand0, p.operand1)
 
     @_("operand LT operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) < operand1(m)
+        return Compare("<", p.operand0, p.operand1)
 
     @_("operand LTE operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: operand0(m) <= operand1(m)
+        return Compare("<=", p.operand0, p.operand1)
 
     @_("operand BETWEEN operand AND operand")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        operand2 = p.operand2
-        return lambda m: operand1(m) <= operand0(m) <= operand2(m)
+        return Between(p.operand0, p.operand1, p.operand2)
 
     @_('operand IN "(" in_list ")"')  # noqa: 821
     def condition(self, p):  # noqa: 811
-        operand = p.operand
-        in_list = p.in_list
-        return lambda m: operand(m) in in_list(m)
+        return In(p.operand, p.in_list)
 
     @_("function")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        function = p.function
-        return lambda m: function(m)
+        return p.function
 
     @_("condition AND condition")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        condition0 = p.condition0
-        condition1 = p.condition1
-        return lambda m: condition0(m) and condition1(m)
+        return And(p.condition0, p.condition1)
 
     @_("condition OR condition")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        condition0 = p.condition0
-        condition1 = p.condition1
-        return lambda m: condition0(m) or condition1(m)
+        return Or(p.condition0, p.condition1)
 
     @_("NOT condition")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        condition = p.condition
-        return lambda m: not condition(m)
+        return Not(p.condition)
 
     @_("NOT path")  # noqa: 821
     def condition(self, p):  # noqa: 811
-        return lambda m: not p.path(m)
+        return Not(p.path)
 
     @_('"(" condition ")"')  # noqa: 821
     def condition(self, p):  # noqa: 811
-        condition = p.condition
-        return lambda m: condition(m)
+        return p.condition
 
     @_('ATTRIBUTE_EXISTS "(" path ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-        return lambda m: path(m) is not None
+        return Function("attribute_exists", (p.path,))
 
     @_('ATTRIBUTE_NOT_EXISTS "(" path ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-        return lambda m: path(m) is None
+        return Function("attribute_not_exists", (p.path,))
 
     @_('ATTRIBUTE_TYPE "(" path "," operand ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-        operand = p.operand
-        return lambda x: path, operand
+        return Function("attribute_type", (p.path, p.operand))
 
     @_('BEGINS_WITH "(" path "," operand ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-        operand = p.operand
-        return (
-            lambda m: path(m).startswith(operand(m))
-            if isinstance(path(m), str)
-            else False
-        )
+        return Function("begins_with", (p.path, p.operand))
 
     @_('CONTAINS "(" path "," operand ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-        operand = p.operand
-        return (
-            lambda m: operand(m) in path(m)
-            if isinstance(path(m), (str, set))
-            else False
-        )
+        return Function("contains", (p.path, p.operand))
 
     @_('SIZE "(" path ")"')  # noqa: 821
     def operand(self, p):  # noqa: 811
-        path = p.path
-        return (
-            lambda m: len(path(m))
-            if isinstance(path(m), (str, set, dict, bytearray, bytes, list))
-            else -1
-        )
+        return Function("size", (p.path,))
 
     @_('in_list "," operand')  # noqa: 821
     def in_list(self, p):  # noqa: 811
-        in_list = p.in_list
-        operand = p.operand
-        return lambda m: [*in_list(m), operand(m)]
+        return (*p.in_list, p.operand)
 
     @_('operand "," operand')  # noqa: 821
     def in_list(self, p):  # noqa: 811
-        operand0 = p.operand0
-        operand1 = p.operand1
-        return lambda m: [operand0(m), operand1(m)]
+        return (p.operand0, p.operand1)
 
     @_("path")  # noqa: 821
     def operand(self, p):  # noqa: 811
@@ -188,136 +179,78 @@ class ExpressionParser(Parser):
         else:
             VALUE = VALUE.replace(r"\"", '"')
 
-        return lambda m: self.__strip_quotes(VALUE)
+        return Const(self.__strip_quotes(VALUE))
 
     @_("operand MATCH operand")  # noqa: 821
     def condition(self, f):  # noqa: 811
-        regex = f.operand1
-        str_to_match = f.operand0
-        return lambda x: bool(re.match(regex(x), str_to_match(x)))
+        return Match(f.operand0, f.operand1)
 
     @_('path "." NAME')  # noqa: 821
     def path(self, p):  # noqa: 811
-        path = p.path
-        NAME = p.NAME
-        return lambda m: path(m).get(NAME) if isinstance(path(m), dict) else None
+        return Attribute(p.path, p.NAME)
 
     @_('path "[" VALUE "]"')  # noqa: 821
     def path(self, p):  # noqa: 811
-        key = self.__strip_quotes(p.VALUE)
-        path = p.path
-
-        return lambda m: path(m).get(key) if isinstance(path(m), dict) else None
+        return Attribute(p.path, self.__strip_quotes(p.VALUE))
 
     @_('path "[" INT "]"')  # noqa: 821
     def path(self, p):  # noqa: 811
-        path = p.path
-        INT = int(p.INT)
-        return (
-            lambda m: path(m)[INT]
-            if isinstance(path(m), list) and len(path(m)) >= INT
-            else None
-        )
+        return Index(p.path, int(p.INT))
 
     @_("INT")  # noqa: 821
     def operand(self, o):  # noqa: 811
-        INT = int(o.INT)
-        return lambda m: INT
+        return Const(int(o.INT))
 
     @_("TRUE")  # noqa: 821
     def operand(self, o):  # noqa: 811
-        return lambda m: True
+        return Const(True)
 
     @_("FALSE")  # noqa: 821
     def operand(self, o):  # noqa: 811
-        return lambda m: False
+        return Const(False)
 
     @_("FLOAT")  # noqa: 821
     def path(self, p):  # noqa: 811
-        FLOAT = float(p.FLOAT)
-        return lambda m: FLOAT
+        return Const(float(p.FLOAT))
 
     @_("KEYS")  # noqa: 821
     def path(self, _):  # noqa: 811
-        return lambda m: m.keys
+        return Root("keys")
 
     @_("NEW_IMAGE")  # noqa: 821
     def path(self, _):  # noqa: 811
-        return lambda m: m.new_image
+        return Root("new_image")
 
     @_("OLD_IMAGE")  # noqa: 821
     def path(self, _):  # noqa: 811
-        return lambda m: m.old_image
+        return Root("old_image")
 
     @_("NAME")  # noqa: 821
     def path(self, p):  # noqa: 811
-        NAME = p.NAME
         if isinstance(p, YaccProduction):
             raise KeywordError(f"Unknown keyword {p.NAME}")
-        return lambda m: m.get(NAME) if p(m) is not None else None
 
     @_('FROM_JSON "(" path ")" ')  # noqa: 821
     def function(self, p):  # noqa: 811
-        return lambda m: json.loads(p.path(m))
+        return Function("from_json", (p.path,))
 
     @_('CHANGED "(" in_list ")"')  # noqa: 821
     @_('CHANGED "(" VALUE ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        # 1. Key is not in both dicts
-        # 2. Key is in one and not the other
-        # 3. Key is in both but the items differ
         if hasattr(p, "in_list"):
-            key_list = p.in_list(p)
+            if not all(isinstance(key, Const) for key in p.in_list):
+                raise SyntaxError("has_changed only accepts literal values")
+            keys = tuple(key.value for key in p.in_list)
         else:
-            key_list = [self.__strip_quotes(p.VALUE)]
-
-        def has_changed(record, keys=key_list):
-            for k in keys:
-                if (
-                    (
-                        k not in record.old_image
-                        and k in record.new_image
-                    )
-                    or (
-                        k not in record.old_image
-                        and k in record.new_image
-                    )
-                    or (
-                        k in record.new_image
-                        and k in record.old_image
-                        and record.old_image[k] != record.new_image[k]
-                    )
-                ):
-                    return True
-
-            return False
-
-        return has_changed
+            keys = (self.__strip_quotes(p.VALUE),)
+        return Changed(keys)
 
     @_('IS_TYPE "(" path "," NAME ")"')  # noqa: 821
     def function(self, p):  # noqa: 811
-        path = p.path
-
-        TYPE_MAP = {
-            "B": lambda m: isinstance(path(m), Binary),
-            "BOOL": lambda m: isinstance(path(m), bool),
-            "BS": lambda m: isinstance(path(m), set)
-            and [x for x in path(m) if isinstance(x, bytes)],
-            "L": lambda m: isinstance(path(m), list),
-            "M": lambda m: isinstance(path(m), dict),
-            "N": lambda m: isinstance(path(m), Decimal),
-            "NS": lambda m: isinstance(path(m), set)
-            and [x for x in path(m) if isinstance(x, Decimal)],
-            "NULL": lambda m: path(m) is None,
-            "S": lambda m: isinstance(path(m), str),
-            "SS": lambda m: isinstance(path(m), set)
-            and [x for x in path(m) if isinstance(x, str)],
-        }
-
-        if p.NAME not in TYPE_MAP:
+        if p.NAME not in TYPE_TESTS:
             raise TypeError(f"Unknown type '{p.NAME}'")
 
-        return TYPE_MAP[p.NAME]
+        return Function("is_type", (p.path, Const(p.NAME)))
 
     @_("condition error")  # noqa: 821
     def operand(self, x):  # noqa: 811
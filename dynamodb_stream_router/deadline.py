@@ -0,0 +1,79 @@
+"""
+Stopping routing in time for a deadline.
+
+A Lambda function that runs out of time is killed, and its whole batch is
+delivered again, including the records that were routed. Given a
+Deadline, route_records and route_stream stop starting records once the
+next one is not expected to finish before the deadline, less a safety
+margin. They then return the records that were not started as batch item
+failures, so that only those are delivered again.
+
+The time a record is expected to take is the mean of the time records
+have taken so far, weighted towards the most recent. Each batch route's
+calls are estimated the same way, apart from records.
+"""
+from __future__ import annotations
+
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+# Seconds to leave for returning the response
+MARGIN = 1.0
+
+# The weight of each record in the estimate, once there are enough of them
+WEIGHT = 0.2
+
+
+class Deadline:
+    """
+    A time.monotonic() value that routing must finish by, with margin
+    seconds to spare. Once a record is not started, none are.
+    """
+
+    def __init__(self, at: float, margin: float = MARGIN) -> None:
+        self.at = at
+        # By the batch route whose calls they estimate, None for records
+        self.estimates: dict[Hashable, float] = dict()
+        self.expired = False
+        self.margin = margin
+        self.__counts: dict[Hashable, int] = dict()
+        self.__lock = Lock()
+
+    @classmethod
+    def after(cls, seconds: float, margin: float = MARGIN) -> Deadline:
+        return cls(monotonic() + seconds, margin)
+
+    @classmethod
+    def from_context(cls, context: Any, margin: float = MARGIN) -> Deadline:
+        """Returns the deadline of a Lambda invocation, given its context"""
+        return cls.after(context.get_remaining_time_in_millis() / 1000, margin)
+
+    @property
+    def estimate(self) -> float:
+        """The seconds a record is expected to take"""
+        return self.estimates.get(None, 0.0)
+
+    def finished(self, seconds: float, route: Hashable = None) -> None:
+        """Adds the time a record, or a call of a batch route, took to its estimate"""
+        with self.__lock:
+            count = self.__counts[route] = self.__counts.get(route, 0) + 1
+            estimate = self.estimates.get(route, 0.0)
+            # The plain mean of the first records, which settles the estimate
+            # faster than weighting them would
+            self.estimates[route] = estimate + (seconds - estimate) / min(
+                count, 1 / WEIGHT
+            )
+
+    def remaining(self) -> float:
+        """Returns the seconds left before the margin"""
+        return self.at - self.margin - monotonic()
+
+    def start(self, route: Hashable = None) -> bool:
+        """
+        True if a record, or a call of a batch route, can be started and is
+        expected to finish in time
+        """
+        if not self.expired and self.remaining() < self.estimates.get(route, 0.0):
+            self.expired = True
+        return not self.expired
@@ -0,0 +1,138 @@
+"""
+Skipping records that routes have already handled.
+
+DynamoDB streams deliver records at least once, so after a retry or a
+shard rebalance a batch can hold records that were routed before. Pass a
+DedupStore to route_records and a route's handler is only called for a
+record that the route has not completed: once the handler returns, the
+record's eventID (or its SequenceNumber, if it has no eventID) is stored
+against the route's dedup_key. A handler that raises is not stored, so it
+is called again when the record is retried.
+
+Route.dedup_key is the module and qualified name of the route's handler,
+its priority and its condition's expression (or where the condition is
+defined), so routes that share a handler are told apart. Routes that
+share all of those, such as routes whose handlers a factory makes, are
+given a dedup_key when they are created. Stores may be called from
+several threads at once when routing with an executor.
+"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from os import PathLike
+from threading import Lock
+from time import monotonic, time
+from typing import Optional, Union
+
+
+class DedupStore(ABC):
+    """Remembers which records each route has completed"""
+
+    @abstractmethod
+    def complete(self, route: str, event: str) -> None:
+        """Stores that route has completed event"""
+
+    @abstractmethod
+    def completed(self, route: str, event: str) -> bool:
+        """True if route has completed event"""
+
+
+class MemoryDedupStore(DedupStore):
+    """
+    An in-process store, which lives as long as a warm Lambda container.
+    Holds at most maxsize entries, evicting the least recently used, and
+    forgets entries ttl seconds after they were stored; with ttl=None they
+    are kept until they are evicted.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 3600) -> None:
+        self.__entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self.__lock = Lock()
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def complete(self, route: str, event: str) -> None:
+        expires = monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self.__lock:
+            self.__entries[(route, event)] = expires
+            self.__entries.move_to_end((route, event))
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def completed(self, route: str, event: str) -> bool:
+        with self.__lock:
+            expires = self.__entries.get((route, event))
+            if expires is None:
+                return False
+            if expires <= monotonic():
+                del self.__entries[(route, event)]
+                return False
+            self.__entries.move_to_end((route, event))
+            return True
+
+
+class SQLiteDedupStore(DedupStore):
+    """
+    A store in an SQLite database, by default in memory. A file outlives
+    the process, which suits tests and replaying captured streams locally.
+    Entries are forgotten ttl seconds after they were stored.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(
+        self, database: Union[str, PathLike] = ":memory:", ttl: float = 86400
+    ) -> None:
+        import sqlite3
+
+        self.__connection = sqlite3.connect(
+            database, check_same_thread=False, isolation_level=None
+        )
+        self.__connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS completed (
+                route TEXT NOT NULL,
+                event TEXT NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (route, event)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.__lock = Lock()
+        self.__stored = 0
+        self.ttl = ttl
+        self.purge()
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def complete(self, route: str, event: str) -> None:
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO completed VALUES (?, ?, ?)",
+                (route, event, time() + self.ttl),
+            )
+            self.__stored += 1
+        if not self.__stored % self.PURGE_EVERY:
+            self.purge()
+
+    def completed(self, route: str, event: str) -> bool:
+        with self.__lock:
+            return (
+                self.__connection.execute(
+                    "SELECT 1 FROM completed WHERE route = ? AND event = ? "
+                    "AND expires > ?",
+                    (route, event, time()),
+                ).fetchone()
+                is not None
+            )
+
+    def purge(self) -> None:
+        """Deletes the entries that have expired"""
+        with self.__lock:
+            self.__connection.execute(
+                "DELETE FROM completed WHERE expires <= ?", (time(),)
+            )
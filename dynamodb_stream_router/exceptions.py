@@ -2,6 +2,10 @@ class DynamodbStreamRouterException(Exception):
     pass
 
 
+class AsyncRouteException(DynamodbStreamRouterException):
+    pass
+
+
 class KeywordError(DynamodbStreamRouterException):
     pass
 
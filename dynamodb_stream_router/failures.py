@@ -0,0 +1,148 @@
+"""
+Isolating the records whose routing failed.
+
+Routing calls a router per record. Given a FailureMode, run_routers logs
+the exception of a router that raises instead of propagating it, and
+isolates its record: STOP routes no further records, CONTINUE_OTHER_KEYS
+skips the later records of the record's Keys. The records that were not
+routed are collected as (row, SequenceNumber) pairs, and batch_response
+turns them into the response that ReportBatchItemFailures expects.
+"""
+from __future__ import annotations
+
+from operator import itemgetter
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Callable, Hashable, Iterable, Optional
+
+from . import BatchItemFailure, BatchResponse, FailureMode, record_key
+from .record import Record
+
+if TYPE_CHECKING:
+    from threading import Event
+
+    from .deadline import Deadline
+
+# The row of a record in its batch, and its SequenceNumber
+Unrouted = list[tuple[int, Optional[str]]]
+
+
+def stop_event(failure_mode: FailureMode) -> Optional[Event]:
+    if failure_mode is not FailureMode.STOP:
+        return None
+    from threading import Event
+
+    return Event()
+
+
+def run_routers(
+    routers: Iterable[tuple[int, Record, Callable[[], None]]],
+    failure_mode: FailureMode,
+    stop: Optional[Event],
+    deadline: Optional[Deadline] = None,
+) -> Unrouted:
+    """
+    Calls routers in order. Without failure_mode an exception propagates;
+    with it, the router's record is isolated: stop is set, for STOP, or the
+    later records of its Keys are skipped, for CONTINUE_OTHER_KEYS. With
+    deadline, records are skipped once deadline stops them being started.
+    Returns the rows and sequence numbers of the records that were not
+    routed.
+    """
+    if not (failure_mode or deadline):
+        for _, _, router in routers:
+            router()
+        return list()
+    failed_keys: set[Hashable] = set()
+    unrouted: Unrouted = list()
+    for row, record, router in routers:
+        if (
+            (stop and stop.is_set())
+            or (failed_keys and failure_key(record) in failed_keys)
+            or (deadline and not deadline.start())
+        ):
+            unrouted.append((row, sequence_number(record)))
+            continue
+        start = perf_counter_ns()
+        try:
+            router()
+        except Exception:
+            if not failure_mode:
+                raise
+            from logging import getLogger
+
+            getLogger(__name__).exception(
+                "Failed to route record %s", sequence_number(record)
+            )
+            unrouted.append((row, sequence_number(record)))
+            if stop:
+                stop.set()
+            else:
+                failed_keys.add(failure_key(record))
+        finally:
+            if deadline:
+                deadline.finished((perf_counter_ns() - start) / 1e9)
+    return unrouted
+
+
+def exclude(
+    unrouted: dict[int, Optional[str]],
+    failed: Unrouted,
+    records: list[Record],
+    failure_mode: FailureMode,
+) -> None:
+    """
+    Adds the records that failed, and those that failure_mode says must not
+    be routed after them, to unrouted
+    """
+    if not failed:
+        return
+    unrouted.update(failed)
+    if failure_mode is FailureMode.STOP:
+        first = min(row for row, _ in failed)
+        unrouted.update(
+            (row, sequence_number(records[row]))
+            for row in range(first + 1, len(records))
+        )
+        return
+    first_failures: dict[Hashable, int] = dict()
+    for row, _ in sorted(failed):
+        first_failures.setdefault(failure_key(records[row]), row)
+    for row, record in enumerate(records):
+        if row > first_failures.get(failure_key(record), len(records)):
+            unrouted[row] = sequence_number(record)
+
+
+def failure_key(record: Record) -> Hashable:
+    # A record too malformed to have Keys only fails itself
+    try:
+        return record_key(record)
+    except Exception:
+        return id(record)
+
+
+def sequence_number(record: Record) -> Optional[str]:
+    dynamodb = record.get("dynamodb") if isinstance(record, dict) else None
+    return dynamodb.get("SequenceNumber") if isinstance(dynamodb, dict) else None
+
+
+def batch_response(unrouted: Unrouted) -> BatchResponse:
+    # Lambda resumes a shard from the lowest sequence number reported, so
+    # reporting every record that was not routed is always safe. A net change
+    # has the SequenceNumber of its first record, which may be reported too
+    sequence_numbers = dict.fromkeys(
+        sequence_number for _, sequence_number in sorted(unrouted, key=itemgetter(0))
+    )
+    return BatchResponse(
+        batchItemFailures=[
+            BatchItemFailure(itemIdentifier=sequence_number)
+            for sequence_number in sorted(sequence_numbers, key=__stream_order)
+        ]
+    )
+
+
+def __stream_order(sequence_number: Optional[str]) -> tuple[int, int]:
+    # Sequence numbers are decimal strings of varying length. Anything else
+    # keeps its place after them
+    if isinstance(sequence_number, str) and sequence_number.isdecimal():
+        return 0, int(sequence_number)
+    return 1, 0
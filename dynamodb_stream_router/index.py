@@ -0,0 +1,114 @@
+"""
+Hash index over the routes of an operation.
+
+String conditions of the form `$NEW.entity_type == 'order' & ...` or
+`$NEW.entity_type IN ('order', 'invoice') & ...` can only match records
+whose value at that path equals one of the constants. The index looks the
+record's value up once per discriminating path, so routes for other values
+are never evaluated. Only the leftmost conjunct is used, because it is
+always evaluated first and comparing deserialized values for equality
+never raises; skipping a route on it can therefore not hide an exception
+that the condition would have raised.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Optional, Sequence
+
+from .record import Path, RouteRecord
+
+if TYPE_CHECKING:
+    from . import Route, RoutePlan
+    from .conditions.nodes import Node
+
+Discriminator = tuple[tuple[str, Path], frozenset[Any]]
+
+
+def discriminator(tree: Node) -> Optional[Discriminator]:
+    """
+    Returns the path and the constant values that the leftmost conjunct of
+    tree requires, or None if it does not require any
+    """
+    # Only string conditions have trees, so the parser has loaded the nodes
+    from .conditions.nodes import And, Compare, Const, In, path_of
+
+    while isinstance(tree, And):
+        tree = tree.left
+    if isinstance(tree, Compare) and tree.op == "==":
+        if path_of(tree.left) and isinstance(tree.right, Const):
+            path, constants = path_of(tree.left), (tree.right,)
+        elif isinstance(tree.left, Const) and path_of(tree.right):
+            path, constants = path_of(tree.right), (tree.left,)
+        else:
+            return None
+    elif (
+        isinstance(tree, In)
+        and path_of(tree.operand)
+        and all(isinstance(item, Const) for item in tree.items)
+    ):
+        path, constants = path_of(tree.operand), tree.items
+    else:
+        return None
+    if not path[1]:
+        # A whole image is a dict, which never equals a constant
+        return None
+    try:
+        return path, frozenset(constant.value for constant in constants)
+    except TypeError:
+        return None
+
+
+class RouteIndex:
+    def __init__(self, plan: RoutePlan) -> None:
+        routes = [route for tier in plan for route in tier]
+        self.__positions = {route: position for position, route in enumerate(routes)}
+        by_path: dict[tuple[str, Path], list[tuple[Route, frozenset]]] = defaultdict(
+            list
+        )
+        for route in routes:
+            tree = getattr(route._condition, "tree", None)
+            found = discriminator(tree) if tree is not None else None
+            if found:
+                by_path[found[0]].append((route, found[1]))
+        self.__indexes: list[tuple[tuple[str, Path], dict[Any, tuple[Route, ...]]]] = []
+        indexed = set()
+        for path, entries in by_path.items():
+            if len(entries) < 2:
+                continue
+            index: dict[Any, list[Route]] = defaultdict(list)
+            for route, values in entries:
+                for value in values:
+                    if route not in index[value]:
+                        index[value].append(route)
+                indexed.add(route)
+            self.__indexes.append(
+                (path, {value: tuple(matches) for value, matches in index.items()})
+            )
+        self.__routes = tuple(routes)
+        self.__unindexed = tuple(route for route in routes if route not in indexed)
+
+    @property
+    def indexed_paths(self) -> tuple[tuple[str, Path], ...]:
+        return tuple(path for path, _ in self.__indexes)
+
+    def candidates(self, record: RouteRecord) -> Sequence[Route]:
+        """
+        Returns the routes whose conditions may match record, in priority
+        order. Routes that cannot be indexed are always included.
+        """
+        if not self.__indexes:
+            return self.__routes
+        hits = []
+        for (name, path), index in self.__indexes:
+            try:
+                routes = index.get(record._path(name, path))
+            except TypeError:
+                # Unhashable values (maps, lists, sets) never equal a constant
+                continue
+            if routes:
+                hits.extend(routes)
+        if not hits:
+            return self.__unindexed
+        candidates = [*self.__unindexed, *hits]
+        candidates.sort(key=self.__positions.__getitem__)
+        return candidates
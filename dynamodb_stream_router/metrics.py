@@ -0,0 +1,248 @@
+"""
+Instrumentation for the router.
+
+Pass a MetricsSink to route_records (or route_record) to be told how each
+route's condition and handler performed. When no sink is passed the router
+takes its uninstrumented path, so disabled metrics cost nothing.
+
+Times are reported in nanoseconds. Routes are identified by their
+dedup_key, which tells apart routes that share a handler. Sinks may be
+called from several threads at once when routing with an executor.
+"""
+from __future__ import annotations
+
+import json
+import sys
+from collections import defaultdict
+from threading import Lock
+from time import time
+from typing import IO, Any
+
+
+class MetricsSink:
+    """Receives routing events. Every hook is a no-op; override what you need."""
+
+    def batch_completed(self, records: int, duration_ns: int) -> None:
+        pass
+
+    def condition_evaluated(self, route: str, duration_ns: int, matched: bool) -> None:
+        pass
+
+    def handler_completed(self, route: str, duration_ns: int, failed: bool) -> None:
+        pass
+
+    def record_completed(
+        self, operation: str, duration_ns: int, deserialization_ns: int, matches: int
+    ) -> None:
+        pass
+
+
+class Histogram:
+    """A histogram with power of two buckets, in nanoseconds"""
+
+    __slots__ = ("buckets", "count", "max", "total")
+
+    def __init__(self) -> None:
+        self.buckets: dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.max = 0
+        self.total = 0
+
+    def add(self, value: int) -> None:
+        self.buckets[value.bit_length()] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+        self.total += value
+
+    def percentile(self, percentile: float) -> int:
+        """Returns the upper bound of the bucket holding the percentile"""
+        threshold = self.count * percentile / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min(1 << bucket, self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(
+            count=self.count,
+            total_ns=self.total,
+            mean_ns=self.total // self.count if self.count else 0,
+            p50_ns=self.percentile(50),
+            p99_ns=self.percentile(99),
+            max_ns=self.max,
+        )
+
+
+class InMemoryMetrics(MetricsSink):
+    """Aggregates everything in memory; see snapshot()"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.reset()
+
+    def batch_completed(self, records: int, duration_ns: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_records += records
+            self.batch_time.add(duration_ns)
+
+    def condition_evaluated(self, route: str, duration_ns: int, matched: bool) -> None:
+        with self._lock:
+            self.evaluations[route] += 1
+            self.matches[route] += matched
+            self.condition_time[route].add(duration_ns)
+
+    def handler_completed(self, route: str, duration_ns: int, failed: bool) -> None:
+        with self._lock:
+            self.failures[route] += failed
+            self.handler_time[route].add(duration_ns)
+
+    def record_completed(
+        self, operation: str, duration_ns: int, deserialization_ns: int, matches: int
+    ) -> None:
+        with self._lock:
+            self.records[operation] += 1
+            self.record_time.add(duration_ns)
+            self.deserialization_time.add(deserialization_ns)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.batch_records = 0
+            self.batch_time = Histogram()
+            self.batches = 0
+            self.condition_time: dict[str, Histogram] = defaultdict(Histogram)
+            self.deserialization_time = Histogram()
+            self.evaluations: dict[str, int] = defaultdict(int)
+            self.failures: dict[str, int] = defaultdict(int)
+            self.handler_time: dict[str, Histogram] = defaultdict(Histogram)
+            self.matches: dict[str, int] = defaultdict(int)
+            self.record_time = Histogram()
+            self.records: dict[str, int] = defaultdict(int)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(
+                batches=dict(
+                    count=self.batches,
+                    records=self.batch_records,
+                    time=self.batch_time.to_dict(),
+                ),
+                records=dict(
+                    by_operation=dict(self.records),
+                    time=self.record_time.to_dict(),
+                    deserialization=self.deserialization_time.to_dict(),
+                ),
+                routes={
+                    route: dict(
+                        evaluations=self.evaluations[route],
+                        matches=self.matches[route],
+                        failures=self.failures.get(route, 0),
+                        condition=self.condition_time[route].to_dict(),
+                        handler=self.handler_time[route].to_dict()
+                        if route in self.handler_time
+                        else None,
+                    )
+                    for route in sorted(self.evaluations)
+                },
+            )
+
+
+class EmbeddedMetricsFormat(MetricsSink):
+    """
+    Writes CloudWatch Embedded Metric Format log lines. Route metrics are
+    aggregated while a batch is routed and written, one line per route plus
+    one for the batch, when the batch completes. Handler latencies are
+    written as value arrays, which CloudWatch turns into percentiles; a
+    route with more handler calls than fit in one line gets more lines.
+    """
+
+    # CloudWatch accepts at most 100 values per metric in one log line
+    MAX_VALUES = 100
+
+    def __init__(
+        self, namespace: str = "DynamodbStreamRouter", stream: IO[str] = None
+    ) -> None:
+        self.namespace = namespace
+        self.stream = stream or sys.stdout
+        self._lock = Lock()
+        self._routes: dict[str, dict[str, Any]] = dict()
+        self._deserialization_ns = 0
+
+    def __route(self, route: str) -> dict[str, Any]:
+        if route not in self._routes:
+            self._routes[route] = dict(
+                Evaluations=0, Matches=0, Failures=0, ConditionTime=0, HandlerTime=[]
+            )
+        return self._routes[route]
+
+    def __write(self, dimensions: dict[str, str], metrics: dict[str, Any]) -> None:
+        units = dict(ConditionTime="Microseconds", HandlerTime="Milliseconds")
+        units.update(BatchTime="Milliseconds", DeserializationTime="Milliseconds")
+        self.stream.write(
+            json.dumps(
+                dict(
+                    _aws=dict(
+                        Timestamp=int(time() * 1000),
+                        CloudWatchMetrics=[
+                            dict(
+                                Namespace=self.namespace,
+                                Dimensions=[list(dimensions)],
+                                Metrics=[
+                                    dict(Name=name, Unit=units.get(name, "Count"))
+                                    for name in metrics
+                                ],
+                            )
+                        ],
+                    ),
+                    **dimensions,
+                    **metrics,
+                )
+            )
+            + "\n"
+        )
+
+    def batch_completed(self, records: int, duration_ns: int) -> None:
+        with self._lock:
+            routes, self._routes = self._routes, dict()
+            deserialization_ns, self._deserialization_ns = self._deserialization_ns, 0
+        for route, metrics in sorted(routes.items()):
+            metrics["ConditionTime"] = metrics["ConditionTime"] / 1e3
+            handler_time = metrics.pop("HandlerTime")
+            if handler_time:
+                metrics["HandlerTime"] = handler_time[: self.MAX_VALUES]
+            self.__write(dict(Route=route), metrics)
+            for start in range(self.MAX_VALUES, len(handler_time), self.MAX_VALUES):
+                self.__write(
+                    dict(Route=route),
+                    dict(HandlerTime=handler_time[start : start + self.MAX_VALUES]),
+                )
+        self.__write(
+            dict(Service=self.namespace),
+            dict(
+                Records=records,
+                BatchTime=duration_ns / 1e6,
+                DeserializationTime=deserialization_ns / 1e6,
+            ),
+        )
+        self.stream.flush()
+
+    def condition_evaluated(self, route: str, duration_ns: int, matched: bool) -> None:
+        with self._lock:
+            metrics = self.__route(route)
+            metrics["Evaluations"] += 1
+            metrics["Matches"] += matched
+            metrics["ConditionTime"] += duration_ns
+
+    def handler_completed(self, route: str, duration_ns: int, failed: bool) -> None:
+        with self._lock:
+            metrics = self.__route(route)
+            metrics["Failures"] += failed
+            metrics["HandlerTime"].append(duration_ns / 1e6)
+
+    def record_completed(
+        self, operation: str, duration_ns: int, deserialization_ns: int, matches: int
+    ) -> None:
+        with self._lock:
+            self._deserialization_ns += deserialization_ns
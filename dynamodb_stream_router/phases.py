@@ -0,0 +1,245 @@
+"""
+Routing a batch in phases around its batch routes.
+
+Batch routes are called once with every record of the batch that matches
+them, so the records are routed in phases: every record is routed to its
+routes up to the priority of the first batch routes, then those are
+called, then every record is routed up to the priority of the next batch
+routes, and so on, with a last phase for the routes after them. Records
+that failed or were skipped in a phase are left out of the phases after
+it.
+"""
+from __future__ import annotations
+
+from functools import partial
+from itertools import groupby, islice
+from operator import attrgetter
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Callable, Hashable, Iterator, Optional
+
+from . import BatchRoute, FailureMode, Operation, Priorities, get_routes
+from .batch import run_batch
+from .failures import Unrouted, exclude, failure_key, sequence_number
+from .record import Record, RouteRecord
+from .routing import event_id
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from .deadline import Deadline
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+
+def route_phases(
+    records: list[Record],
+    prepared: list[RouteRecord],
+    routers: list[Callable[[Priorities], None]],
+    batch_routes: dict[BatchRoute, set[Operation]],
+    coalesced: int,
+    executor: Optional[Executor],
+    max_in_flight: Optional[int],
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    """
+    Routes records in phases, one per priority of batch_routes, and one for
+    the routes after the last of them. Returns the records that were not
+    routed.
+    """
+    unrouted: dict[int, Optional[str]] = dict()
+    for priorities, routes in phases(batch_routes, deadline):
+        if priorities:
+            exclude(
+                unrouted,
+                run_batch(
+                    [
+                        (row, record, partial(router, priorities))
+                        for row, (record, router) in enumerate(zip(records, routers))
+                        if row not in unrouted
+                    ],
+                    executor,
+                    max_in_flight,
+                    failure_mode,
+                    deadline,
+                ),
+                records,
+                failure_mode,
+            )
+        for route in routes:
+            call_batch_route(
+                route,
+                batch_routes[route],
+                records,
+                prepared,
+                unrouted,
+                coalesced,
+                metrics,
+                failure_mode,
+                dedup,
+                deadline,
+            )
+    return list(unrouted.items())
+
+
+def phases(
+    batch_routes: dict[BatchRoute, set[Operation]], deadline: Optional[Deadline]
+) -> Iterator[tuple[Optional[Priorities], list[BatchRoute]]]:
+    """
+    Yields the phases of routing around batch_routes: the priorities of the
+    routes that records are routed to, or None if there is no need to route
+    them, and the batch routes to call after that
+    """
+    low = float("-inf")
+    tiers = [
+        (priority, list(routes))
+        for priority, routes in groupby(
+            sorted(batch_routes, key=attrgetter("_priority", "name")),
+            key=attrgetter("_priority"),
+        )
+    ]
+    priorities = {
+        route._priority
+        for operation in Operation
+        for route in get_routes(operation)
+        if not isinstance(route, BatchRoute)
+    }
+    for high, routes in tiers + [(float("inf"), [])]:
+        # Past the deadline, a phase without routes would only report its
+        # records as not routed
+        if (
+            not deadline
+            or not deadline.expired
+            or any(low < priority <= high for priority in priorities)
+        ):
+            yield (low, high), routes
+        else:
+            yield None, routes
+        low = high
+
+
+def call_batch_route(
+    route: BatchRoute,
+    operations: set[Operation],
+    records: list[Record],
+    prepared: list[RouteRecord],
+    unrouted: dict[int, Optional[str]],
+    coalesced: int,
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> None:
+    """
+    Calls route with the records that are not in unrouted, and adds those
+    that failed, or are isolated by them, to unrouted
+    """
+    exclude(
+        unrouted,
+        __call_batch_route(
+            route,
+            operations,
+            [
+                row
+                for row in range(len(records))
+                if row not in unrouted and (row >= coalesced) == route.coalesce
+            ],
+            records,
+            prepared,
+            metrics,
+            failure_mode,
+            dedup,
+            deadline,
+        ),
+        records,
+        failure_mode,
+    )
+
+
+def __call_batch_route(
+    route: BatchRoute,
+    operations: set[Operation],
+    rows: list[int],
+    records: list[Record],
+    prepared: list[RouteRecord],
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Unrouted:
+    """
+    Calls route with the records of rows that match it, in order and at most
+    route.max_size at a time. Returns the records that failed, or that were
+    not started for deadline.
+    """
+    failed: Unrouted = list()
+    failed_keys: dict[Hashable, int] = dict()
+
+    def fail(rows: list[int], message: str) -> None:
+        from logging import getLogger
+
+        getLogger(__name__).exception(message, route.name)
+        for row in rows:
+            failed.append((row, sequence_number(records[row])))
+            failed_keys.setdefault(failure_key(records[row]), row)
+
+    def isolated(row: int) -> bool:
+        if failure_mode is FailureMode.STOP:
+            return bool(failed)
+        return bool(failed_keys) and row > failed_keys.get(
+            failure_key(records[row]), row
+        )
+
+    event_names = {operation.name for operation in operations}
+    matches: list[int] = list()
+    for row in rows:
+        record = records[row]
+        if isolated(row) or record.get("eventName") not in event_names:
+            continue
+        event = event_id(record) if dedup else None
+        if event and dedup.completed(route.dedup_key, event):
+            continue
+        condition_start = perf_counter_ns()
+        try:
+            matched = bool(route.match(prepared[row]))
+        except Exception:
+            if not failure_mode:
+                raise
+            fail([row], "Failed to evaluate the condition of %s")
+            continue
+        if metrics:
+            metrics.condition_evaluated(
+                route.dedup_key, perf_counter_ns() - condition_start, matched
+            )
+        if matched:
+            matches.append(row)
+
+    # Rows are checked as each chunk is taken, after the chunks before it
+    unisolated = (row for row in matches if not isolated(row))
+    while chunk := list(islice(unisolated, route.max_size or len(matches))):
+        if deadline and not deadline.start(route):
+            failed.extend(
+                (row, sequence_number(records[row])) for row in [*chunk, *unisolated]
+            )
+            break
+        handler_start = perf_counter_ns()
+        completed = False
+        try:
+            route([prepared[row] for row in chunk])
+            completed = True
+        except Exception:
+            if not failure_mode:
+                raise
+            fail(chunk, "Failed to call %s")
+        finally:
+            duration_ns = perf_counter_ns() - handler_start
+            if metrics:
+                metrics.handler_completed(route.dedup_key, duration_ns, not completed)
+            if deadline:
+                deadline.finished(duration_ns / 1e9, route)
+        for row in chunk if completed and dedup else ():
+            if event := event_id(records[row]):
+                dedup.complete(route.dedup_key, event)
+    return failed
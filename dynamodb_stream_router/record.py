@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from base64 import b64decode
+from collections.abc import Mapping, Sequence, Set
 from copy import deepcopy
-from typing import Any, TypedDict
-
-from boto3.dynamodb.types import TypeDeserializer
+from decimal import Decimal
+from operator import eq
+from time import perf_counter_ns
+from typing import Any, Callable, Iterator, Optional, TypedDict, Union
 
 AttributeValueMap = dict[str, dict[str, Any]]
+Path = tuple[Union[str, int], ...]
 
 
 class Identity(TypedDict, total=False):
@@ -35,46 +37,471 @@ class Record(TypedDict, total=False):
     userIdentity: Identity
 
 
-class StreamTypeDeserializer(TypeDeserializer):
-    def _deserialize_b(self, value):
-        if isinstance(value, str):
-            value = b64decode(value)
-        return super()._deserialize_b(value)
+def __getattr__(name: str) -> Any:
+    # The boto3 based types are imported on first use; see boto3_types
+    if name in ("Binary", "LazyBinary", "StreamTypeDeserializer"):
+        from . import boto3_types
+
+        return getattr(boto3_types, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _binary(value: str) -> Any:
+    """
+    Deserializes the first B value, importing boto3 for LazyBinary and then
+    putting LazyBinary into AttributeValueDeserializer.SCALARS
+    """
+    from .boto3_types import LazyBinary
+
+    AttributeValueDeserializer.SCALARS.update(
+        B=LazyBinary, BS=lambda value: set(map(LazyBinary, value))
+    )
+    return LazyBinary(value)
+
+
+class AttributeValueDeserializer:
+    """
+    Deserializes DynamoDB AttributeValues into the same Python values as
+    StreamTypeDeserializer, but without recursion or per-value attribute
+    lookups. Maps and lists are built with an explicit stack; everything
+    else is converted through the SCALARS table. Binary values are returned
+    as LazyBinary so that base64 is only decoded if the bytes are read.
+
+    Given names, attribute names are looked up in it and added to it if
+    they are missing, so that records sharing the dict share the strings.
+    """
+
+    SCALARS = dict(
+        S=str,
+        N=Decimal,
+        BOOL=bool,
+        NULL=lambda _: None,
+        B=_binary,
+        SS=set,
+        NS=lambda value: set(map(Decimal, value)),
+        BS=lambda value: set(map(_binary, value)),
+    )
+
+    @staticmethod
+    def __unpack(value: dict[str, Any]) -> tuple[str, Any]:
+        if not value:
+            raise TypeError(
+                "Value must be a nonempty dictionary whose key "
+                "is a valid dynamodb type."
+            )
+        for item in value.items():
+            return item
+
+    def deserialize(
+        self, value: dict[str, Any], names: Optional[dict[str, str]] = None
+    ) -> Any:
+        scalars = self.SCALARS
+        unpack = self.__unpack
+        if names is None:
+            attributes = dict.items
+        else:
+
+            def attributes(value: dict[str, Any]) -> Iterator[tuple[str, Any]]:
+                return zip(map(names.setdefault, value, value), value.values())
+
+        dynamodb_type, value = unpack(value)
+        if dynamodb_type in scalars:
+            return scalars[dynamodb_type](value)
+        if dynamodb_type == "M":
+            result = dict()
+            items = iter(attributes(value))
+        elif dynamodb_type == "L":
+            result = [None] * len(value)
+            items = enumerate(value)
+        else:
+            raise TypeError(f"Dynamodb type {dynamodb_type} is not supported")
+        stack = [(result, items)]
+        while stack:
+            container, items = stack[-1]
+            for key, value in items:
+                if len(value) != 1:
+                    dynamodb_type, value = unpack(value)
+                else:
+                    [(dynamodb_type, value)] = value.items()
+                if dynamodb_type == "S":
+                    container[key] = value
+                elif dynamodb_type == "N":
+                    container[key] = Decimal(value)
+                elif dynamodb_type == "M":
+                    container[key] = child = dict()
+                    stack.append((child, iter(attributes(value))))
+                    break
+                elif dynamodb_type == "L":
+                    container[key] = child = [None] * len(value)
+                    stack.append((child, enumerate(value)))
+                    break
+                elif dynamodb_type in scalars:
+                    container[key] = scalars[dynamodb_type](value)
+                else:
+                    raise TypeError(f"Dynamodb type {dynamodb_type} is not supported")
+            else:
+                stack.pop()
+        return result
+
+
+def _bytes(value: Union[str, bytes]) -> bytes:
+    from base64 import b64decode
+
+    return b64decode(value) if isinstance(value, str) else bytes(value)
+
+
+# How raw values of the same type compare once deserialized, where that is
+# not simply equality of the raw values
+EQUALITY: dict[str, Callable[[Any, Any], bool]] = dict(
+    N=lambda a, b: Decimal(a) == Decimal(b),
+    B=lambda a, b: _bytes(a) == _bytes(b),
+    SS=lambda a, b: set(a) == set(b),
+    NS=lambda a, b: set(map(Decimal, a)) == set(map(Decimal, b)),
+    BS=lambda a, b: set(map(_bytes, a)) == set(map(_bytes, b)),
+)
+
+
+def __diff(path: Path, old: Any, new: Any, changed: list[Path]) -> None:
+    # old and new are both the value of an M, or both the value of an L
+    if isinstance(old, list):
+        steps = range(max(len(old), len(new)))
+        old, new = dict(enumerate(old)), dict(enumerate(new))
+    else:
+        steps = old.keys() | new.keys()
+    for step in steps:
+        old_value, new_value = old.get(step), new.get(step)
+        if old_value == new_value:
+            continue
+        if old_value is None or new_value is None:
+            changed.append((*path, step))
+            continue
+        [(old_type, old_value)] = old_value.items()
+        [(new_type, new_value)] = new_value.items()
+        if old_type != new_type:
+            changed.append((*path, step))
+        elif old_type in ("M", "L"):
+            __diff((*path, step), old_value, new_value, changed)
+        elif not EQUALITY.get(old_type, eq)(old_value, new_value):
+            changed.append((*path, step))
+
+
+def diff(
+    old: Optional[AttributeValueMap], new: Optional[AttributeValueMap]
+) -> frozenset[Path]:
+    """
+    Returns the paths of the attributes that differ between two images of
+    raw AttributeValues. Values compare as their deserialized values do,
+    except that values of different types always differ. Maps and lists in
+    both images are compared item by item, so that a path is as deep as the
+    change; an attribute that is only in one image is a path of its own.
+    """
+    if old == new:
+        return frozenset()
+    changed: list[Path] = list()
+    __diff((), old or dict(), new or dict(), changed)
+    return frozenset(changed)
+
+
+class ImageView(Mapping):
+    """
+    A read-only view of a deserialized dict. Nested dicts, lists and sets are
+    returned as views as well, so nothing is copied until mutable_copy() or
+    to_dict() is called.
+    """
+
+    __slots__ = ("__data",)
+
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.__data = data
+
+    def __getitem__(self, key: str) -> Any:
+        return view(self.__data[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__data)
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__data!r})"
+
+    def mutable_copy(self) -> dict[str, Any]:
+        return deepcopy(self.__data)
+
+    to_dict = mutable_copy
+
+
+class ListView(Sequence):
+    """A read-only view of a deserialized list"""
+
+    __slots__ = ("__data",)
+
+    def __init__(self, data: list[Any]) -> None:
+        self.__data = data
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (ListView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __getitem__(self, index: int) -> Any:
+        if isinstance(index, slice):
+            return ListView(self.__data[index])
+        return view(self.__data[index])
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__data!r})"
+
+    def mutable_copy(self) -> list[Any]:
+        return deepcopy(self.__data)
+
+
+class SetView(Set):
+    """A read-only view of a deserialized set"""
+
+    __slots__ = ("__data",)
+
+    def __init__(self, data: set[Any]) -> None:
+        self.__data = data
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.__data
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.__data)
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__data!r})"
+
+    def mutable_copy(self) -> set[Any]:
+        return deepcopy(self.__data)
+
+
+VIEWS = {dict: ImageView, list: ListView, set: SetView}
+
+
+def view(value: Any) -> Any:
+    """Returns a read-only view of value if it is a dict, list or set"""
+    view_type = VIEWS.get(type(value))
+    return view_type(value) if view_type else value
 
 
 class RouteRecord:
-    __DESERIALIZER = StreamTypeDeserializer()
+    """
+    Wraps a stream Record, lazily deserializing Keys, NewImage and OldImage.
+    Conditions read individual attribute paths, so an image is only fully
+    deserialized when something asks for all of it.
+
+    By default every property access returns a deep copy, so handlers are
+    free to mutate what they are given. With immutable=True the properties
+    instead return read-only views (ImageView, ListView and SetView) that
+    share the deserialized data; call mutable_copy() on a view for a copy
+    that can be changed.
+
+    With timed=True the time spent deserializing is accumulated in
+    deserialization_ns. names is a dict shared by the records of a batch,
+    which attribute names are interned in (see AttributeValueDeserializer).
 
-    def __init__(self, record: Record) -> None:
-        self.__keys: dict[str, Any] = None
-        self.__new_image: dict[str, Any] = None
-        self.__old_image: dict[str, Any] = None
+    Records are kept small for large batches: Keys are taken from an image
+    that has been deserialized rather than deserialized again, and once an
+    image has been, the values read from its paths are replaced by the same
+    values within it.
+    """
+
+    __DESERIALIZER = AttributeValueDeserializer()
+    __IMAGES = dict(keys="Keys", new_image="NewImage", old_image="OldImage")
+
+    __slots__ = (
+        "__changed",
+        "__changed_prefixes",
+        "__images",
+        "__immutable",
+        "__names",
+        "__paths",
+        "__record",
+        "__timed",
+        "_memo",
+        "deserialization_ns",
+    )
+
+    def __init__(
+        self,
+        record: Record,
+        immutable: bool = False,
+        timed: bool = False,
+        names: Optional[dict[str, str]] = None,
+    ) -> None:
+        self.__changed: frozenset[Path] = None
+        self.__changed_prefixes: frozenset[Path] = None
+        self.__images: dict[str, dict[str, Any]] = dict()
+        self.__immutable = immutable
+        self.__names = names
+        self.__paths: dict[tuple[str, Path], Any] = dict()
         self.__record = record
+        self.__timed = timed
+        # The values of the sub-expressions that conditions share, by slot
+        self._memo: dict[int, Any] = dict()
+        self.deserialization_ns = 0
+
+    def __deserialize(self, value: dict[str, Any]) -> Any:
+        if not self.__timed:
+            return self.__DESERIALIZER.deserialize(value, self.__names)
+        start = perf_counter_ns()
+        try:
+            return self.__DESERIALIZER.deserialize(value, self.__names)
+        finally:
+            self.deserialization_ns += perf_counter_ns() - start
+
+    def __share(self, value: Any) -> Any:
+        return view(value) if self.__immutable else deepcopy(value)
+
+    def _image(self, name: str) -> dict[str, Any]:
+        """
+        Returns the named image ("keys", "new_image" or "old_image") without
+        copying it. Only for callers, such as compiled conditions, that
+        never mutate what they read.
+        """
+        try:
+            return self.__images[name]
+        except KeyError:
+            pass
+        item = self.__record["dynamodb"].get(self.__IMAGES[name])
+        if item is None:
+            return None
+        if name == "keys":
+            image = self.__keys(item)
+        else:
+            image = self.__deserialize(dict(M=item))
+            for key in self.__paths:
+                if key[0] == name:
+                    self.__paths[key] = self.__walk(image, key[1])
+        self.__images[name] = image
+        return image
+
+    def __keys(self, keys: AttributeValueMap) -> dict[str, Any]:
+        # Key attributes are in both images and never change, so an image
+        # that has been deserialized already holds their values
+        for name in ("new_image", "old_image"):
+            image = self.__images.get(name)
+            if image is not None and all(key in image for key in keys):
+                return {key: image[key] for key in keys}
+        return self.__deserialize(dict(M=keys))
+
+    def _path(self, name: str, path: Path) -> Any:
+        """
+        Returns the value at path within the named image without copying it,
+        deserializing only that value unless the whole image already has
+        been. Missing attributes, and steps into anything other than a map
+        (for names) or a list (for indexes), resolve to None.
+        """
+        try:
+            return self.__paths[(name, path)]
+        except KeyError:
+            pass
+        if name in self.__images:
+            value = self.__walk(self.__images[name], path)
+        else:
+            value = self.__raw(name, path)
+            if value is not None:
+                value = self.__deserialize(value)
+        self.__paths[(name, path)] = value
+        return value
+
+    @staticmethod
+    def __walk(value: Any, path: Path) -> Any:
+        """Returns the value at path within a deserialized image, or None"""
+        for step in path:
+            if isinstance(step, int):
+                value = (
+                    value[step]
+                    if isinstance(value, list) and len(value) > step
+                    else None
+                )
+            else:
+                value = value.get(step) if isinstance(value, dict) else None
+        return value
+
+    def __raw(self, name: str, path: Path) -> Optional[dict[str, Any]]:
+        """Returns the AttributeValue at path within the named image, or None"""
+        value = self.__record["dynamodb"].get(self.__IMAGES[name])
+        if value is not None:
+            value = dict(M=value)
+        for step in path:
+            if value is None:
+                break
+            if isinstance(step, int):
+                items = value.get("L")
+                value = (
+                    items[step]
+                    if isinstance(items, list) and len(items) > step
+                    else None
+                )
+            else:
+                attributes = value.get("M")
+                value = attributes.get(step) if isinstance(attributes, dict) else None
+        return value
+
+    def _changed(self, path: Path) -> bool:
+        """
+        True if the value at path differs between OldImage and NewImage,
+        because it, an attribute within it or one that contains it changed
+        """
+        changed = self.changed_paths
+        if not changed:
+            return False
+        if self.__changed_prefixes is None:
+            self.__changed_prefixes = frozenset(
+                changed_path[:length]
+                for changed_path in changed
+                for length in range(1, len(changed_path) + 1)
+            )
+        if path in self.__changed_prefixes:
+            return True
+        for length in range(1, len(path)):
+            if path[:length] in changed:
+                # A map or list that contains path was replaced, added or
+                # removed, so whatever is at path is only in one of the images
+                return (
+                    self.__raw("old_image", path) is not None
+                    or self.__raw("new_image", path) is not None
+                )
+        return False
+
+    @property
+    def changed_paths(self) -> frozenset[Path]:
+        """
+        The paths of the attributes that differ between OldImage and NewImage,
+        such as ("address", "zip"), worked out once from the raw images; see
+        diff(). For INSERT and REMOVE records every attribute has changed.
+        """
+        if self.__changed is None:
+            dynamodb = self.__record["dynamodb"]
+            self.__changed = diff(dynamodb.get("OldImage"), dynamodb.get("NewImage"))
+        return self.__changed
+
+    @property
+    def immutable(self) -> bool:
+        return self.__immutable
 
     @property
     def keys(self) -> dict[str, Any]:
-        if self.__keys is None and "Keys" in self.__record["dynamodb"]:
-            self.__keys = self.__DESERIALIZER.deserialize(
-                dict(M=self.__record["dynamodb"]["Keys"])
-            )
-        return deepcopy(self.__keys)
+        return self.__share(self._image("keys"))
 
     @property
     def new_image(self) -> dict[str, Any]:
-        if self.__new_image is None and "NewImage" in self.__record["dynamodb"]:
-            self.__new_image = self.__DESERIALIZER.deserialize(
-                dict(M=self.__record["dynamodb"]["NewImage"])
-            )
-        return deepcopy(self.__new_image)
+        return self.__share(self._image("new_image"))
 
     @property
     def old_image(self) -> dict[str, Any]:
-        if self.__old_image is None and "OldImage" in self.__record["dynamodb"]:
-            self.__old_image = self.__DESERIALIZER.deserialize(
-                dict(M=self.__record["dynamodb"]["OldImage"])
-            )
-        return deepcopy(self.__old_image)
+        return self.__share(self._image("old_image"))
 
     @property
     def record(self) -> Record:
-        return deepcopy(self.__record)
+        return self.__share(self.__record)
@@ -0,0 +1,278 @@
+"""
+Replaying captured stream events to see where routing spends its time.
+
+main() imports the modules that register routes, routes the records of a
+captured file through route_records with an InMemoryMetrics sink, and
+reports records per second, each route's hit rate and condition cost, and
+how the time was split between deserialization, conditions and handlers.
+With --stub the handlers are replaced by ones that do nothing, so that
+routing can be measured without the side effects of the real handlers.
+With --profile the replay is profiled with cProfile and the stats are
+written to a file, for pstats or snakeviz.
+
+    python -m dynamodb_stream_router.replay events.jsonl my_routes --stub
+
+The file holds a Lambda event as JSON, or JSON Lines, each line of which
+is a Lambda event or a single record. Each event is routed as a batch, as
+Lambda would; single records are routed --batch-size at a time.
+"""
+from __future__ import annotations
+
+import json
+import sys
+from argparse import ArgumentParser
+from cProfile import Profile
+from functools import update_wrapper
+from importlib import import_module
+from itertools import chain
+from time import perf_counter_ns
+from typing import Any, Iterable, Iterator, Optional
+
+from . import (
+    BatchRoute,
+    FailureMode,
+    Operation,
+    Route,
+    add_route,
+    get_routes,
+    remove_route,
+    route_records,
+)
+from .metrics import InMemoryMetrics
+from .record import Record
+
+# The default batch size of a DynamoDB stream event source mapping
+BATCH_SIZE = 100
+
+
+def batches(
+    lines: Iterable[str], batch_size: int = BATCH_SIZE
+) -> Iterator[list[Record]]:
+    """Yields the batches of a captured file, given its lines"""
+    records: list[Record] = list()
+    for value in values(lines):
+        for item in value if isinstance(value, list) else (value,):
+            if "Records" in item:
+                if records:
+                    yield records
+                    records = list()
+                yield item["Records"]
+                continue
+            records.append(item)
+            if len(records) == batch_size:
+                yield records
+                records = list()
+    if records:
+        yield records
+
+
+def values(lines: Iterable[str]) -> Iterator[Any]:
+    """
+    Yields the JSON values of lines, one per line, or the one value of all
+    of them if the first is not a value in itself, as in an indented event
+    """
+    lines = iter(lines)
+    first = True
+    for line in lines:
+        if not line.strip():
+            continue
+        if first:
+            first = False
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield json.loads(line + "".join(lines))
+            continue
+        yield json.loads(line)
+
+
+def stub_handlers() -> int:
+    """
+    Replaces the handler of every route with one that does nothing and has
+    the same name, so that metrics still report it. Returns the number of
+    routes replaced.
+    """
+    stubs: dict[int, Route] = dict()
+    for operation in Operation:
+        for route in get_routes(operation):
+            if id(route) not in stubs:
+                stubs[id(route)] = __stub(route)
+            remove_route(operation, route)
+            add_route(operation, stubs[id(route)])
+    return len(stubs)
+
+
+def __stub(route: Route) -> Route:
+    def handler(record: Any) -> None:
+        pass
+
+    update_wrapper(handler, route._handler)
+    if isinstance(route, BatchRoute):
+        return BatchRoute(
+            condition=route._condition,
+            handler=handler,
+            priority=route._priority,
+            max_size=route.max_size,
+            coalesce=route.coalesce,
+            dedup_key=route.dedup_key,
+        )
+    return Route(
+        condition=route._condition,
+        handler=handler,
+        priority=route._priority,
+        coalesce=route.coalesce,
+        dedup_key=route.dedup_key,
+    )
+
+
+def replay(
+    batches: Iterable[list[Record]],
+    immutable: bool = False,
+    profile: Optional[Profile] = None,
+) -> dict[str, Any]:
+    """
+    Routes batches, and returns the metrics snapshot of routing them with
+    the time spent in route_records and the number of records that failed
+    """
+    metrics = InMemoryMetrics()
+    failed = 0
+    time_ns = 0
+    for batch in batches:
+        if profile:
+            profile.enable()
+        start = perf_counter_ns()
+        response = route_records(
+            batch,
+            immutable=immutable,
+            metrics=metrics,
+            failure_mode=FailureMode.CONTINUE_OTHER_KEYS,
+        )
+        time_ns += perf_counter_ns() - start
+        if profile:
+            profile.disable()
+        failed += len(response["batchItemFailures"])
+    return dict(metrics.snapshot(), failed=failed, time_ns=time_ns)
+
+
+def report(snapshot: dict[str, Any]) -> dict[str, Any]:
+    """Returns the figures that main() prints, from the result of replay()"""
+    records = snapshot["batches"]["records"]
+    time_ns = snapshot["time_ns"]
+    routes = snapshot["routes"]
+    condition_ns = sum(route["condition"]["total_ns"] for route in routes.values())
+    handler_ns = sum(
+        route["handler"]["total_ns"] for route in routes.values() if route["handler"]
+    )
+    return dict(
+        records=records,
+        batches=snapshot["batches"]["count"],
+        failed=snapshot["failed"],
+        seconds=time_ns / 1e9,
+        records_per_second=records * 1e9 / time_ns if time_ns else 0.0,
+        # Deserialization happens in the conditions and handlers that first
+        # read an image, and is part of their time as well
+        time_ns=dict(
+            deserialization=snapshot["records"]["deserialization"]["total_ns"],
+            conditions=condition_ns,
+            handlers=handler_ns,
+            other=max(time_ns - condition_ns - handler_ns, 0),
+        ),
+        routes={
+            name: dict(
+                evaluations=route["evaluations"],
+                matches=route["matches"],
+                hit_rate=route["matches"] / route["evaluations"]
+                if route["evaluations"]
+                else 0.0,
+                condition_mean_ns=route["condition"]["mean_ns"],
+                condition_p99_ns=route["condition"]["p99_ns"],
+                handler_mean_ns=route["handler"]["mean_ns"] if route["handler"] else 0,
+                failures=route["failures"],
+            )
+            for name, route in sorted(
+                routes.items(),
+                key=lambda item: item[1]["condition"]["total_ns"],
+                reverse=True,
+            )
+        },
+    )
+
+
+def __print(figures: dict[str, Any]) -> None:
+    records = figures["records"] or 1
+    print(
+        f"{figures['records']:,} records in {figures['batches']:,} batches, "
+        f"{figures['failed']:,} failed: {figures['seconds']:.3f} s, "
+        f"{figures['records_per_second']:,.0f} records/s"
+    )
+    print()
+    print(f"{'time':<16}{'total ms':>12}{'per record us':>16}")
+    for part, time_ns in figures["time_ns"].items():
+        print(f"{part:<16}{time_ns / 1e6:>12.3f}{time_ns / records / 1e3:>16.2f}")
+    print()
+    width = max(chain((5,), map(len, figures["routes"])))
+    print(
+        f"{'route':<{width}}{'evaluations':>13}{'hit rate':>10}"
+        f"{'condition us':>14}{'p99 us':>10}{'handler us':>12}{'failures':>10}"
+    )
+    for name, route in figures["routes"].items():
+        print(
+            f"{name:<{width}}{route['evaluations']:>13,}{route['hit_rate']:>10.1%}"
+            f"{route['condition_mean_ns'] / 1e3:>14.2f}"
+            f"{route['condition_p99_ns'] / 1e3:>10.2f}"
+            f"{route['handler_mean_ns'] / 1e3:>12.2f}{route['failures']:>10,}"
+        )
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        prog="python -m dynamodb_stream_router.replay",
+        description="Replays captured stream events through the routes that "
+        "modules register, and reports where routing spends its time.",
+    )
+    parser.add_argument(
+        "file", help="a Lambda event as JSON, or JSON Lines of events or records"
+    )
+    parser.add_argument(
+        "modules", nargs="+", help="the modules to import to register routes"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="the number of single records to route at a time",
+    )
+    parser.add_argument(
+        "--immutable", action="store_true", help="route immutable records"
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument(
+        "--profile", metavar="FILE", help="write cProfile stats of the replay to FILE"
+    )
+    parser.add_argument(
+        "--stub", action="store_true", help="replace handlers with ones that do nothing"
+    )
+    args = parser.parse_args()
+    # Modules are imported from the current directory, as python -m would
+    sys.path.insert(0, "")
+    try:
+        for module in args.modules:
+            import_module(module)
+    finally:
+        sys.path.remove("")
+    if args.stub:
+        stub_handlers()
+    profile = Profile() if args.profile else None
+    with open(args.file) as file:
+        snapshot = replay(batches(file, args.batch_size), args.immutable, profile)
+    if profile:
+        profile.dump_stats(args.profile)
+    figures = report(snapshot)
+    if args.json:
+        print(json.dumps(figures, indent=2))
+    else:
+        __print(figures)
+
+
+if __name__ == "__main__":
+    main()
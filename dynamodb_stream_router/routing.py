@@ -0,0 +1,187 @@
+"""
+Routing records one at a time.
+
+route_record evaluates the conditions of the routes that the route index
+gives for a record, in priority order, and then calls the routes that
+matched a priority tier at a time; routes of equal priority are called
+together on an executor, if there is one. With a DedupStore, routes that
+have completed the record's event before are not called again. With a
+MetricsSink every condition and handler call is timed.
+"""
+from __future__ import annotations
+
+from itertools import groupby
+from operator import attrgetter
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
+
+from . import Operation, Priorities, Route, get_route_index
+from .failures import sequence_number
+from .record import Record, RouteRecord
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+
+def route_record(
+    record: Record,
+    prepared: RouteRecord,
+    executor: Executor,
+    metrics: Optional[MetricsSink],
+    dedup: Optional[DedupStore],
+    priorities: Priorities = None,
+    coalesce: bool = False,
+) -> None:
+    """
+    Routes record, which prepared wraps, to its routes, or with priorities
+    only to those of its routes with priorities in that range. With
+    coalesce, record is a net change and is routed to the routes for those.
+    """
+    if metrics:
+        return __instrumented_route_record(
+            record, prepared, executor, metrics, dedup, priorities, coalesce
+        )
+    operation = Operation[record["eventName"]]
+    event = event_id(record) if dedup else None
+    call_routes(
+        [
+            route
+            for route in candidates(operation, prepared, priorities, coalesce)
+            if route.match(prepared)
+        ],
+        prepared,
+        executor,
+        dedup,
+        event,
+    )
+
+
+def route_wrapped(
+    record: Record,
+    executor: Executor,
+    immutable: bool,
+    metrics: Optional[MetricsSink],
+    dedup: Optional[DedupStore],
+    names: dict[str, str],
+    coalesce: bool,
+) -> None:
+    # Wraps record only when it is routed, so that a batch's RouteRecords
+    # are not all held at once
+    route_record(
+        record,
+        RouteRecord(record, immutable, bool(metrics), names),
+        executor,
+        metrics,
+        dedup,
+        coalesce=coalesce,
+    )
+
+
+def candidates(
+    operation: Operation,
+    record: RouteRecord,
+    priorities: Optional[Priorities],
+    coalesce: bool,
+) -> Iterable[Route]:
+    """
+    Returns the routes for operation that may match record, in priority
+    order, with priorities only those with priorities in that range
+    """
+    routes = get_route_index(operation, coalesce).candidates(record)
+    if not priorities:
+        return routes
+    low, high = priorities
+    return [route for route in routes if low < route._priority <= high]
+
+
+def call_routes(
+    matches: list[Route],
+    record: RouteRecord,
+    executor: Executor,
+    dedup: Optional[DedupStore] = None,
+    event: Optional[str] = None,
+) -> None:
+    matches, call = __deduplicate(matches, dedup, event)
+    for _, routes in groupby(matches, key=attrgetter("_priority")):
+        routes = list(routes)
+        call(routes[0], record) if len(routes) == 1 else list(
+            (executor.map if executor else map)(call, routes, [record] * len(routes))
+        )
+
+
+def __deduplicate(
+    matches: list[Route], dedup: Optional[DedupStore], event: Optional[str]
+) -> tuple[list[Route], Callable[[Route, RouteRecord], Any]]:
+    """
+    Returns the routes in matches that have not completed event, and a
+    function that calls a route and stores that it completed event
+    """
+    if not (dedup and event):
+        return matches, Route.__call__
+
+    def call(route: Route, record: RouteRecord) -> Any:
+        result = route(record)
+        dedup.complete(route.dedup_key, event)
+        return result
+
+    return [
+        route for route in matches if not dedup.completed(route.dedup_key, event)
+    ], call
+
+
+def event_id(record: Record) -> Optional[str]:
+    return record.get("eventID") or sequence_number(record)
+
+
+def __instrumented_route_record(
+    record: Record,
+    prepared: RouteRecord,
+    executor: Executor,
+    metrics: MetricsSink,
+    dedup: Optional[DedupStore],
+    priorities: Optional[Priorities],
+    coalesce: bool,
+) -> None:
+    start = perf_counter_ns()
+    operation = Operation[record["eventName"]]
+    event = event_id(record) if dedup else None
+    record = prepared
+    matches = []
+    for route in candidates(operation, record, priorities, coalesce):
+        condition_start = perf_counter_ns()
+        matched = bool(route.match(record))
+        metrics.condition_evaluated(
+            route.dedup_key, perf_counter_ns() - condition_start, matched
+        )
+        if matched:
+            matches.append(route)
+    uncompleted, call_route = __deduplicate(matches, dedup, event)
+
+    def call(route: Route) -> Any:
+        handler_start = perf_counter_ns()
+        failed = True
+        try:
+            result = call_route(route, record)
+            failed = False
+            return result
+        finally:
+            metrics.handler_completed(
+                route.dedup_key, perf_counter_ns() - handler_start, failed
+            )
+
+    try:
+        for _, routes in groupby(uncompleted, key=attrgetter("_priority")):
+            routes = list(routes)
+            call(routes[0]) if len(routes) == 1 else list(
+                (executor.map if executor else map)(call, routes)
+            )
+    finally:
+        metrics.record_completed(
+            operation.name,
+            perf_counter_ns() - start,
+            record.deserialization_ns,
+            len(matches),
+        )
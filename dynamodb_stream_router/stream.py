@@ -0,0 +1,191 @@
+"""
+Incremental decoding of DynamoDB stream events.
+
+iter_records() reads the JSON of a Lambda event a chunk at a time and
+yields each record of its Records array as soon as that record has been
+decoded. Only the current chunk and the current record are held in memory,
+however large the event is, and the first record can be routed before the
+rest of the event has been read. A JSON array of records, as captured from
+a stream, is read the same way.
+
+route_source routes each record as soon as it has been decoded, and
+releases it once it has been routed.
+"""
+from __future__ import annotations
+
+import codecs
+from functools import partial
+from io import BytesIO
+from json import JSONDecodeError, JSONDecoder
+from time import perf_counter_ns
+from typing import IO, TYPE_CHECKING, Any, Callable, Iterable, Iterator, Optional, Union
+
+from . import BatchResponse, FailureMode
+from .failures import batch_response, run_routers, stop_event
+from .record import Record
+from .routing import route_wrapped
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from .deadline import Deadline
+    from .dedup import DedupStore
+    from .metrics import MetricsSink
+
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = " \t\n\r"
+
+Source = Union[bytes, bytearray, memoryview, str, IO[bytes], IO[str]]
+
+
+class _Reader:
+    """A cursor over JSON text that reads more of its source on demand"""
+
+    __DECODER = JSONDecoder()
+
+    def __init__(self, source: Source, chunk_size: int) -> None:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(source)
+        self.buffer = source if isinstance(source, str) else ""
+        self.chunk_size = chunk_size
+        self.eof = isinstance(source, str)
+        self.position = 0
+        self.source = source
+        self.text = codecs.getincrementaldecoder("utf-8")()
+
+    def error(self, message: str) -> JSONDecodeError:
+        return JSONDecodeError(message, self.buffer, self.position)
+
+    def read(self) -> None:
+        """
+        Appends the next chunk of the source to what is left of the buffer.
+        Reads at least as much as is left, so that decoding a large value
+        again after each read does not take quadratic time.
+        """
+        size = max(self.chunk_size, len(self.buffer) - self.position)
+        chunk = raw = self.source.read(size)
+        if isinstance(raw, (bytes, bytearray)):
+            chunk = self.text.decode(raw, final=not raw)
+            # A read that ends partway through a character decodes to nothing
+            while raw and not chunk:
+                raw = self.source.read(size)
+                chunk = self.text.decode(raw, final=not raw)
+        self.eof = not raw
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+
+    def peek(self) -> str:
+        """Returns the next character that is not whitespace, '' at the end"""
+        while True:
+            buffer = self.buffer
+            while self.position < len(buffer) and buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(buffer) or self.eof:
+                return buffer[self.position : self.position + 1]
+            self.read()
+
+    def take(self, characters: str) -> str:
+        """Consumes and returns the next character, which must be one of characters"""
+        character = self.peek()
+        if not character or character not in characters:
+            raise self.error(f"Expecting one of {characters!r}")
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        """Decodes the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.__DECODER.raw_decode(self.buffer, self.position)
+            except JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            self.read()
+
+    def array(self) -> Iterator[Any]:
+        """Decodes the items of the next JSON array one at a time"""
+        self.take("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            if self.take(",]") == "]":
+                return
+
+
+def iter_records(source: Source, chunk_size: int = CHUNK_SIZE) -> Iterator[Record]:
+    """
+    Yields the records of an event, given as JSON in bytes, a str or a
+    binary or text file-like object, one at a time as they are decoded.
+    The event may be an object with a Records array, such as the event of
+    a Lambda function, or an array of records. Raises JSONDecodeError
+    when the JSON is invalid, after yielding the records before the error.
+    """
+    reader = _Reader(source, chunk_size)
+    if reader.peek() == "[":
+        yield from reader.array()
+        return
+    reader.take("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.take(":")
+        if key == "Records":
+            yield from reader.array()
+        else:
+            reader.value()
+        if reader.take(",}") == "}":
+            return
+
+
+def route_source(
+    source: Source,
+    executor: Optional[Executor],
+    immutable: bool,
+    metrics: Optional[MetricsSink],
+    failure_mode: Optional[FailureMode],
+    dedup: Optional[DedupStore],
+    deadline: Optional[Deadline],
+) -> Optional[BatchResponse]:
+    """
+    Routes the records of source one at a time as they are decoded, and
+    returns the response for the records that were not routed if there is
+    a failure_mode or a deadline
+    """
+    start = perf_counter_ns()
+    decoded = 0
+    # Records are decoded separately, so only this shares their attribute
+    # names once they are released
+    names: dict[str, str] = dict()
+
+    def routers() -> Iterable[tuple[int, Record, Callable[[], None]]]:
+        nonlocal decoded
+        for decoded, record in enumerate(iter_records(source), 1):
+            yield decoded, record, partial(
+                route_wrapped,
+                record,
+                executor,
+                immutable,
+                metrics,
+                dedup,
+                names,
+                False,
+            )
+
+    try:
+        unrouted = run_routers(
+            routers(), failure_mode, stop_event(failure_mode), deadline
+        )
+        return batch_response(unrouted) if failure_mode or deadline else None
+    finally:
+        if metrics:
+            metrics.batch_completed(decoded, perf_counter_ns() - start)
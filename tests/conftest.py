@@ -0,0 +1,12 @@
+import pytest
+
+from dynamodb_stream_router import Operation, get_routes, remove_route
+
+
+@pytest.fixture(autouse=True)
+def routes():
+    """Removes the routes that a test registered"""
+    yield
+    for operation in Operation:
+        for route in get_routes(operation):
+            remove_route(operation, route)
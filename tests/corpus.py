@@ -0,0 +1,218 @@
+"""
+Expressions and records that the condition backends are checked on. The
+records hold values of every shape, so that most expressions raise for
+at least one of them.
+"""
+from typing import Any, Callable
+
+from sly import Parser
+
+from dynamodb_stream_router.conditions.closures import build_condition
+from dynamodb_stream_router.conditions.lexer import ExpressionLexer
+from dynamodb_stream_router.conditions.nodes import Node
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.record import RouteRecord
+
+EXPRESSIONS = [
+    "$NEW.entity_type == 'order'",
+    "$NEW.entity_type != 'order'",
+    "$NEW.order.total > 100",
+    "$NEW.order.total >= 100 & $NEW.order.total <= 500",
+    "$NEW.order.total BETWEEN 10 & 1000",
+    "$NEW.order.customer.address.zip == '10001'",
+    "$NEW.order.customer.address.zip == '10001' & $NEW.order.customer.address.city == 'New York'",
+    "$NEW.order.customer.address.country.code == 'US' | $NEW.order.customer.address.country.code == 'CA'",
+    "$NEW.order.lines[0].sku == 'sku-1'",
+    "$NEW.order.lines[5].sku == 'sku-1'",
+    "$NEW.order['status'] IN ('NEW', 'PAID', 'SHIPPED')",
+    "$NEW.order.status =~ '^P'",
+    "NOT $NEW.deleted_at",
+    "NOT $NEW.entity_type == 'order'",
+    "NOT NOT $NEW.entity_type == 'order'",
+    "attribute_exists($NEW.order.customer)",
+    "attribute_not_exists($OLD.order)",
+    "begins_with($NEW.pk, 'ORDER#')",
+    "contains($NEW.tags, 'vip')",
+    "contains($NEW.pk, 'ORDER')",
+    "size($NEW.order.lines) > 1",
+    "size($NEW.missing) < 0",
+    "is_type($NEW.order, M) & is_type($NEW.tags, SS)",
+    "is_type($NEW.order.total, N)",
+    "from_json($NEW.payload)",
+    "has_changed('status')",
+    "has_changed('status', 'order')",
+    "$NEW.flag == True | NOT $NEW.flag",
+    "($NEW.a == 1 | $NEW.b == 2) & ($NEW.c == 3 | $NEW.order.total > 5)",
+    "$NEW.order.total > $OLD.order.total",
+    "$NEW.pk > 1",
+    # Constant folding, including operators that raise on their constants
+    "1 == 1 & $NEW.a == 1",
+    "1 < 2 | $NEW.a == 1",
+    "1 < 'a' | $NEW.a == 1",
+    "2 BETWEEN 1 & 3",
+    "'a' BETWEEN 1 & 3",
+    "'x' IN ('x', 'y') & $NEW.entity_type == 'order'",
+    "'ORDER#1' =~ '^ORDER'",
+    "$NEW.a == 1 & 1 == 1",
+    "1 == 2 | $NEW.a == 1",
+    "$NEW.a == 1 | 1 == 2",
+    "from_json($NEW.payload) & 1 == 1",
+    "from_json($NEW.payload) | 1 == 2",
+    "NOT 1 == 1",
+    # NOT NOT around bools and around values that are not bools
+    "NOT NOT $NEW.a",
+    "NOT NOT NOT $NEW.entity_type == 'order'",
+    "NOT NOT attribute_exists($NEW.order)",
+    "NOT NOT from_json($NEW.payload)",
+    # IN of constants, for operands that cannot be hashed
+    "$NEW.order IN ('order', 1)",
+    "$NEW.tags IN ('vip', 'new')",
+    "$NEW.order.lines IN (1, 2)",
+    "$NEW.a IN (1, 2) & $NEW.c IN (3, 'x')",
+    "$NEW.order.total IN ($OLD.order.total, 1)",
+    # Reordering around operands that may raise
+    "$NEW.pk > 1 & $NEW.entity_type == 'order'",
+    "$NEW.entity_type == 'customer' & $NEW.pk > 1",
+    "has_changed('status') & $NEW.order.total > 100 & $NEW.entity_type == 'order' & attribute_exists($NEW.pk)",
+    "$NEW.order.status =~ '^P' | $NEW.entity_type == 'customer' | size($NEW.order) > 1",
+    "contains($NEW.tags, 1) & $NEW.a == 1 & begins_with($NEW.pk, 'ORDER')",
+    "$NEW.pk =~ '[' | $NEW.a == 1",
+    "$NEW.a == 1 | $NEW.pk =~ '['",
+    "is_type($NEW.a, N) & has_changed('status') & $NEW.entity_type == 'order'",
+    "has_changed('status') & $NEW.pk > 1 & has_changed('order') & $NEW.a == 1",
+    "$NEW.order.total > 100 & has_changed('status') & $NEW.entity_type == 'order'",
+    "$NEW.entity_type == 'order' & $NEW.order.customer.address.zip == '10001' & from_json($NEW.payload)",
+]
+
+RECORDS = [
+    dict(
+        eventName="MODIFY",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="ORDER#1")),
+            NewImage=dict(
+                pk=dict(S="ORDER#1"),
+                entity_type=dict(S="order"),
+                status=dict(S="PAID"),
+                flag=dict(BOOL=True),
+                tags=dict(SS=["vip", "new"]),
+                payload=dict(S='{"a": [1, 2, 3]}'),
+                order=dict(
+                    M=dict(
+                        status=dict(S="PAID"),
+                        total=dict(N="250.50"),
+                        customer=dict(
+                            M=dict(
+                                address=dict(
+                                    M=dict(
+                                        zip=dict(S="10001"),
+                                        city=dict(S="New York"),
+                                        country=dict(M=dict(code=dict(S="US"))),
+                                    )
+                                )
+                            )
+                        ),
+                        lines=dict(
+                            L=[
+                                dict(M=dict(sku=dict(S="sku-1"))),
+                                dict(M=dict(sku=dict(S="sku-2"))),
+                            ]
+                        ),
+                    )
+                ),
+            ),
+            OldImage=dict(
+                pk=dict(S="ORDER#1"),
+                entity_type=dict(S="order"),
+                status=dict(S="NEW"),
+                payload=dict(S="{}"),
+                order=dict(M=dict(status=dict(S="NEW"), total=dict(N="200"))),
+            ),
+        ),
+    ),
+    dict(
+        eventName="MODIFY",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="CUSTOMER#1")),
+            NewImage=dict(
+                pk=dict(S="CUSTOMER#1"),
+                entity_type=dict(S="customer"),
+                deleted_at=dict(N="1600000000"),
+                a=dict(N="1"),
+                c=dict(N="3"),
+                payload=dict(S="[]"),
+                tags=dict(NS=["1", "2"]),
+            ),
+            OldImage=dict(pk=dict(S="CUSTOMER#1"), status=dict(S="NEW")),
+        ),
+    ),
+    dict(
+        eventName="MODIFY",
+        dynamodb=dict(
+            Keys=dict(pk=dict(N="7")),
+            NewImage=dict(pk=dict(N="7"), order=dict(S="not a map")),
+            OldImage=dict(pk=dict(N="7"), order=dict(S="not a map")),
+        ),
+    ),
+    dict(
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="ORDER#2")),
+            NewImage=dict(
+                pk=dict(S="ORDER#2"),
+                entity_type=dict(S="order"),
+                a=dict(BOOL=False),
+                c=dict(L=[dict(N="3")]),
+                payload=dict(S="not json"),
+                tags=dict(L=[dict(S="vip")]),
+                order=dict(
+                    M=dict(
+                        total=dict(NULL=True),
+                        status=dict(N="1"),
+                        lines=dict(S="sku-1"),
+                    )
+                ),
+            ),
+        ),
+    ),
+]
+
+
+def outcome(condition: Callable[[RouteRecord], Any], record: RouteRecord) -> Any:
+    """Returns what condition returns for record, or the type of what it raises"""
+    try:
+        return condition(record)
+    except Exception as e:
+        return type(e)
+
+
+def raw_tree(expression: str) -> Node:
+    """Parses expression into a tree that has not been optimized"""
+    return Parser.parse(ExpressionParser(), ExpressionLexer().tokenize(expression))
+
+
+def batch(size: int, keys: int) -> list[dict[str, Any]]:
+    """
+    Returns size records made from RECORDS in turn, as INSERTs and MODIFYs
+    of keys items, with increasing sequence numbers
+    """
+    records = list()
+    for row in range(size):
+        record = RECORDS[row % len(RECORDS)]
+        key = dict(pk=dict(S=f"ITEM#{row % keys}"))
+        records.append(
+            dict(
+                record,
+                eventID=str(row),
+                eventName="INSERT" if row % 3 else "MODIFY",
+                dynamodb=dict(record["dynamodb"], Keys=key, SequenceNumber=str(row)),
+            )
+        )
+    return records
+
+
+def raises(expression: str) -> bool:
+    """True if the condition of expression raises for any of RECORDS"""
+    condition = build_condition(raw_tree(expression))
+    return any(
+        isinstance(outcome(condition, RouteRecord(record)), type) for record in RECORDS
+    )
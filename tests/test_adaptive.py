@@ -0,0 +1,102 @@
+from itertools import count
+
+import pytest
+from corpus import EXPRESSIONS, RECORDS, batch, outcome, raw_tree
+
+import dynamodb_stream_router
+from dynamodb_stream_router import (
+    FailureMode,
+    Operation,
+    enable_adaptive_ordering,
+    get_routes,
+    on_operations,
+    remove_route,
+    route_records,
+)
+from dynamodb_stream_router.adaptive import adaptive_condition
+from dynamodb_stream_router.conditions.closures import build_condition
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.record import RouteRecord
+
+# Often true, then rarely true: AND should evaluate the second one first
+REORDERED = "$NEW.entity_type == 'order' & $NEW.a == 1"
+
+
+def same(expected, actual):
+    return type(expected) is type(actual) and expected == actual
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """
+    Times every sampled operand at the same cost, so that operands are
+    ordered by how often they decide the result and reorders are repeatable
+    """
+    monkeypatch.setattr(
+        "dynamodb_stream_router.adaptive.perf_counter_ns", count().__next__
+    )
+
+
+@pytest.mark.parametrize("expression", [*EXPRESSIONS, REORDERED])
+def test_adaptive_conditions_agree_with_closures_on_the_raw_tree(expression):
+    reference = build_condition(raw_tree(expression))
+    condition = ExpressionParser().parse(expression)
+    adaptive = adaptive_condition(condition, window=8, sample=1, period=4)
+    for _ in range(8):
+        for index, record in enumerate(RECORDS):
+            expected = outcome(reference, RouteRecord(record))
+            actual = outcome(adaptive, RouteRecord(record))
+            assert same(expected, actual), f"record {index}"
+    if expression == REORDERED:
+        assert adaptive.order.tree != condition.tree
+
+
+def test_adaptive_conditions_reorder_some_of_the_corpus():
+    reordered = list()
+    for expression in EXPRESSIONS:
+        condition = ExpressionParser().parse(expression)
+        adaptive = adaptive_condition(condition, window=8, sample=1, period=4)
+        for _ in range(4):
+            for record in RECORDS:
+                outcome(adaptive, RouteRecord(record))
+        if adaptive is not condition and adaptive.order.tree != condition.tree:
+            reordered.append(expression)
+    assert reordered
+
+
+def test_adaptive_ordering_routes_as_static_ordering(monkeypatch):
+    # Restores the default when the test ends
+    monkeypatch.setattr(dynamodb_stream_router, "__ADAPTIVE_ORDERING", None)
+    records = batch(120, 120)
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    calls = []
+
+    def register():
+        for index, expression in enumerate([*EXPRESSIONS, REORDERED]):
+
+            def handler(record, index=index):
+                calls.append((record.record["eventID"], index))
+
+            on_operations({Operation.INSERT, Operation.MODIFY}, expression, index % 4)(
+                handler
+            )
+
+    register()
+    expected = route_records(records, failure_mode=failure_mode)
+    static = list(calls)
+    for operation in Operation:
+        for route in get_routes(operation):
+            remove_route(operation, route)
+    calls.clear()
+    enable_adaptive_ordering(window=8, sample=1, period=4)
+    register()
+    assert route_records(records, failure_mode=failure_mode) == expected
+    assert calls == static
+    adaptive = [
+        route._condition
+        for route in get_routes(Operation.MODIFY)
+        if hasattr(route._condition, "order")
+    ]
+    assert any(
+        condition.order.tree != condition.__wrapped__.tree for condition in adaptive
+    )
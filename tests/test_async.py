@@ -0,0 +1,313 @@
+import asyncio
+
+import pytest
+from corpus import EXPRESSIONS, batch, raises
+
+from dynamodb_stream_router import (
+    FailureMode,
+    Operation,
+    get_routes,
+    on_insert,
+    on_operations,
+    on_operations_batch,
+    remove_route,
+    route_records,
+    route_records_async,
+)
+from dynamodb_stream_router.dedup import MemoryDedupStore
+from dynamodb_stream_router.exceptions import AsyncRouteException
+from dynamodb_stream_router.metrics import InMemoryMetrics
+
+OPERATIONS = {Operation.INSERT, Operation.MODIFY}
+
+# Twelve items, so that a failure only skips the later records of its item
+RECORDS = batch(96, 12)
+
+
+def key(row):
+    return RECORDS[int(row)]["dynamodb"]["Keys"]["pk"]["S"]
+
+
+def by_key(calls):
+    keys = dict()
+    for row, route in calls:
+        keys.setdefault(key(row), list()).append((row, route))
+    return keys
+
+
+def route_async(records, **kwargs):
+    return asyncio.run(route_records_async(records, **kwargs))
+
+
+def register(calls, handlers, expressions=EXPRESSIONS):
+    """
+    Routes every expression, a batch route among them and a route for net
+    changes. handlers is "sync", "async" or "mixed", for async handlers on
+    every other expression.
+    """
+    for index, expression in enumerate(expressions):
+        if handlers == "async" or (handlers == "mixed" and index % 2):
+
+            async def handler(record, index=index):
+                await asyncio.sleep(0)
+                calls.append((record.record["eventID"], index))
+
+        else:
+
+            def handler(record, index=index):
+                calls.append((record.record["eventID"], index))
+
+        on_operations(OPERATIONS, expression, index % 4)(handler)
+
+    @on_operations_batch(OPERATIONS, "$NEW.entity_type == 'order'", 1, max_size=5)
+    def orders(records):
+        calls.extend((record.record["eventID"], "batch") for record in records)
+
+    @on_operations(OPERATIONS, "attribute_exists($NEW.pk)", 2, coalesce=True)
+    def net(record):
+        calls.append((record.record["eventID"], "net"))
+
+
+def unregister():
+    for operation in Operation:
+        for route in get_routes(operation):
+            remove_route(operation, route)
+
+
+def expected(expressions=EXPRESSIONS, **kwargs):
+    """The calls and response of route_records with sync handlers"""
+    calls = []
+    register(calls, "sync", expressions)
+    response = route_records(RECORDS, **kwargs)
+    unregister()
+    return calls, response
+
+
+@pytest.mark.parametrize("handlers", ["sync", "async", "mixed"])
+@pytest.mark.parametrize("failure_mode", list(FailureMode))
+def test_async_routing_matches_routing(handlers, failure_mode):
+    calls, response = expected(failure_mode=failure_mode)
+    assert response["batchItemFailures"]
+    routed = []
+    register(routed, handlers)
+    assert route_async(RECORDS, failure_mode=failure_mode) == response
+    assert routed == calls
+
+
+@pytest.mark.parametrize("handlers", ["sync", "async"])
+def test_parallel_async_routing_matches_routing_by_key(handlers):
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    calls, response = expected(failure_mode=failure_mode)
+    routed = []
+    register(routed, handlers)
+    assert (
+        route_async(
+            RECORDS, parallel=True, max_concurrency=3, failure_mode=failure_mode
+        )
+        == response
+    )
+    assert by_key(routed) == by_key(calls)
+
+
+def test_async_routing_raises_where_routing_does():
+    calls = []
+    register(calls, "sync")
+    with pytest.raises(Exception):
+        route_records(RECORDS)
+    unregister()
+    routed = []
+    register(routed, "async")
+    # Which condition raises first depends on the order of equal priorities
+    with pytest.raises(Exception):
+        route_async(RECORDS)
+    assert routed == calls
+
+
+def test_async_routing_reports_metrics_as_routing_does():
+    # Routes of equal priority are evaluated in no particular order, so
+    # which of them a raising condition leaves unevaluated varies
+    expressions = [expression for expression in EXPRESSIONS if not raises(expression)]
+    metrics = InMemoryMetrics()
+    expected(expressions, failure_mode=FailureMode.CONTINUE_OTHER_KEYS, metrics=metrics)
+    async_metrics = InMemoryMetrics()
+    register([], "async", expressions)
+    route_async(
+        RECORDS, failure_mode=FailureMode.CONTINUE_OTHER_KEYS, metrics=async_metrics
+    )
+
+    def counts(snapshot):
+        return (
+            snapshot["batches"]["records"],
+            snapshot["records"]["by_operation"],
+            {
+                name: (route["evaluations"], route["matches"], route["failures"])
+                for name, route in snapshot["routes"].items()
+            },
+        )
+
+    assert counts(async_metrics.snapshot()) == counts(metrics.snapshot())
+
+
+def test_async_routing_skips_completed_routes():
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    dedup = MemoryDedupStore()
+    calls, response = expected(failure_mode=failure_mode, dedup=MemoryDedupStore())
+    routed = []
+    register(routed, "async")
+    assert route_async(RECORDS, failure_mode=failure_mode, dedup=dedup) == response
+    assert routed == calls
+    routed.clear()
+    assert route_async(RECORDS, failure_mode=failure_mode, dedup=dedup) == response
+    assert routed == []
+
+
+def test_async_routing_retries_only_failed_routes():
+    calls = []
+    failures = [ValueError()]
+
+    @on_insert("$NEW.pk == '1'", 0)
+    async def first(record):
+        calls.append("first")
+
+    @on_insert("$NEW.pk == '1'", 1)
+    async def second(record):
+        calls.append("second")
+        if failures:
+            raise failures.pop()
+
+    record = dict(
+        eventID="1",
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="1")),
+            NewImage=dict(pk=dict(S="1")),
+            SequenceNumber="1",
+        ),
+    )
+    dedup = MemoryDedupStore()
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    assert route_async([record], failure_mode=failure_mode, dedup=dedup) == dict(
+        batchItemFailures=[dict(itemIdentifier="1")]
+    )
+    assert route_async([record], failure_mode=failure_mode, dedup=dedup) == dict(
+        batchItemFailures=[]
+    )
+    assert calls == ["first", "second", "second"]
+
+
+class Context:
+    """The part of a Lambda context that a deadline reads"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.seconds * 1000)
+
+
+def test_async_routing_starts_no_record_past_the_deadline():
+    calls = []
+    register(calls, "async")
+    response = route_async(RECORDS, deadline=Context(0.5))
+    assert calls == []
+    assert len(response["batchItemFailures"]) == len(RECORDS)
+
+
+def test_max_concurrency_bounds_the_handlers_running():
+    running = set()
+    peaks = []
+
+    @on_insert("$NEW.pk >= '0'", 0)
+    async def handler(record):
+        running.add(record.record["eventID"])
+        peaks.append(len(running))
+        await asyncio.sleep(0.001)
+        running.remove(record.record["eventID"])
+
+    records = [
+        dict(
+            eventID=str(row),
+            eventName="INSERT",
+            dynamodb=dict(
+                Keys=dict(pk=dict(S=str(row))), NewImage=dict(pk=dict(S=str(row)))
+            ),
+        )
+        for row in range(20)
+    ]
+    route_async(records, parallel=True, max_concurrency=3)
+    assert max(peaks) == 3
+    peaks.clear()
+    route_async(records, parallel=True)
+    assert max(peaks) == len(records)
+
+
+def test_parallel_async_routing_keeps_the_order_of_each_key():
+    calls = []
+    running = set()
+    overlapped = []
+
+    @on_insert("$NEW.pk >= '0'", 0)
+    async def handler(record):
+        row = int(record.record["eventID"])
+        running.add(row)
+        overlapped.append(len(running) > 1)
+        # Later records of a key finish sooner, if they are not in order
+        await asyncio.sleep(0.001 * (10 - row % 10))
+        running.remove(row)
+        calls.append(row)
+
+    records = [
+        dict(
+            eventID=str(row),
+            eventName="INSERT",
+            dynamodb=dict(
+                Keys=dict(pk=dict(S=str(row % 4))),
+                NewImage=dict(pk=dict(S=str(row % 4))),
+            ),
+        )
+        for row in range(20)
+    ]
+    route_async(records, parallel=True, max_concurrency=2)
+    assert any(overlapped)
+    for pk in range(4):
+        assert [row for row in calls if row % 4 == pk] == list(range(pk, 20, 4))
+
+
+def test_routing_fails_only_records_that_match_async_handlers():
+    calls = []
+    on_insert("$NEW.pk >= '0'", 0)(lambda record: calls.append(record))
+
+    @on_insert("$NEW.pk == '3'", 1)
+    async def handler(record):
+        pass
+
+    records = [
+        dict(
+            eventName="INSERT",
+            dynamodb=dict(
+                Keys=dict(pk=dict(S=str(row))),
+                NewImage=dict(pk=dict(S=str(row))),
+                SequenceNumber=str(row),
+            ),
+        )
+        for row in range(6)
+    ]
+    response = route_records(records, failure_mode=FailureMode.CONTINUE_OTHER_KEYS)
+    assert response == dict(batchItemFailures=[dict(itemIdentifier="3")])
+    assert len(calls) == len(records)
+    with pytest.raises(AsyncRouteException):
+        route_records(records[3:4])
+
+
+def test_routing_fails_records_that_evaluate_async_conditions():
+    async def condition(record):
+        return False
+
+    on_insert(condition, 0)(lambda record: None)
+    record = dict(
+        eventName="INSERT",
+        dynamodb=dict(Keys=dict(pk=dict(S="1")), NewImage=dict(pk=dict(S="1"))),
+    )
+    with pytest.raises(AsyncRouteException):
+        route_records([record])
+    assert route_async([record]) is None
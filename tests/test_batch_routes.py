@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dynamodb_stream_router import (
+    FailureMode,
+    on_insert,
+    on_insert_batch,
+    on_modify,
+    route_records,
+)
+
+
+def record(row, key, event_name="INSERT"):
+    return dict(
+        eventID=str(row),
+        eventName=event_name,
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=key)),
+            NewImage=dict(pk=dict(S=key), row=dict(N=str(row))),
+            SequenceNumber=str(row),
+        ),
+    )
+
+
+def row(record):
+    return record.record["eventID"]
+
+
+def route_parallel(records, **kwargs):
+    with ThreadPoolExecutor(4) as executor:
+        return route_records(records, executor=executor, parallel=True, **kwargs)
+
+
+ROUTERS = dict(
+    sequential=route_records,
+    parallel=route_parallel,
+    columnar=lambda records, **kwargs: route_records(records, columnar=True, **kwargs),
+)
+
+
+def test_phases_follow_priorities():
+    calls = []
+    for priority in (0, 2):
+        on_insert("$NEW.row >= 0", priority)(
+            lambda record, priority=priority: calls.append((priority, row(record)))
+        )
+    on_modify("$NEW.row >= 0", 1)(lambda record: calls.append((1, row(record))))
+    for priority in (1, 3):
+        on_insert_batch("$NEW.row >= 0", priority)(
+            lambda records, priority=priority: calls.append(
+                (priority, [row(record) for record in records])
+            )
+        )
+    route_records([record(0, "a"), record(1, "b", "MODIFY"), record(2, "c")])
+    assert calls == [
+        (0, "0"),
+        (1, "1"),
+        (0, "2"),
+        (1, ["0", "2"]),
+        (2, "0"),
+        (2, "2"),
+        (3, ["0", "2"]),
+    ]
+
+
+@pytest.mark.parametrize("router", list(ROUTERS))
+def test_max_size_splits_records_in_order(router):
+    calls = []
+    on_insert_batch("$NEW.row > 0", 0, max_size=2)(
+        lambda records: calls.append([row(record) for record in records])
+    )
+    ROUTERS[router]([record(number, str(number)) for number in range(6)])
+    assert calls == [["1", "2"], ["3", "4"], ["5"]]
+
+
+@pytest.mark.parametrize("router", list(ROUTERS))
+def test_every_phase_is_passed_the_same_route_record(router):
+    seen = []
+    on_insert("$NEW.row >= 0", 0)(seen.append)
+    on_insert_batch("$NEW.row >= 0", 1)(seen.extend)
+    on_insert("$NEW.row >= 0", 2)(seen.append)
+    ROUTERS[router]([record(0, "a")])
+    assert len(seen) == 3
+    assert seen[0] is seen[1] is seen[2]
+
+
+@pytest.mark.parametrize("router", list(ROUTERS))
+@pytest.mark.parametrize(
+    "failure_mode, batch, last",
+    [
+        (FailureMode.STOP, ["0"], ["0"]),
+        (FailureMode.CONTINUE_OTHER_KEYS, ["0", "2", "4"], ["0", "4"]),
+    ],
+)
+def test_records_that_fail_are_left_out_of_later_phases(
+    router, failure_mode, batch, last
+):
+    calls = []
+
+    @on_insert("$NEW.row >= 0", 0)
+    def first(record):
+        if row(record) == "1":
+            raise RuntimeError(record)
+
+    @on_insert_batch("$NEW.row >= 0", 1, max_size=1)
+    def second(records):
+        calls.append([row(record) for record in records])
+        if row(records[0]) == "2":
+            raise RuntimeError(records)
+
+    on_insert("$NEW.row >= 0", 2)(lambda record: calls.append(row(record)))
+    keys = ["a", "b", "c", "b", "d"]
+    response = ROUTERS[router](
+        [record(number, key) for number, key in enumerate(keys)],
+        failure_mode=failure_mode,
+    )
+    assert [call for call in calls if isinstance(call, list)] == [
+        [number] for number in batch
+    ]
+    assert sorted(call for call in calls if isinstance(call, str)) == last
+    unrouted = sorted({"0", "1", "2", "3", "4"} - set(last))
+    assert response == dict(
+        batchItemFailures=[dict(itemIdentifier=number) for number in unrouted]
+    )
@@ -0,0 +1,62 @@
+import pytest
+
+from dynamodb_stream_router.conditions.cache import (
+    CODE_STAMP,
+    ConditionCache,
+    decode,
+    dump,
+    encode,
+    source_stamp,
+)
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.record import RouteRecord
+
+EXPRESSIONS = [
+    "$NEW.kind IN ('a', 'b', 3) | $NEW.kind =~ '^x.*'",
+    "$NEW.tenant == 'x' & begins_with($NEW.tenant, 'x')",
+    "$NEW.n BETWEEN 1 & 10 & has_changed('n')",
+]
+
+RECORD = dict(
+    eventName="MODIFY",
+    dynamodb=dict(
+        Keys=dict(pk=dict(S="1")),
+        OldImage=dict(pk=dict(S="1"), n=dict(N="1")),
+        NewImage=dict(
+            pk=dict(S="1"), kind=dict(S="xy"), tenant=dict(S="x"), n=dict(N="5")
+        ),
+    ),
+)
+
+
+def test_code_stamp_matches_sources():
+    # Regenerate with python -m dynamodb_stream_router.conditions.cache --stamp
+    assert CODE_STAMP == source_stamp()
+
+
+def test_trees_round_trip():
+    parser = ExpressionParser()
+    for expression in EXPRESSIONS:
+        tree = parser.parse_tree(expression)
+        assert decode(encode(tree)) == tree
+
+
+def test_cached_conditions_match_parsed(tmp_path):
+    file = tmp_path / "conditions.cache"
+    assert dump(EXPRESSIONS, file) == len(EXPRESSIONS)
+    cache = ConditionCache.load(file)
+    parser = ExpressionParser()
+    for expression in EXPRESSIONS:
+        cached = cache.get(expression)
+        assert cached is not None
+        assert cached.tree == parser.parse_tree(expression)
+        assert cached(RouteRecord(RECORD)) == parser.parse(expression)(
+            RouteRecord(RECORD)
+        )
+
+
+def test_unreadable_file_is_stale(tmp_path):
+    file = tmp_path / "conditions.cache"
+    file.write_bytes(b"\x80\x04not marshal")
+    with pytest.warns(RuntimeWarning):
+        assert len(ConditionCache.load(file)) == 0
@@ -0,0 +1,202 @@
+from random import Random
+
+import pytest
+
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.record import AttributeValueDeserializer, RouteRecord
+
+NAMES = ["a", "b", "c"]
+
+# Numbers that are equal, and sets that are equal, however they are written
+NUMBERS = [["1", "1.0", "01", "1E0"], ["2", "2.00"], ["-0", "0"]]
+SETS = dict(
+    SS=[["x", "y"], ["y", "x"], ["x"]],
+    NS=[["1", "2"], ["2.0", "1"], ["1"]],
+    BS=[["AQI=", "Aw=="], ["Aw==", "AQI="], ["AQI="]],
+)
+
+MISSING = object()
+
+
+def scalar(random):
+    kind = random.choice(["S", "N", "BOOL", "NULL", "B", *SETS])
+    if kind == "S":
+        return dict(S=random.choice(["x", "1", ""]))
+    if kind == "N":
+        return dict(N=random.choice(random.choice(NUMBERS)))
+    if kind == "BOOL":
+        return dict(BOOL=random.random() < 0.5)
+    if kind == "NULL":
+        return dict(NULL=True)
+    if kind == "B":
+        return dict(B=random.choice(["AQI=", "Aw=="]))
+    return {kind: list(random.choice(SETS[kind]))}
+
+
+def value(random, depth):
+    if depth and random.random() < 0.4:
+        if random.random() < 0.5:
+            return dict(M=image(random, depth - 1))
+        return dict(L=[value(random, depth - 1) for _ in range(random.randint(0, 3))])
+    return scalar(random)
+
+
+def image(random, depth=2):
+    return {name: value(random, depth) for name in NAMES if random.random() < 0.8}
+
+
+def equivalent(random, attribute):
+    """Returns attribute written another way, if it can be"""
+    [(kind, raw)] = attribute.items()
+    if kind == "N":
+        for numbers in NUMBERS:
+            if raw in numbers:
+                return dict(N=random.choice(numbers))
+    if kind in SETS:
+        return {kind: list(reversed(raw))}
+    if kind == "M":
+        return dict(M=mutate(random, raw, 0.0))
+    if kind == "L":
+        return dict(L=[equivalent(random, item) for item in raw])
+    return dict(attribute)
+
+
+def mutate(random, old, rate):
+    """Returns a copy of old with about rate of its attributes changed"""
+    new = dict()
+    for name in NAMES:
+        if name not in old:
+            if random.random() < rate:
+                new[name] = value(random, 1)
+            continue
+        attribute = old[name]
+        chance = random.random()
+        if chance < rate / 3:
+            # Removed
+            continue
+        if chance < rate:
+            new[name] = value(random, 1)
+        elif "M" in attribute and random.random() < 0.5:
+            new[name] = dict(M=mutate(random, attribute["M"], rate))
+        else:
+            new[name] = equivalent(random, attribute)
+    return new
+
+
+def pairs(count, seed=0):
+    random = Random(seed)
+    for _ in range(count):
+        old = image(random)
+        yield old, mutate(random, old, random.choice([0.0, 0.2, 0.6]))
+
+
+def deserialize(raw):
+    return AttributeValueDeserializer().deserialize(dict(M=raw))
+
+
+def same(old, new):
+    """Equality of deserialized values that also requires the same types"""
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, dict):
+        return old.keys() == new.keys() and all(same(old[k], new[k]) for k in old)
+    if isinstance(old, list):
+        return len(old) == len(new) and all(map(same, old, new))
+    return old == new
+
+
+def reference_diff(old, new, path=()):
+    """The paths that differ between two deserialized images"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        steps = old.keys() | new.keys()
+    elif isinstance(old, list) and isinstance(new, list):
+        steps = range(max(len(old), len(new)))
+    else:
+        return set() if same(old, new) else {path}
+    changed = set()
+    for step in steps:
+        changed |= reference_diff(at(old, (step,)), at(new, (step,)), (*path, step))
+    return changed
+
+
+def at(value, path):
+    """The value at path, or MISSING, which unlike NULL is only equal to itself"""
+    for step in path:
+        if isinstance(step, int):
+            if not isinstance(value, list) or len(value) <= step:
+                return MISSING
+            value = value[step]
+        elif isinstance(value, dict) and step in value:
+            value = value[step]
+        else:
+            return MISSING
+    return value
+
+
+def paths(value, path=()):
+    """Every path within a deserialized image, and one beyond each of them"""
+    yield path
+    if isinstance(value, dict):
+        for name, item in value.items():
+            yield from paths(item, (*path, name))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from paths(item, (*path, index))
+    yield (*path, "missing")
+    yield (*path, 9)
+
+
+def record(old, new):
+    dynamodb = dict(Keys=dict(pk=dict(S="1")))
+    if old is not None:
+        dynamodb["OldImage"] = old
+    if new is not None:
+        dynamodb["NewImage"] = new
+    return dict(eventName="MODIFY", dynamodb=dynamodb)
+
+
+def test_changed_paths_match_a_diff_of_the_deserialized_images():
+    changes = 0
+    for old, new in pairs(500):
+        expected = reference_diff(deserialize(old), deserialize(new))
+        assert RouteRecord(record(old, new)).changed_paths == expected, (old, new)
+        changes += bool(expected)
+    # The pairs are not all the same, nor all different
+    assert 100 < changes < 400
+
+
+def test_changed_matches_the_deserialized_values_at_each_path():
+    for old, new in pairs(300, seed=1):
+        old_image, new_image = deserialize(old), deserialize(new)
+        route_record = RouteRecord(record(old, new))
+        for path in {*paths(old_image), *paths(new_image)} - {()}:
+            expected = not same(at(old_image, path), at(new_image, path))
+            assert route_record._changed(path) is expected, (old, new, path)
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [(None, dict(a=dict(S="x"))), (dict(a=dict(S="x")), None), (None, None)],
+    ids=["insert", "remove", "neither"],
+)
+def test_every_attribute_of_a_single_image_has_changed(old, new):
+    route_record = RouteRecord(record(old, new))
+    expected = set() if old is new else {("a",)}
+    assert route_record.changed_paths == expected
+    assert route_record._changed(("a",)) is bool(expected)
+    assert route_record._changed(("b",)) is False
+
+
+@pytest.mark.parametrize("key", ["a", "b", "a.a", "a.b.c", "a[0]", "a[1].b", "c[2]"])
+def test_has_changed_matches_the_deserialized_values(key):
+    condition = ExpressionParser().parse(f"has_changed({key!r})")
+    path = tuple(
+        int(step) if step.isdecimal() else step
+        for step in key.replace("[", ".").replace("]", "").split(".")
+    )
+    for old, new in pairs(300, seed=2):
+        old_image, new_image = deserialize(old), deserialize(new)
+        expected = not same(at(old_image, path), at(new_image, path)) or not same(
+            at(old_image, (key,)), at(new_image, (key,))
+        )
+        assert condition(RouteRecord(record(old, new))) is expected, (old, new)
@@ -0,0 +1,43 @@
+from dynamodb_stream_router import FailureMode, on_insert, route_records
+
+
+def record(event_name, key, sequence_number, **image):
+    return dict(
+        eventID=sequence_number,
+        eventName=event_name,
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=key)),
+            NewImage=dict(pk=dict(S=key), **{k: dict(S=v) for k, v in image.items()}),
+            SequenceNumber=sequence_number,
+        ),
+    )
+
+
+RECORDS = [
+    record("INSERT", "a", "9", state="new"),
+    record("INSERT", "b", "10", state="new"),
+    record("MODIFY", "a", "11", state="paid"),
+]
+
+
+def failures(response):
+    return [failure["itemIdentifier"] for failure in response["batchItemFailures"]]
+
+
+def test_failed_net_change_is_reported_in_sequence_order():
+    on_insert("$NEW.pk == 'b'", 0)(fail)
+    on_insert("$NEW.pk == 'a'", 0, coalesce=True)(fail)
+    response = route_records(RECORDS, failure_mode=FailureMode.CONTINUE_OTHER_KEYS)
+    # The net change of a has the SequenceNumber of its first record
+    assert failures(response) == ["9", "10"]
+
+
+def test_failed_net_change_is_reported_once():
+    on_insert("$NEW.pk == 'a' & $NEW.state == 'new'", 0)(fail)
+    on_insert("$NEW.pk == 'a'", 0, coalesce=True)(fail)
+    response = route_records(RECORDS, failure_mode=FailureMode.CONTINUE_OTHER_KEYS)
+    assert failures(response) == ["9", "11"]
+
+
+def fail(record):
+    raise RuntimeError(record.keys["pk"])
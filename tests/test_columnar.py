@@ -0,0 +1,72 @@
+import pytest
+from corpus import EXPRESSIONS, batch, raises
+
+from dynamodb_stream_router import (
+    FailureMode,
+    Operation,
+    on_operations,
+    route_records,
+)
+
+# One record per item, so that a failure only skips the record that failed
+RECORDS = batch(60, 60)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def vectorized(request, monkeypatch):
+    """Evaluates columns with NumPy, if it is installed, and without it"""
+    if request.param == "python":
+        monkeypatch.setattr("dynamodb_stream_router.columnar.numpy", lambda: None)
+    else:
+        pytest.importorskip("numpy")
+    return request.param
+
+
+@pytest.fixture(params=["all", "safe"])
+def calls(request):
+    """
+    Routes every expression, or those that never raise, and a callable
+    condition, and returns the calls of their handlers
+    """
+    calls = []
+    expressions = [
+        *(
+            expression
+            for expression in EXPRESSIONS
+            if request.param == "all" or not raises(expression)
+        ),
+        lambda record: record.new_image.get("a") == 1,
+    ]
+    for index, condition in enumerate(expressions):
+
+        def handler(record, index=index):
+            calls.append((record.record["eventID"], index))
+
+        on_operations({Operation.INSERT, Operation.MODIFY}, condition, index % 4)(
+            handler
+        )
+    return calls
+
+
+@pytest.mark.parametrize("immutable", [False, True])
+def test_columnar_routing_matches_routing_by_record(vectorized, calls, immutable):
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    expected = route_records(RECORDS, immutable=immutable, failure_mode=failure_mode)
+    by_record = list(calls)
+    calls.clear()
+    response = route_records(
+        RECORDS, immutable=immutable, columnar=True, failure_mode=failure_mode
+    )
+    assert calls == by_record
+    assert response == expected
+
+
+@pytest.mark.parametrize("calls", ["all"], indirect=True)
+def test_columnar_routing_raises_where_routing_by_record_does(vectorized, calls):
+    with pytest.raises(Exception) as by_record:
+        route_records(RECORDS)
+    expected = list(calls)
+    calls.clear()
+    with pytest.raises(by_record.type):
+        route_records(RECORDS, columnar=True)
+    assert calls == expected
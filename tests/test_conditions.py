@@ -0,0 +1,97 @@
+import pytest
+from corpus import EXPRESSIONS, RECORDS, outcome, raw_tree
+
+from dynamodb_stream_router.conditions.closures import build_condition
+from dynamodb_stream_router.conditions.compiler import compile_condition
+from dynamodb_stream_router.conditions.parser import ExpressionParser
+from dynamodb_stream_router.record import RouteRecord
+
+
+def same(expected, actual):
+    return type(expected) is type(actual) and expected == actual
+
+
+@pytest.fixture(scope="module")
+def parsed():
+    """Every expression parsed, so that they share their sub-expressions"""
+    parser = ExpressionParser()
+    return {expression: parser.parse(expression) for expression in EXPRESSIONS}
+
+
+@pytest.fixture(scope="module")
+def shared():
+    """A RouteRecord per record, shared by every condition"""
+    return [RouteRecord(record) for record in RECORDS]
+
+
+@pytest.mark.parametrize("expression", EXPRESSIONS)
+def test_backends_agree_with_closures_on_the_raw_tree(expression, parsed, shared):
+    reference = build_condition(raw_tree(expression))
+    tree = ExpressionParser().parse_tree(expression)
+    compiled = compile_condition(tree, expression)
+    for index, record in enumerate(RECORDS):
+        expected = outcome(reference, RouteRecord(record))
+        for backend, actual in (
+            ("compiled", outcome(compiled, RouteRecord(record))),
+            ("parsed", outcome(parsed[expression], RouteRecord(record))),
+            ("shared", outcome(parsed[expression], shared[index])),
+        ):
+            assert same(expected, actual), f"{backend} on record {index}"
+
+
+# Attribute names that no other test uses, since SHARED is global
+MEMO_RECORDS = [
+    dict(
+        eventName="MODIFY",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S="1")),
+            NewImage=dict(
+                memo_a=dict(S="x"), memo_b=dict(N="1"), memo_payload=dict(S=payload)
+            ),
+        ),
+    )
+    for payload in ('{"a": 1}', "[]", "0", "not json")
+] + [dict(eventName="INSERT", dynamodb=dict(Keys=dict(pk=dict(S="2"))))]
+
+
+def test_conditions_are_recompiled_in_place_to_share_sub_expressions():
+    from dynamodb_stream_router.conditions.compiler import SHARED
+
+    parser = ExpressionParser()
+    expressions = [
+        "$NEW.memo_a == 'x' & from_json($NEW.memo_payload)",
+        "from_json($NEW.memo_payload) | $NEW.memo_b == 1",
+        "$NEW.memo_b == 1 & NOT $NEW.memo_a == 'x'",
+    ]
+    references = [build_condition(raw_tree(expression)) for expression in expressions]
+    first = parser.parse(expressions[0])
+    code = first.__code__
+    # Evaluated before any of its sub-expressions are shared
+    early = [RouteRecord(record) for record in MEMO_RECORDS]
+    for index, record in enumerate(early):
+        expected = outcome(references[0], RouteRecord(MEMO_RECORDS[index]))
+        assert same(expected, outcome(first, record))
+    slots = set(SHARED.slots.values())
+    conditions = [first, *map(parser.parse, expressions[1:])]
+    # Routes that hold first still call it, and it now has new code
+    assert first.__code__ is not code
+    assert len(set(SHARED.slots.values()) - slots) == 3
+    decoded = []
+    for condition in conditions[:2]:
+        from_json = condition.__globals__["_from_json"]
+        condition.__globals__["_from_json"] = lambda value, from_json=from_json: (
+            decoded.append(value) or from_json(value)
+        )
+    for index, record in enumerate(MEMO_RECORDS):
+        late = RouteRecord(record)
+        for reference, condition in zip(references, conditions):
+            expected = outcome(reference, RouteRecord(record))
+            assert same(expected, outcome(condition, early[index]))
+            assert same(expected, outcome(condition, late))
+    # A record decodes the payload for the first condition that needs it
+    for record in MEMO_RECORDS[:3]:
+        late = RouteRecord(record)
+        decoded.clear()
+        for condition in conditions:
+            condition(late)
+        assert len(decoded) == 1
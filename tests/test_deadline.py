@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+import pytest
+
+from dynamodb_stream_router import (
+    FailureMode,
+    on_insert,
+    on_insert_batch,
+    route_records,
+)
+from dynamodb_stream_router.deadline import Deadline
+
+# The seconds that each record takes, the seconds the invocation has left
+# and the margin to keep
+COST = 0.02
+REMAINING = 0.3
+MARGIN = 0.1
+# How much longer than the estimate a record may take: the estimate is a
+# mean, and sleep() overshoots by more at some times than at others
+JITTER = COST / 4
+
+
+class Context:
+    """The part of a Lambda context that a deadline reads"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.seconds * 1000)
+
+
+def record(row):
+    return dict(
+        eventID=str(row),
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=str(row))),
+            NewImage=dict(pk=dict(S=str(row))),
+            SequenceNumber=str(row),
+        ),
+    )
+
+
+RECORDS = [record(row) for row in range(50)]
+
+
+def failures(response):
+    return [int(failure["itemIdentifier"]) for failure in response["batchItemFailures"]]
+
+
+def route_parallel(records, **kwargs):
+    with ThreadPoolExecutor(1) as executor:
+        return route_records(records, executor=executor, parallel=True, **kwargs)
+
+
+@pytest.mark.parametrize("router", [route_records, route_parallel])
+@pytest.mark.parametrize("failure_mode", [None, *FailureMode])
+def test_records_are_not_started_past_the_margin(router, failure_mode):
+    finished = []
+
+    @on_insert("$NEW.pk > '0'", 0)
+    def handler(record):
+        sleep(COST)
+        finished.append((int(record.record["eventID"]), monotonic()))
+
+    end = monotonic() + REMAINING - MARGIN
+    response = router(
+        RECORDS,
+        failure_mode=failure_mode,
+        deadline=Deadline.from_context(Context(REMAINING), margin=MARGIN),
+    )
+    routed = [row for row, _ in finished]
+    # Some records were routed, and none of them finished after the margin,
+    # give or take how much longer than the others the last one slept
+    assert 0 < len(routed) < len(RECORDS) - 1
+    assert max(time for _, time in finished) <= end + JITTER
+    # Record 0 does not match, and the records that were not started follow
+    # the records that were
+    assert routed == list(range(1, len(routed) + 1))
+    assert failures(response) == list(range(len(routed) + 1, len(RECORDS)))
+
+
+def test_batch_routes_are_not_called_past_the_margin():
+    routed = []
+    batches = []
+    on_insert("$NEW.pk >= '0'", 0)(
+        lambda record: routed.append(int(record.record["eventID"]))
+    )
+
+    @on_insert_batch("$NEW.pk >= '0'", 1, max_size=2)
+    def handler(records):
+        sleep(COST * len(records))
+        batches.append(
+            ([int(record.record["eventID"]) for record in records], monotonic())
+        )
+
+    end = monotonic() + REMAINING - MARGIN
+    response = route_records(
+        RECORDS, deadline=Deadline.from_context(Context(REMAINING), margin=MARGIN)
+    )
+    # Every record was routed in the first phase, which takes no time
+    assert routed == list(range(len(RECORDS)))
+    called = [row for rows, _ in batches for row in rows]
+    assert 0 < len(called) < len(RECORDS)
+    assert max(time for _, time in batches) <= end + JITTER
+    # The records that the batch route was not called with are reported,
+    # though the first phase routed them
+    assert called == list(range(len(called)))
+    assert failures(response) == list(range(len(called), len(RECORDS)))
+
+
+def test_no_record_is_started_past_the_deadline():
+    calls = []
+    on_insert("$NEW.pk >= '0'", 0)(calls.append)
+    response = route_records(RECORDS, deadline=Context(0.5))
+    assert calls == []
+    assert failures(response) == list(range(len(RECORDS)))
@@ -0,0 +1,170 @@
+import pytest
+
+from dynamodb_stream_router import (
+    FailureMode,
+    on_insert,
+    on_insert_batch,
+    route_records,
+)
+from dynamodb_stream_router.dedup import DedupStore, MemoryDedupStore, SQLiteDedupStore
+
+RECORD = dict(
+    eventID="1",
+    eventName="INSERT",
+    dynamodb=dict(
+        Keys=dict(pk=dict(S="1")),
+        NewImage=dict(pk=dict(S="1"), kind=dict(S="order")),
+        SequenceNumber="100",
+    ),
+)
+
+
+@pytest.mark.parametrize("decorator", [on_insert, on_insert_batch])
+def test_routes_sharing_a_handler_name_are_told_apart(decorator):
+    calls = []
+    failing = {"b"}
+
+    def make_handler(name):
+        def handler(record):
+            calls.append(name)
+            if name in failing:
+                raise RuntimeError(name)
+
+        return handler
+
+    decorator("$NEW.pk == '1'", 0)(make_handler("a"))
+    decorator("$NEW.kind == 'order'", 1)(make_handler("b"))
+    dedup = MemoryDedupStore()
+
+    def route():
+        return route_records([RECORD], failure_mode=FailureMode.STOP, dedup=dedup)
+
+    assert route() == dict(batchItemFailures=[dict(itemIdentifier="100")])
+    assert calls == ["a", "b"]
+    calls.clear()
+    failing.clear()
+    assert route() == dict(batchItemFailures=[])
+    assert calls == ["b"]
+
+
+def test_incomplete_store_cannot_be_created():
+    class Store(DedupStore):
+        def completed(self, route, event):
+            return False
+
+    with pytest.raises(TypeError):
+        Store()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("dynamodb_stream_router.dedup.monotonic", clock)
+    monkeypatch.setattr("dynamodb_stream_router.dedup.time", clock)
+    return clock
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryDedupStore(maxsize=2)
+    store.complete("route", "1")
+    store.complete("route", "2")
+    assert store.completed("route", "1")
+    store.complete("route", "3")
+    assert store.completed("route", "1")
+    assert not store.completed("route", "2")
+    assert store.completed("route", "3")
+    assert not store.completed("other", "1")
+
+
+def test_memory_store_forgets_after_ttl(clock):
+    store = MemoryDedupStore(ttl=10)
+    store.complete("route", "1")
+    clock.now += 9.5
+    assert store.completed("route", "1")
+    clock.now += 0.5
+    assert not store.completed("route", "1")
+
+
+def test_memory_store_without_ttl_keeps_entries(clock):
+    store = MemoryDedupStore(ttl=None)
+    store.complete("route", "1")
+    clock.now += 1e9
+    assert store.completed("route", "1")
+
+
+def test_sqlite_store_persists(tmp_path):
+    database = tmp_path / "dedup.db"
+    store = SQLiteDedupStore(database)
+    store.complete("route", "1")
+    store.close()
+    store = SQLiteDedupStore(database)
+    assert store.completed("route", "1")
+    assert not store.completed("route", "2")
+    assert not store.completed("other", "1")
+    store.close()
+
+
+def test_sqlite_store_forgets_after_ttl(clock, tmp_path):
+    store = SQLiteDedupStore(tmp_path / "dedup.db", ttl=10)
+    store.complete("route", "1")
+    clock.now += 9.5
+    assert store.completed("route", "1")
+    clock.now += 0.5
+    assert not store.completed("route", "1")
+    store.purge()
+    clock.now -= 5
+    assert not store.completed("route", "1")
+    store.close()
+
+
+@pytest.mark.parametrize("store", [MemoryDedupStore, SQLiteDedupStore])
+def test_retry_only_calls_the_failed_route(store):
+    calls = []
+    failing = {"b"}
+
+    def make_handler(name):
+        def handler(record):
+            calls.append((name, record.new_image["pk"]))
+            if name in failing and record.new_image["pk"] == "1":
+                raise RuntimeError(name)
+
+        return handler
+
+    for priority, name in enumerate("abc"):
+        on_insert("$NEW.kind == 'order'", priority)(make_handler(name))
+    other = dict(RECORD, eventID="2")
+    other["dynamodb"] = dict(
+        RECORD["dynamodb"],
+        Keys=dict(pk=dict(S="2")),
+        NewImage=dict(pk=dict(S="2"), kind=dict(S="order")),
+        SequenceNumber="101",
+    )
+    dedup = store()
+
+    def route():
+        return route_records(
+            [RECORD, other],
+            failure_mode=FailureMode.CONTINUE_OTHER_KEYS,
+            dedup=dedup,
+        )
+
+    assert route() == dict(batchItemFailures=[dict(itemIdentifier="100")])
+    assert calls == [("a", "1"), ("b", "1"), ("a", "2"), ("b", "2"), ("c", "2")]
+    calls.clear()
+    assert route() == dict(batchItemFailures=[dict(itemIdentifier="100")])
+    assert calls == [("b", "1")]
+    calls.clear()
+    failing.clear()
+    assert route() == dict(batchItemFailures=[])
+    assert calls == [("b", "1"), ("c", "1")]
+    calls.clear()
+    assert route() == dict(batchItemFailures=[])
+    assert calls == []
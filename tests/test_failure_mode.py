@@ -0,0 +1,121 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dynamodb_stream_router import (
+    FailureMode,
+    on_insert,
+    route_records,
+    route_stream,
+)
+
+# The Keys of the records, in order; the record of c at 3 fails
+KEYS = ["a", "b", "a", "c", "b", "c", "d"]
+FAILING = "3"
+
+
+def record(row, key, n):
+    return dict(
+        eventID=str(row),
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=key)),
+            NewImage=dict(pk=dict(S=key), n=n),
+            SequenceNumber=str(row),
+        ),
+    )
+
+
+def route_parallel(records, **kwargs):
+    # One partition at a time, in the order of their first records
+    with ThreadPoolExecutor(2) as executor:
+        return route_records(
+            records, executor=executor, parallel=True, max_in_flight=1, **kwargs
+        )
+
+
+def route_columnar(records, **kwargs):
+    return route_records(records, columnar=True, **kwargs)
+
+
+def route_raw(records, **kwargs):
+    return route_stream(json.dumps(dict(Records=records)), **kwargs)
+
+
+ROUTERS = dict(
+    sequential=route_records,
+    parallel=route_parallel,
+    columnar=route_columnar,
+    stream=route_raw,
+)
+
+# The rows that each router calls, in order, and the rows that it reports.
+# In parallel, the partitions of a and b are routed before that of c fails
+EXPECTED = {
+    ("sequential", FailureMode.STOP): (["0", "1", "2", "3"], ["3", "4", "5", "6"]),
+    ("parallel", FailureMode.STOP): (["0", "2", "1", "4", "3"], ["3", "5", "6"]),
+    ("sequential", FailureMode.CONTINUE_OTHER_KEYS): (
+        ["0", "1", "2", "3", "4", "6"],
+        ["3", "5"],
+    ),
+    ("parallel", FailureMode.CONTINUE_OTHER_KEYS): (
+        ["0", "2", "1", "4", "3", "6"],
+        ["3", "5"],
+    ),
+}
+
+
+@pytest.fixture(params=["handler", "condition"])
+def failing_in(request):
+    """Where routing the record at FAILING fails"""
+    return request.param
+
+
+@pytest.fixture
+def calls(failing_in):
+    """Registers a route, and returns the rows that its handler is called for"""
+    calls = []
+
+    def handler(record):
+        row = record.record["eventID"]
+        calls.append(row)
+        if row == FAILING and failing_in == "handler":
+            raise RuntimeError(row)
+
+    on_insert("$NEW.n > 0", 0)(handler)
+    return calls
+
+
+def batch(failing_in):
+    return [
+        # A string cannot be compared with 0, so the condition raises
+        record(row, key, dict(S="x") if failing_in == "condition" else dict(N="1"))
+        if str(row) == FAILING
+        else record(row, key, dict(N="1"))
+        for row, key in enumerate(KEYS)
+    ]
+
+
+def expected(router, failure_mode, failing_in):
+    calls, failures = EXPECTED[
+        ("parallel" if router == "parallel" else "sequential", failure_mode)
+    ]
+    if failing_in == "condition":
+        calls = [row for row in calls if row != FAILING]
+    return calls, dict(batchItemFailures=[dict(itemIdentifier=row) for row in failures])
+
+
+@pytest.mark.parametrize("router", list(ROUTERS))
+@pytest.mark.parametrize("failure_mode", list(FailureMode))
+def test_failure_mode(router, failure_mode, failing_in, calls):
+    response = ROUTERS[router](batch(failing_in), failure_mode=failure_mode)
+    assert (calls, response) == expected(router, failure_mode, failing_in)
+
+
+@pytest.mark.parametrize("router", list(ROUTERS))
+def test_without_failure_mode_the_exception_propagates(router, failing_in, calls):
+    with pytest.raises(RuntimeError if failing_in == "handler" else TypeError):
+        ROUTERS[router](batch(failing_in))
+    # Nothing is started after the exception, as with STOP
+    assert calls == expected(router, FailureMode.STOP, failing_in)[0]
@@ -0,0 +1,134 @@
+import json
+from io import StringIO
+
+import pytest
+
+from dynamodb_stream_router import (
+    FailureMode,
+    Operation,
+    get_routes,
+    on_insert,
+    on_insert_batch,
+    route_records,
+)
+from dynamodb_stream_router.metrics import (
+    EmbeddedMetricsFormat,
+    Histogram,
+    InMemoryMetrics,
+)
+
+
+def record(sequence_number, kind):
+    return dict(
+        eventID=str(sequence_number),
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=str(sequence_number))),
+            NewImage=dict(pk=dict(S=str(sequence_number)), kind=dict(S=kind)),
+            SequenceNumber=str(sequence_number),
+        ),
+    )
+
+
+def make_handler(fail):
+    def handler(record):
+        if fail:
+            raise RuntimeError(record)
+
+    return handler
+
+
+@pytest.fixture
+def keys():
+    """Registers two routes that share a handler name, and returns their keys"""
+    on_insert("$NEW.kind == 'order'", 0)(make_handler(False))
+    on_insert("$NEW.kind == 'invoice'", 0)(make_handler(True))
+    routes = {
+        route._condition.expression: route for route in get_routes(Operation.INSERT)
+    }
+    return (
+        routes["$NEW.kind == 'order'"].dedup_key,
+        routes["$NEW.kind == 'invoice'"].dedup_key,
+    )
+
+
+def test_histogram():
+    histogram = Histogram()
+    for value in (1, 2, 3, 100):
+        histogram.add(value)
+    assert histogram.to_dict() == dict(
+        count=4, total_ns=106, mean_ns=26, p50_ns=4, p99_ns=100, max_ns=100
+    )
+
+
+def test_in_memory_metrics_tell_routes_apart(keys):
+    order, invoice = keys
+    metrics = InMemoryMetrics()
+    records = [record(1, "order"), record(2, "invoice"), record(3, "order")]
+    route_records(
+        records, metrics=metrics, failure_mode=FailureMode.CONTINUE_OTHER_KEYS
+    )
+    snapshot = metrics.snapshot()
+    assert snapshot["batches"]["count"] == 1
+    assert snapshot["batches"]["records"] == 3
+    assert snapshot["records"]["by_operation"] == dict(INSERT=3)
+    assert snapshot["records"]["time"]["count"] == 3
+    routes = snapshot["routes"]
+    assert set(routes) == {order, invoice}
+    assert (routes[order]["matches"], routes[order]["failures"]) == (2, 0)
+    assert (routes[invoice]["matches"], routes[invoice]["failures"]) == (1, 1)
+    assert routes[order]["handler"]["count"] == 2
+    metrics.reset()
+    assert metrics.snapshot()["routes"] == dict()
+
+
+def test_in_memory_metrics_of_batch_routes():
+    on_insert_batch("$NEW.kind == 'order'", 0, max_size=2)(make_handler(False))
+    metrics = InMemoryMetrics()
+    route_records([record(number, "order") for number in range(5)], metrics=metrics)
+    ((key, route),) = metrics.snapshot()["routes"].items()
+    assert key == next(iter(get_routes(Operation.INSERT))).dedup_key
+    assert route["evaluations"] == route["matches"] == 5
+    assert route["handler"]["count"] == 3
+
+
+def emf_lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_embedded_metrics_format(keys):
+    order, invoice = keys
+    stream = StringIO()
+    metrics = EmbeddedMetricsFormat(namespace="Test", stream=stream)
+    records = [record(1, "order"), record(2, "invoice")]
+    route_records(records, metrics=metrics, failure_mode=FailureMode.STOP)
+    lines = emf_lines(stream)
+    assert [line.get("Route", line.get("Service")) for line in lines] == sorted(
+        [order, invoice]
+    ) + ["Test"]
+    for line in lines:
+        (directive,) = line["_aws"]["CloudWatchMetrics"]
+        assert directive["Namespace"] == "Test"
+        for metric in directive["Metrics"]:
+            assert metric["Name"] in line
+    by_route = {line["Route"]: line for line in lines[:2]}
+    assert by_route[order]["Matches"] == 1
+    assert by_route[order]["Failures"] == 0
+    assert by_route[invoice]["Failures"] == 1
+    assert len(by_route[order]["HandlerTime"]) == 1
+    assert lines[2]["Records"] == 2
+
+
+def test_embedded_metrics_format_writes_every_handler_time():
+    on_insert("$NEW.kind == 'order'", 0)(make_handler(False))
+    stream = StringIO()
+    metrics = EmbeddedMetricsFormat(stream=stream)
+    count = EmbeddedMetricsFormat.MAX_VALUES * 2 + 1
+    route_records([record(number, "order") for number in range(count)], metrics=metrics)
+    *routes, batch = emf_lines(stream)
+    assert [len(line["HandlerTime"]) for line in routes] == [100, 100, 1]
+    assert routes[0]["Evaluations"] == count
+    for line in routes[1:]:
+        assert set(line) == {"_aws", "Route", "HandlerTime"}
+        assert line["Route"] == routes[0]["Route"]
+    assert batch["Records"] == count
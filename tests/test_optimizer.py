@@ -0,0 +1,141 @@
+import pytest
+from corpus import EXPRESSIONS, RECORDS, outcome, raw_tree
+
+from dynamodb_stream_router.conditions.closures import build_condition
+from dynamodb_stream_router.conditions.compiler import compile_condition
+from dynamodb_stream_router.conditions.nodes import And, Const, Not, Or
+from dynamodb_stream_router.conditions.optimizer import operands, optimize
+from dynamodb_stream_router.record import RouteRecord
+
+
+def results(condition):
+    return [outcome(condition, RouteRecord(record)) for record in RECORDS]
+
+
+def same(expected, actual):
+    return [type(value) for value in expected] == [
+        type(value) for value in actual
+    ] and expected == actual
+
+
+@pytest.mark.parametrize("expression", EXPRESSIONS)
+def test_optimized_tree_agrees_with_raw_tree(expression):
+    tree = raw_tree(expression)
+    optimized = optimize(tree)
+    expected = results(build_condition(tree))
+    assert same(expected, results(build_condition(optimized)))
+    assert same(expected, results(compile_condition(optimized, expression)))
+
+
+@pytest.mark.parametrize(
+    "expression, folded",
+    [
+        ("1 == 1 & $NEW.a == 1", "$NEW.a == 1"),
+        ("$NEW.a == 1 & 1 == 1", "$NEW.a == 1"),
+        ("1 == 2 | $NEW.a == 1", "$NEW.a == 1"),
+        ("'x' IN ('x', 'y') & $NEW.a == 1", "$NEW.a == 1"),
+        ("1 < 2 | $NEW.a == 1", Const(True)),
+        ("2 BETWEEN 1 & 3", Const(True)),
+        ("'ORDER#1' =~ '^ORDER'", Const(True)),
+        ("NOT 1 == 1", Const(False)),
+    ],
+)
+def test_constants_are_folded(expression, folded):
+    if isinstance(folded, str):
+        folded = raw_tree(folded)
+    assert optimize(raw_tree(expression)) == folded
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "1 < 'a' | $NEW.a == 1",
+        "'a' BETWEEN 1 & 3",
+    ],
+)
+def test_constants_that_raise_are_not_folded(expression):
+    tree = raw_tree(expression)
+    assert optimize(tree) == tree
+
+
+def test_constant_operands_are_kept_after_values_that_are_not_bools():
+    # from_json returns its value, which a constant operand would turn into a bool
+    for expression, kind, value in (
+        ("from_json($NEW.payload) & 1 == 1", And, True),
+        ("from_json($NEW.payload) | 1 == 2", Or, False),
+    ):
+        assert optimize(raw_tree(expression)) == kind(
+            raw_tree("from_json($NEW.payload)"), Const(value)
+        )
+
+
+def test_not_not_is_dropped_around_bools():
+    assert optimize(raw_tree("NOT NOT $NEW.entity_type == 'order'")) == raw_tree(
+        "$NEW.entity_type == 'order'"
+    )
+    assert optimize(raw_tree("NOT NOT NOT $NEW.entity_type == 'order'")) == Not(
+        raw_tree("$NEW.entity_type == 'order'")
+    )
+    for expression in ("NOT NOT $NEW.a", "NOT NOT from_json($NEW.payload)"):
+        tree = raw_tree(expression)
+        assert optimize(tree) == tree
+
+
+def test_in_looks_constants_up_in_a_set():
+    expression = "$NEW.order IN ('order', 1)"
+    condition = compile_condition(optimize(raw_tree(expression)), expression)
+    assert frozenset({"order", 1}) in condition.__globals__.values()
+    # Maps, lists and sets cannot be hashed, and are compared instead
+    for value in (dict(M=dict()), dict(L=[]), dict(SS=["a"]), dict(S="order")):
+        record = dict(
+            eventName="INSERT",
+            dynamodb=dict(Keys=dict(), NewImage=dict(order=value)),
+        )
+        assert condition(RouteRecord(record)) == (value == dict(S="order"))
+
+
+@pytest.mark.parametrize(
+    "expression, order",
+    [
+        (
+            "has_changed('status') & $NEW.entity_type == 'order'",
+            ["$NEW.entity_type == 'order'", "has_changed('status')"],
+        ),
+        # An operand that may raise splits the runs that are reordered
+        (
+            "has_changed('status') & $NEW.pk > 1 & has_changed('order') & $NEW.a == 1",
+            [
+                "has_changed('status')",
+                "$NEW.pk > 1",
+                "$NEW.a == 1",
+                "has_changed('order')",
+            ],
+        ),
+        (
+            "$NEW.order.total > 100 & has_changed('status') & $NEW.entity_type == 'order'",
+            [
+                "$NEW.order.total > 100",
+                "$NEW.entity_type == 'order'",
+                "has_changed('status')",
+            ],
+        ),
+        (
+            "$NEW.entity_type == 'customer' & $NEW.pk > 1",
+            ["$NEW.entity_type == 'customer'", "$NEW.pk > 1"],
+        ),
+        (
+            "$NEW.pk > 1 & $NEW.entity_type == 'order'",
+            ["$NEW.pk > 1", "$NEW.entity_type == 'order'"],
+        ),
+        (
+            "$NEW.pk =~ '[' | has_changed('status') | $NEW.a == 1",
+            ["$NEW.pk =~ '['", "$NEW.a == 1", "has_changed('status')"],
+        ),
+    ],
+)
+def test_operands_are_reordered_between_operands_that_may_raise(expression, order):
+    optimized = optimize(raw_tree(expression))
+    kind = Or if isinstance(optimized, Or) else And
+    assert operands(optimized, kind) == [
+        optimize(raw_tree(operand)) for operand in order
+    ]
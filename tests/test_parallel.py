@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from corpus import EXPRESSIONS, batch, raises
+
+from dynamodb_stream_router import FailureMode, Operation, on_operations, route_records
+
+RECORDS = batch(200, 12)
+
+
+def key(row):
+    return RECORDS[int(row)]["dynamodb"]["Keys"]["pk"]["S"]
+
+
+@pytest.fixture
+def calls():
+    """
+    Routes every expression that never raises, and one that does, and
+    returns the calls of their handlers
+    """
+    calls = []
+    expressions = [expression for expression in EXPRESSIONS if not raises(expression)]
+    for index, expression in enumerate([*expressions, "$NEW.order.total > 100"]):
+
+        def handler(record, expression=expression):
+            calls.append((record.record["eventID"], expression))
+
+        on_operations({Operation.INSERT, Operation.MODIFY}, expression, index % 3)(
+            handler
+        )
+    return calls
+
+
+def by_key(calls):
+    keys = dict()
+    for row, expression in calls:
+        keys.setdefault(key(row), list()).append((row, expression))
+    return keys
+
+
+def route_parallel(records, **kwargs):
+    with ThreadPoolExecutor(4) as executor:
+        return route_records(records, executor=executor, parallel=True, **kwargs)
+
+
+def reported(response):
+    return {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+
+
+@pytest.mark.parametrize("max_in_flight", [None, 3])
+def test_parallel_routing_matches_sequential(calls, max_in_flight):
+    failure_mode = FailureMode.CONTINUE_OTHER_KEYS
+    expected = route_records(RECORDS, failure_mode=failure_mode)
+    sequential = list(calls)
+    calls.clear()
+    response = route_parallel(
+        RECORDS, max_in_flight=max_in_flight, failure_mode=failure_mode
+    )
+    # Each item is routed in order, and as if it were routed alone
+    assert by_key(calls) == by_key(sequential)
+    assert response == expected
+
+
+@pytest.mark.parametrize("max_in_flight", [None, 3])
+def test_parallel_routing_stops(calls, max_in_flight):
+    route_records(RECORDS, failure_mode=FailureMode.CONTINUE_OTHER_KEYS)
+    sequential = by_key(calls)
+    calls.clear()
+    response = route_parallel(
+        RECORDS, max_in_flight=max_in_flight, failure_mode=FailureMode.STOP
+    )
+    # Items are routed in order until routing stops, and every record that
+    # was not routed, one that failed at least, is reported
+    for item, item_calls in by_key(calls).items():
+        assert item_calls == sequential[item][: len(item_calls)]
+    routed = {row for row, _ in calls}
+    for record in RECORDS:
+        row = record["eventID"]
+        assert row in reported(response) or row in routed
+    # Only the records made from RECORDS[0] never fail
+    assert any(int(row) % 4 for row in reported(response))
+
+
+def test_parallel_routing_without_failures_matches_sequential(calls):
+    # The records made from RECORDS[0], which no condition raises for
+    records = RECORDS[::4]
+    assert route_records(records) is None
+    sequential = list(calls)
+    calls.clear()
+    assert route_parallel(records) is None
+    assert by_key(calls) == by_key(sequential)
+    assert sorted(calls) == sorted(sequential)
@@ -0,0 +1,115 @@
+import pytest
+from corpus import RECORDS, batch
+
+from dynamodb_stream_router import (
+    FailureMode,
+    Operation,
+    on_operations,
+    route_record,
+    route_records,
+)
+from dynamodb_stream_router.record import RouteRecord
+
+IMAGES = ("keys", "new_image", "old_image")
+
+PATHS = [
+    ("pk",),
+    ("tags",),
+    ("order",),
+    ("order", "total"),
+    ("order", "lines"),
+    ("order", "lines", 0),
+    ("order", "lines", 0, "sku"),
+    ("order", "lines", 5),
+    ("order", "customer", "address", "zip"),
+    ("missing",),
+    ("missing", "deeper"),
+]
+
+
+def reads(route_record, order):
+    """What route_record returns for every path and image, read in order"""
+    values = dict()
+    for kind in order:
+        if kind == "paths":
+            for name in IMAGES[1:]:
+                for path in PATHS:
+                    values[name, path] = route_record._path(name, path)
+        else:
+            for name in IMAGES:
+                values[name] = route_record._image(name)
+    return values
+
+
+@pytest.mark.parametrize("order", [("paths", "images"), ("images", "paths")])
+@pytest.mark.parametrize("index", range(len(RECORDS)))
+def test_compact_records_read_as_plain_ones(index, order):
+    names = dict()
+    # Another record fills names first, so that this one shares them
+    reads(RouteRecord(RECORDS[(index + 1) % len(RECORDS)], names=names), order)
+    compact = reads(RouteRecord(RECORDS[index], names=names), order)
+    assert compact == reads(RouteRecord(RECORDS[index]), order)
+    for name in IMAGES[1:]:
+        for attribute in compact[name] or ():
+            assert attribute is names[attribute]
+
+
+def test_paths_are_the_values_within_an_image_once_it_is_read():
+    route_record = RouteRecord(RECORDS[0])
+    before = {path: route_record._path("new_image", path) for path in PATHS}
+    image = route_record._image("new_image")
+    for path in PATHS:
+        value = route_record._path("new_image", path)
+        assert value == before[path]
+        within = image
+        for step in path:
+            try:
+                within = within[step]
+            except (IndexError, KeyError):
+                within = None
+                break
+        assert value is within
+
+
+def test_keys_are_taken_from_an_image():
+    route_record = RouteRecord(RECORDS[0])
+    image = route_record._image("new_image")
+    assert route_record._image("keys") == RouteRecord(RECORDS[0])._image("keys")
+    assert route_record._image("keys")["pk"] is image["pk"]
+    # Keys that are not all in the image are deserialized from Keys
+    record = dict(RECORDS[1], dynamodb=dict(RECORDS[1]["dynamodb"]))
+    record["dynamodb"]["Keys"] = dict(pk=dict(S="CUSTOMER#1"), sk=dict(S="a"))
+    route_record = RouteRecord(record)
+    route_record._image("new_image")
+    assert route_record._image("keys") == dict(pk="CUSTOMER#1", sk="a")
+
+
+@pytest.mark.parametrize("immutable", [False, True])
+def test_batches_give_handlers_what_single_records_do(immutable):
+    records = batch(40, 40)
+    calls = []
+
+    def handler(record):
+        calls.append((record.keys, record.new_image, record.old_image))
+
+    # The condition reads paths before the handler reads whole images
+    on_operations(
+        {Operation.INSERT, Operation.MODIFY},
+        "$NEW.order.total > 100 | $OLD.order.status == 'NEW' | attribute_exists($NEW.a)",
+        0,
+    )(handler)
+    on_operations({Operation.INSERT, Operation.MODIFY}, "$NEW.pk == $OLD.pk", 1)(
+        handler
+    )
+    route_records(
+        records, immutable=immutable, failure_mode=FailureMode.CONTINUE_OTHER_KEYS
+    )
+    routed = list(calls)
+    calls.clear()
+    for record in records:
+        try:
+            route_record(record, immutable=immutable)
+        except Exception:
+            pass
+    assert routed == calls
+    assert routed
@@ -0,0 +1,120 @@
+import json
+import sys
+
+from dynamodb_stream_router import (
+    BatchRoute,
+    Operation,
+    get_routes,
+    on_insert,
+    on_insert_batch,
+    route_records,
+)
+from dynamodb_stream_router.replay import batches, main, stub_handlers, values
+
+
+def record(sequence_number):
+    return dict(
+        eventID=str(sequence_number),
+        eventName="INSERT",
+        dynamodb=dict(
+            Keys=dict(pk=dict(S=str(sequence_number))),
+            NewImage=dict(pk=dict(S=str(sequence_number))),
+            SequenceNumber=str(sequence_number),
+        ),
+    )
+
+
+def event(*sequence_numbers):
+    return dict(Records=[record(number) for number in sequence_numbers])
+
+
+def lines(text):
+    return text.splitlines(keepends=True)
+
+
+def test_values_of_an_indented_event():
+    text = json.dumps(event(1, 2), indent=2)
+    assert list(values(lines(text))) == [event(1, 2)]
+
+
+def test_values_of_json_lines():
+    text = "\n".join(json.dumps(event(number)) for number in (1, 2)) + "\n\n"
+    assert list(values(lines(text))) == [event(1), event(2)]
+
+
+def test_batches_of_an_event():
+    text = json.dumps(event(1, 2, 3), indent=2)
+    assert list(batches(lines(text), batch_size=2)) == [event(1, 2, 3)["Records"]]
+
+
+def test_batches_of_json_lines_of_events():
+    text = "\n".join(json.dumps(event(*numbers)) for numbers in ((1, 2), (3,)))
+    assert list(batches(lines(text), batch_size=1)) == [
+        event(1, 2)["Records"],
+        event(3)["Records"],
+    ]
+
+
+def test_batches_of_json_lines_of_records():
+    text = "\n".join(json.dumps(record(number)) for number in range(5))
+    assert list(batches(lines(text), batch_size=2)) == [
+        [record(0), record(1)],
+        [record(2), record(3)],
+        [record(4)],
+    ]
+
+
+def test_records_before_an_event_are_a_batch_of_their_own():
+    text = "\n".join(
+        json.dumps(value) for value in (record(1), record(2), event(3), record(4))
+    )
+    assert list(batches(lines(text))) == [
+        [record(1), record(2)],
+        event(3)["Records"],
+        [record(4)],
+    ]
+
+
+def test_stub_handlers():
+    calls = []
+
+    @on_insert("$NEW.pk == '1'", 0, coalesce=True)
+    def handler(record):
+        calls.append(record)
+
+    @on_insert_batch("$NEW.pk == '1'", 1, max_size=5)
+    def batch_handler(records):
+        calls.append(records)
+
+    routes = get_routes(Operation.INSERT)
+    assert stub_handlers() == 2
+    stubs = get_routes(Operation.INSERT)
+    assert stubs.isdisjoint(routes)
+    assert {(route.name, route.dedup_key, route.coalesce) for route in stubs} == {
+        (route.name, route.dedup_key, route.coalesce) for route in routes
+    }
+    (stub,) = (route for route in stubs if isinstance(route, BatchRoute))
+    assert stub.max_size == 5
+    route_records([record(1)])
+    assert calls == []
+
+
+def test_main_imports_modules_from_the_current_directory(capsys, monkeypatch, tmp_path):
+    (tmp_path / "replayed_routes.py").write_text(
+        "from dynamodb_stream_router import on_insert\n"
+        "on_insert(\"$NEW.pk == '1'\", 0)(print)\n"
+    )
+    (tmp_path / "events.jsonl").write_text(json.dumps(event(1, 2)))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        sys, "argv", ["replay", "events.jsonl", "replayed_routes", "--stub", "--json"]
+    )
+    path = list(sys.path)
+    try:
+        main()
+    finally:
+        sys.modules.pop("replayed_routes", None)
+    assert sys.path == path
+    figures = json.loads(capsys.readouterr().out)
+    assert figures["records"] == 2
+    assert figures["failed"] == 0
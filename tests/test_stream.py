@@ -0,0 +1,25 @@
+import json
+from io import BytesIO
+
+from dynamodb_stream_router.stream import iter_records
+
+RECORDS = [
+    dict(
+        eventID=str(index),
+        eventName="INSERT",
+        dynamodb=dict(NewImage=dict(name=dict(S=f"Zoë {index} – ☃ 𝄞"))),
+    )
+    for index in range(3)
+]
+
+
+class ByteAtATime(BytesIO):
+    """A binary stream that returns at most one byte per read"""
+
+    def read(self, size: int = -1) -> bytes:
+        return super().read(1)
+
+
+def test_reads_ending_inside_a_character():
+    event = json.dumps(dict(Records=RECORDS), ensure_ascii=False).encode()
+    assert list(iter_records(ByteAtATime(event))) == RECORDS